@@ -0,0 +1,184 @@
+"""Micro-benchmarks for the DeepSeek app's indexing paths.
+
+Run from the app directory with `python -m chat.benchmarks [name ...]`. The
+index benchmarks use random vectors from MockEmbedding, so the numbers
+isolate index bookkeeping from model cost; the embedding benchmark loads the
+real model.
+"""
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+
+from chat import store
+from chat.embeddings import EmbeddingService, SharedEmbedding, _load_model, _rss_bytes, embedding_service
+from chat.ingest import start_ingest
+from chat.library import new_index
+from chat.pages import iter_pages
+
+SAMPLE_PDF = Path(__file__).resolve().parent.parent / "uploaded_files" / "Attention is all you need.pdf"
+
+EMBED_DIM = 1024
+NODES_PER_DOC = 40
+BATCH_SIZE = 32
+
+
+def _document_nodes(doc_id: str, embed_model: MockEmbedding):
+    nodes = []
+    for i in range(NODES_PER_DOC):
+        node = TextNode(text=f"{doc_id} chunk {i}", metadata={"doc_id": doc_id})
+        node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=doc_id)
+        node.embedding = embed_model.get_text_embedding(node.text)
+        nodes.append(node)
+    return nodes
+
+
+def _insert(index: VectorStoreIndex, nodes):
+    # Same batching as the ingestion pipeline.
+    for start in range(0, len(nodes), BATCH_SIZE):
+        index.insert_nodes(nodes[start:start + BATCH_SIZE])
+
+
+def bench_incremental_insert(corpus_sizes=(0, 100, 400, 1600)):
+    """Time to add and delete one document as the corpus grows."""
+    embed_model = MockEmbedding(embed_dim=EMBED_DIM)
+    Settings.embed_model = embed_model
+    print(f"{'corpus docs':>11} {'default insert':>15} {'incremental insert':>19} "
+          f"{'delete':>9} {'rebuild embeds':>15}")
+    for size in corpus_sizes:
+        default_index = VectorStoreIndex(nodes=[])
+        incremental_index = new_index()
+        corpus = [
+            node for n in range(size) for node in _document_nodes(f"doc-{n}", embed_model)
+        ]
+        default_index.insert_nodes(corpus)
+        incremental_index.insert_nodes(corpus)
+
+        new_nodes = _document_nodes("new-doc", embed_model)
+        start = time.perf_counter()
+        _insert(default_index, [node.model_copy() for node in new_nodes])
+        default_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        _insert(incremental_index, new_nodes)
+        incremental_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        incremental_index.delete_ref_doc("new-doc", delete_from_docstore=True)
+        delete_ms = (time.perf_counter() - start) * 1000
+
+        # Rebuilding from the upload directory would re-embed every chunk.
+        rebuild_embeds = (size + 1) * NODES_PER_DOC
+        print(f"{size:>11} {default_ms:>12.1f} ms {incremental_ms:>16.1f} ms "
+              f"{delete_ms:>6.1f} ms {rebuild_embeds:>15}")
+
+
+def bench_embedding_service(sessions=(1, 4, 16), chunks_per_session=64):
+    """Embeddings/sec with sessions calling the model directly vs through the service."""
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    model = _load_model()
+    load_seconds = time.perf_counter() - start
+    print(f"model load {load_seconds:.1f} s, "
+          f"+{(_rss_bytes() - rss_before) / (1024 * 1024):.0f} MB RSS per copy")
+
+    service = EmbeddingService(factory=lambda: model)
+    service.embed(["warm up"])
+    chunk = "Attention lets every position look at every other position. " * 12
+
+    def run(embed, count):
+        def session():
+            # Small batches, the way queries and page-sized ingest flushes arrive.
+            for _ in range(chunks_per_session // 4):
+                embed([chunk] * 4)
+
+        threads = [threading.Thread(target=session) for _ in range(count)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return count * chunks_per_session / (time.perf_counter() - start)
+
+    print(f"{'sessions':>8} {'direct emb/s':>13} {'service emb/s':>14}")
+    for count in sessions:
+        direct = run(model.get_text_embedding_batch, count)
+        shared = run(service.embed, count)
+        print(f"{count:>8} {direct:>13.0f} {shared:>14.0f}")
+
+
+def bench_cold_start(path: Path = SAMPLE_PDF):
+    """Re-embedding a PDF vs reloading its persisted store into a fresh index."""
+    Settings.embed_model = SharedEmbedding()
+    embedding_service.embed(["warm up"])
+    doc_id = hashlib.sha256(path.read_bytes()).hexdigest()
+    data_dir = Path(tempfile.mkdtemp())
+    store.DATA_DIR = data_dir
+    try:
+        start = time.perf_counter()
+        job = start_ingest(new_index(), str(path), path.name, doc_id)
+        job.future.result()
+        rebuild = time.perf_counter() - start
+
+        start = time.perf_counter()
+        job = start_ingest(new_index(), str(path), path.name, doc_id)
+        job.future.result()
+        cold = time.perf_counter() - start
+        assert job.restored
+
+        size = sum(f.stat().st_size for f in data_dir.rglob("*") if f.is_file())
+        print(f"{path.name}: {job.pages_total} pages, {job.chunks_stored} chunks, "
+              f"{size / 1024:.0f} KB on disk")
+        print(f"rebuild (parse + embed + insert) {rebuild:.2f} s")
+        print(f"cold start (load + insert)       {cold:.2f} s  ({rebuild / cold:.0f}x faster)")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def bench_parse(copies=20, worker_counts=None):
+    """Pages/sec parsing a long PDF serially vs on 1, 4 and N worker processes."""
+    from pypdf import PdfReader, PdfWriter
+
+    worker_counts = worker_counts or sorted({1, 4, os.cpu_count() or 1})
+    writer = PdfWriter()
+    for _ in range(copies):
+        writer.append(str(SAMPLE_PDF))
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        writer.write(f)
+    try:
+        start = time.perf_counter()
+        reader = PdfReader(path)
+        pages = sum(1 for page in reader.pages if page.extract_text() is not None)
+        serial = pages / (time.perf_counter() - start)
+        print(f"{pages} pages, serial in-thread {serial:.0f} pages/s")
+        print(f"{'workers':>7} {'pages/s':>8} {'speedup':>8}")
+        for workers in worker_counts:
+            # The first pass starts the pool's processes; time the second.
+            for _ in range(2):
+                start = time.perf_counter()
+                count = sum(1 for _ in iter_pages(path, workers=workers))
+                rate = count / (time.perf_counter() - start)
+            print(f"{workers:>7} {rate:>8.0f} {rate / serial:>7.1f}x")
+    finally:
+        os.unlink(path)
+
+
+BENCHMARKS = {
+    "insert": bench_incremental_insert,
+    "embeddings": bench_embedding_service,
+    "cold-start": bench_cold_start,
+    "parse": bench_parse,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or ["insert"]:
+        BENCHMARKS[name]()
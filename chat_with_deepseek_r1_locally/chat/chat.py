@@ -1,5 +1,8 @@
 import reflex as rx
 from chat.components.chat import State, chat, action_bar, sidebar
+from chat import files, uploads
+from chat.embeddings import embedding_service
+from chat.library import library
 
 def index() -> rx.Component:
     """The main app."""
@@ -32,4 +35,8 @@ def index() -> rx.Component:
 
 
 app = rx.App()
-app.add_page(index)
\ No newline at end of file
+app.add_page(index)
+files.register(app)
+uploads.register(app, place=library.place_upload)
+# Load the shared embedding model while the server starts, not on first upload.
+app.register_lifespan_task(embedding_service.warm)
\ No newline at end of file
@@ -1,16 +1,21 @@
 import reflex as rx
-from typing import List
+from typing import Any, Dict, List
 from dataclasses import dataclass
-import tempfile
-import base64
 from pathlib import Path
 import asyncio
 import os
 
-from llama_index.core import VectorStoreIndex, Settings, SimpleDirectoryReader
+from llama_index.core import Settings
 from llama_index.llms.ollama import Ollama
 from llama_index.core import PromptTemplate
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+from chat.embeddings import SharedEmbedding, embedding_service
+from chat.files import file_url
+from chat.ingest import forget_job
+from chat.library import library
+from chat.scheduler import scheduler
+from chat.streaming import StreamStats, stream_answer, stream_in_thread
+from chat.uploads import UploadFailed, received_upload, send_upload
 
 # Styles remain the same
 message_style = dict(
@@ -62,69 +67,71 @@ class LoadingIcon(rx.Component):
 
 loading_icon = LoadingIcon.create
 
+QA_PROMPT = PromptTemplate(
+    "Context information is below.\n"
+    "---------------------\n"
+    "{context_str}\n"
+    "---------------------\n"
+    "Given the context information above I want you to think step by step to answer the query in a crisp manner, incase case you don't know the answer say 'I don't know!'.\n"
+    "Query: {query_str}\n"
+    "Answer: "
+)
+
 class State(rx.State):
     """The app state."""
     chats: List[List[QA]] = [[]]
-    base64_pdf: str = ""
+    pdf_url: str = ""
     uploading: bool = False
     current_chat: int = 0
     processing: bool = False
-    db_path: str = tempfile.mkdtemp()
     pdf_filename: str = ""
     knowledge_base_files: List[str] = []
+    knowledge_base_ids: List[str] = []
     upload_status: str = ""
+    ingest_doc_id: str = ""
+    ingest_progress: int = 0
+    embedder_status: str = ""
+    first_token_ms: int = 0
+    queue_position: int = 0
+    tokens_per_second: float = 0.0
 
+    _models_ready: bool = False
     _query_engine = None
-    _temp_dir = None
 
     def setup_llamaindex(self):
-        """Setup LlamaIndex with models and prompt template."""
-        if self._query_engine is None and self._temp_dir:
+        """Setup LlamaIndex with the LLM and embedding models."""
+        if not self._models_ready:
             # Setup LLM
             llm = Ollama(model="deepseek-r1:1.5b", request_timeout=120.0)
             
-            # Setup embedding model
-            embed_model = HuggingFaceEmbedding(
-                model_name="BAAI/bge-large-en-v1.5",
-                trust_remote_code=True
-            )
+            # The embedding model is loaded once per process and shared by
+            # every session; this only points LlamaIndex at it.
+            embed_model = SharedEmbedding()
             
             # Configure settings
             Settings.embed_model = embed_model
             Settings.llm = llm
+            self._models_ready = True
 
-            # Load documents
-            loader = SimpleDirectoryReader(
-                input_dir=self._temp_dir,
-                required_exts=[".pdf"],
-                recursive=True
-            )
-            docs = loader.load_data()
-
-            # Create index and query engine
-            index = VectorStoreIndex.from_documents(docs, show_progress=True)
-            
-            # Setup streaming query engine with custom prompt
-            qa_prompt_tmpl_str = (
-                "Context information is below.\n"
-                "---------------------\n"
-                "{context_str}\n"
-                "---------------------\n"
-                "Given the context information above I want you to think step by step to answer the query in a crisp manner, incase case you don't know the answer say 'I don't know!'.\n"
-                "Query: {query_str}\n"
-                "Answer: "
+    def get_query_engine(self):
+        """Streaming query engine over this session's documents."""
+        if self._query_engine is None:
+            self._query_engine = library.query_engine(
+                self.knowledge_base_ids, streaming=True
             )
-            qa_prompt_tmpl = PromptTemplate(qa_prompt_tmpl_str)
-            
-            self._query_engine = index.as_query_engine(streaming=True)
             self._query_engine.update_prompts(
-                {"response_synthesizer:text_qa_template": qa_prompt_tmpl}
+                {"response_synthesizer:text_qa_template": QA_PROMPT}
             )
+        return self._query_engine
+
+    def _session(self) -> str:
+        """Token identifying this browser session to the shared library."""
+        return self.router.session.client_token
 
     @rx.event(background=True)
     async def process_question(self, form_data: dict):
         """Process a question and update the chat."""
-        if self.processing or not form_data.get("question") or not self._query_engine:
+        if self.processing or not form_data.get("question") or not self.knowledge_base_ids:
             return
 
         question = form_data["question"]
@@ -132,60 +139,164 @@ class State(rx.State):
         async with self:
             self.processing = True
             self.chats[self.current_chat].append(QA(question=question, answer=""))
-            yield
-            await asyncio.sleep(0.1)
+            chat_index = self.current_chat
+            self.setup_llamaindex()
+            # After a restart the documents are reloaded from disk on first use.
+            reloading, missing = library.ensure(
+                zip(self.knowledge_base_ids, self.knowledge_base_files), self._session()
+            )
+            if missing:
+                gone = []
+                for doc_id in missing:
+                    position = self.knowledge_base_ids.index(doc_id)
+                    self.knowledge_base_ids.pop(position)
+                    gone.append(self.knowledge_base_files.pop(position))
+                self._query_engine = None
+                self.upload_status = f"No longer available, please upload again: {', '.join(gone)}"
+            if not self.knowledge_base_ids:
+                self.chats[chat_index][-1].answer = (
+                    "Your documents are no longer available; please upload them again."
+                )
+                self.chats = self.chats
+                self.processing = False
+                return
+            query_engine = self.get_query_engine()
+        if reloading:
+            await asyncio.wait([asyncio.wrap_future(job.future) for job in reloading])
+            for job in reloading:
+                forget_job(job.id)
 
-        # Get streaming response from LlamaIndex
-        streaming_response = self._query_engine.query(question)
+        # Retrieval and generation run on a worker thread; the state lock is
+        # only taken briefly to publish each coalesced delta.
+        stats = StreamStats()
         answer = ""
-
-        # Process the streaming response
-        async with self:
-            for chunk in streaming_response.response_gen:
-                answer += chunk
-                self.chats[self.current_chat][-1].answer = answer
+        # Wait our turn for Ollama; sessions are served round-robin.
+        ticket = scheduler.submit(self._session())
+        try:
+            while not await ticket.wait(timeout=0.5):
+                async with self:
+                    self.queue_position = ticket.position
+            async with self:
+                self.queue_position = 0
+            async for delta in stream_in_thread(stream_answer, query_engine, question, stats=stats):
+                answer += delta
+                async with self:
+                    self.chats[chat_index][-1].answer = answer
+                    self.chats = self.chats
+                    self.first_token_ms = stats.ttft_ms
+        except asyncio.CancelledError:
+            if not ticket.cancelled:
+                raise
+            answer += "\n\n_Stopped._"
+        except Exception as e:
+            answer += f"\n\nError: {e}"
+        finally:
+            ticket.release()
+            async with self:
+                self.chats[chat_index][-1].answer = answer
                 self.chats = self.chats
-                yield
-                await asyncio.sleep(0.05)
+                self.tokens_per_second = round(stats.tokens_per_second, 1)
+                self.queue_position = 0
+                self.processing = False
 
-            self.processing = False
-            yield
+    def stop_generation(self):
+        """Cancel this session's queued or in-flight answer and free its slot."""
+        scheduler.cancel(self._session())
 
-    async def handle_upload(self, files: List[rx.UploadFile]):
-        """Handle file upload and processing."""
-        if not files:
-            self.upload_status = "No file uploaded!"
+    def handle_upload(self, response: Dict[str, Any]):
+        """Attach a PDF the browser has streamed to disk to this session's knowledge base."""
+        try:
+            upload = received_upload(response)
+        except UploadFailed as e:
+            self.upload_status = str(e)
+            self.uploading = False
             return
-            yield
+        self.pdf_filename = Path(str(response.get("filename") or upload.path.name)).name
+        # Stored as <sha256>.pdf so identical uploads share one file and index.
+        # The name was chosen by the server; the response came via the browser.
+        doc_id = upload.path.stem
 
-        self.uploading = True
-        yield
+        # The preview is served from disk; state only carries its URL
+        self.pdf_url = file_url(upload.path.name)
 
-        file = files[0]
-        upload_data = await file.read()
-        
-        # Create temporary directory if not exists
-        if self._temp_dir is None:
-            self._temp_dir = tempfile.mkdtemp()
-            
-        outfile = Path(self._temp_dir) / file.filename
-        self.pdf_filename = file.filename
-
-        with outfile.open("wb") as file_object:
-            file_object.write(upload_data)
-
-        # Base64 encode the PDF content
-        base64_pdf = base64.b64encode(upload_data).decode('utf-8')
-        self.base64_pdf = base64_pdf
+        if doc_id in self.knowledge_base_ids:
+            self.upload_status = f"{self.pdf_filename} is already in the knowledge base"
+            self.uploading = False
+            return
 
         # Setup LlamaIndex
         self.setup_llamaindex()
-        
-        self.knowledge_base_files.append(self.pdf_filename)
-        self.upload_status = f"Added {self.pdf_filename} to knowledge base"
 
-        self.uploading = False
-        yield
+        doc = library.acquire(doc_id, self.pdf_filename, str(upload.path), self._session())
+        if doc.status == "done":
+            # Someone already indexed these exact bytes: attach without embedding
+            self._attach(doc_id, self.pdf_filename)
+            self.upload_status = f"Added {self.pdf_filename} to knowledge base (already indexed)"
+            self.uploading = False
+            return
+
+        self.upload_status = f"Saved {self.pdf_filename} ({upload.describe()})"
+        yield State.ingest_pdf(doc_id, self.pdf_filename)
+
+    def _attach(self, doc_id: str, filename: str):
+        self.knowledge_base_ids.append(doc_id)
+        self.knowledge_base_files.append(filename)
+        self._query_engine = None
+
+    @rx.event(background=True)
+    async def ingest_pdf(self, doc_id: str, filename: str):
+        """Wait for a PDF to be indexed off the event loop, streaming progress."""
+        doc = library.get(doc_id)
+        if doc is None:
+            async with self:
+                self.uploading = False
+            return
+        job = doc.job
+        async with self:
+            self.ingest_doc_id = doc_id
+            self.upload_status = job.describe()
+
+        future = asyncio.wrap_future(job.future)
+        while not future.done():
+            await asyncio.wait({future}, timeout=0.5)
+            async with self:
+                if self.ingest_doc_id != doc_id:
+                    # Cancelled from this session; the job may live on for others.
+                    break
+                self.upload_status = job.describe()
+                self.ingest_progress = job.percent
+
+        async with self:
+            if self.ingest_doc_id != doc_id:
+                self.upload_status = f"Cancelled {filename}"
+            elif job.status == "done":
+                self._attach(doc_id, filename)
+                self.upload_status = job.describe()
+            else:
+                library.release(doc_id, self._session())
+                self.upload_status = job.describe()
+            self.embedder_status = embedding_service.stats().describe()
+            self.ingest_progress = 0
+            self.ingest_doc_id = ""
+            self.uploading = False
+        forget_job(job.id)
+
+    def cancel_ingest(self):
+        """Stop waiting for the PDF being ingested and let go of it."""
+        if self.ingest_doc_id:
+            library.release(self.ingest_doc_id, self._session())
+            self.ingest_doc_id = ""
+            self.upload_status = "Cancelling..."
+
+    def remove_file(self, filename: str):
+        """Detach a PDF from this session's knowledge base."""
+        if filename not in self.knowledge_base_files:
+            return
+        position = self.knowledge_base_files.index(filename)
+        doc_id = self.knowledge_base_ids.pop(position)
+        self.knowledge_base_files.pop(position)
+        self._query_engine = None
+        library.release(doc_id, self._session())
 
     def create_new_chat(self):
         """Create a new chat."""
@@ -197,16 +308,12 @@ def pdf_preview() -> rx.Component:
     return rx.box(
         rx.heading("PDF Preview", size="4", margin_bottom="1em"),
         rx.cond(
-            State.base64_pdf != "",
-            rx.html(
-                f'''
-                <iframe 
-                    src="data:application/pdf;base64,{State.base64_pdf}"
-                    width="100%" 
-                    height="600px"
-                    style="border: none; border-radius: 8px;">
-                </iframe>
-                '''
+            State.pdf_url != "",
+            rx.el.iframe(
+                src=State.pdf_url,
+                width="100%",
+                height="600px",
+                style={"border": "none", "border_radius": "8px"},
             ),
             rx.text("No PDF uploaded yet", color="red"),
         ),
@@ -286,6 +393,16 @@ def action_bar() -> rx.Component:
                         color="white",
                         _hover={"bg": rx.color("accent", 10)},
                     ),
+                    rx.cond(
+                        State.processing,
+                        rx.button(
+                            "Stop",
+                            type_="button",
+                            on_click=State.stop_generation,
+                            variant="outline",
+                            cursor="pointer",
+                        ),
+                    ),
                     align_items="center",
                     spacing="3",
                 ),
@@ -293,6 +410,23 @@ def action_bar() -> rx.Component:
                 width="100%",
                 reset_on_submit=True,
             ),
+            rx.cond(
+                State.queue_position > 0,
+                rx.text(
+                    "Waiting for the model: number ", State.queue_position, " in the queue",
+                    font_size="xs",
+                    color=rx.color("mauve", 10),
+                ),
+            ),
+            rx.cond(
+                State.first_token_ms > 0,
+                rx.text(
+                    "First token in ", State.first_token_ms, " ms, ",
+                    State.tokens_per_second, " tokens/s",
+                    font_size="xs",
+                    color=rx.color("mauve", 10),
+                ),
+            ),
             align_items="center",
             width="100%",
         ),
@@ -333,18 +467,38 @@ def sidebar() -> rx.Component:
             ),
             rx.button(
                 "Add to Knowledge Base",
-                on_click=State.handle_upload(rx.upload_files()),
+                on_click=[State.set_uploading(True), send_upload(State.handle_upload)],
                 loading=State.uploading,
                 **UPLOAD_BUTTON_STYLE,
             ),
+            rx.cond(
+                State.ingest_doc_id != "",
+                rx.vstack(
+                    rx.progress(value=State.ingest_progress, max=100, width="100%"),
+                    rx.button(
+                        "Cancel",
+                        on_click=State.cancel_ingest,
+                        **UPLOAD_BUTTON_STYLE,
+                    ),
+                    align_items="stretch",
+                ),
+            ),
             rx.cond(
                 State.pdf_filename != "",
                 pdf_preview(),
             ),
             rx.foreach(
                 State.knowledge_base_files,
-                lambda file: rx.box(
+                lambda file: rx.hstack(
                     rx.text(file, font_size="sm"),
+                    rx.icon(
+                        "x",
+                        size=14,
+                        cursor="pointer",
+                        on_click=State.remove_file(file),
+                    ),
+                    justify="between",
+                    align="center",
                     padding="0.5em",
                     border_radius="md",
                     width="100%",
@@ -355,6 +509,11 @@ def sidebar() -> rx.Component:
                 color=rx.color("mauve", 11),
                 font_size="sm"
             ),
+            rx.text(
+                State.embedder_status,
+                color=rx.color("mauve", 10),
+                font_size="xs"
+            ),
             align_items="stretch",
             height="100%",
         ),
@@ -0,0 +1,249 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import psutil
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+
+EMBED_MODEL = os.getenv("EMBED_MODEL", "BAAI/bge-large-en-v1.5")
+# Most texts merged into one forward pass.
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+# How long the worker waits for other sessions' texts before running a batch.
+EMBED_BATCH_WAIT = float(os.getenv("EMBED_BATCH_WAIT_MS", "5")) / 1000
+# Requests allowed to wait for the model; callers block beyond this.
+EMBED_QUEUE_SIZE = int(os.getenv("EMBED_QUEUE_SIZE", "256"))
+# Seconds before a failed model load is retried; doubles with each failure.
+EMBED_RETRY_SECONDS = float(os.getenv("EMBED_RETRY_SECONDS", "5"))
+# Longest wait between two load attempts.
+EMBED_RETRY_MAX = float(os.getenv("EMBED_RETRY_MAX", "300"))
+
+
+def _load_model() -> BaseEmbedding:
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    return HuggingFaceEmbedding(model_name=EMBED_MODEL, trust_remote_code=True)
+
+
+def _rss_bytes() -> int:
+    return psutil.Process().memory_info().rss
+
+
+@dataclass
+class _Request:
+    kind: str  # "query" or "text"
+    texts: List[str]
+    future: Future = field(default_factory=Future)
+
+
+@dataclass
+class EmbeddingStats:
+    """What the shared model cost to load and how fast it is serving."""
+    loaded: bool = False
+    load_seconds: float = 0.0
+    rss_bytes: int = 0
+    embeddings: int = 0
+    batches: int = 0
+    busy_seconds: float = 0.0
+    load_failures: int = 0
+    last_error: str = ""
+
+    @property
+    def embeddings_per_second(self) -> float:
+        if self.busy_seconds <= 0:
+            return 0.0
+        return self.embeddings / self.busy_seconds
+
+    def describe(self) -> str:
+        if not self.loaded and self.load_failures:
+            return f"Embedding model failed to load ({self.last_error}); retrying..."
+        if not self.loaded:
+            return "Embedding model loading..."
+        return (
+            f"Embeddings: loaded in {self.load_seconds:.1f} s, "
+            f"{self.rss_bytes / (1024 * 1024):.0f} MB RSS, "
+            f"{self.embeddings_per_second:.0f}/s"
+        )
+
+
+class EmbeddingService:
+    """One embedding model per process, shared by every session.
+
+    The model is loaded on a dedicated worker thread the first time it is
+    needed (or when `warm` is called at startup). Callers put their texts on
+    a bounded queue; the worker merges whatever is waiting into a single
+    forward pass, so concurrent sessions share batches instead of fighting
+    over the model, and a full queue pushes back on the callers. A failed
+    load fails the requests that arrive during a backoff that doubles from
+    `retry_seconds` up to `retry_max`; the first request after it triggers
+    another attempt.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], BaseEmbedding] = _load_model,
+        max_batch: int = EMBED_MAX_BATCH,
+        batch_wait: float = EMBED_BATCH_WAIT,
+        queue_size: int = EMBED_QUEUE_SIZE,
+        retry_seconds: float = EMBED_RETRY_SECONDS,
+        retry_max: float = EMBED_RETRY_MAX,
+    ):
+        self.factory = factory
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.retry_seconds = retry_seconds
+        self.retry_max = retry_max
+        self._queue: "queue.Queue[_Request]" = queue.Queue(maxsize=queue_size)
+        self._model: Optional[BaseEmbedding] = None
+        self._load_error: Optional[BaseException] = None
+        self._retry_at = 0.0
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = EmbeddingStats()
+
+    def warm(self):
+        """Start loading the model in the background without waiting for it."""
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="embedder", daemon=True
+                )
+                self._worker.start()
+
+    def submit(self, texts: List[str], kind: str = "text") -> Future:
+        """Queue `texts` for embedding; blocks while the queue is full."""
+        self.warm()
+        request = _Request(kind=kind, texts=list(texts))
+        with self._lock:
+            error = self._load_error if time.monotonic() < self._retry_at else None
+        if error is not None:
+            request.future.set_exception(error)
+        else:
+            self._queue.put(request)
+        return request.future
+
+    def embed(self, texts: List[str], kind: str = "text") -> List[Embedding]:
+        return self.submit(texts, kind).result()
+
+    def stats(self) -> EmbeddingStats:
+        with self._lock:
+            return EmbeddingStats(**vars(self._stats))
+
+    def _run(self):
+        first = self._load()
+        while True:
+            batch = self._next_batch(first)
+            first = None
+            started = time.perf_counter()
+            for kind in ("text", "query"):
+                requests = [r for r in batch if r.kind == kind]
+                if requests:
+                    self._embed(kind, requests)
+            with self._lock:
+                self._stats.batches += 1
+                self._stats.embeddings += sum(len(r.texts) for r in batch)
+                self._stats.busy_seconds += time.perf_counter() - started
+
+    def _load(self) -> Optional[_Request]:
+        """Load the model, retrying with backoff.
+
+        Returns the request that triggered the successful attempt, if any,
+        so it is served in the first batch.
+        """
+        delay = self.retry_seconds
+        waiting: Optional[_Request] = None
+        while True:
+            start = time.perf_counter()
+            try:
+                model = self.factory()
+            except Exception as e:
+                retry_at = time.monotonic() + delay
+                delay = min(delay * 2, self.retry_max)
+                with self._lock:
+                    self._load_error = e
+                    self._retry_at = retry_at
+                    self._stats.load_failures += 1
+                    self._stats.last_error = str(e)
+                if waiting is not None:
+                    waiting.future.set_exception(e)
+                # Fail anyone who queued while we were loading, or races the
+                # backoff; the first request after it retries the load.
+                while True:
+                    waiting = self._queue.get()
+                    if time.monotonic() >= retry_at:
+                        break
+                    waiting.future.set_exception(e)
+                continue
+            with self._lock:
+                self._model = model
+                self._load_error = None
+                self._stats.loaded = True
+                self._stats.load_seconds = time.perf_counter() - start
+                self._stats.rss_bytes = _rss_bytes()
+            return waiting
+
+    def _next_batch(self, first: Optional[_Request] = None) -> List[_Request]:
+        """Block for one request, then gather what else arrives within the wait."""
+        batch = [first if first is not None else self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.batch_wait
+        while size < self.max_batch:
+            try:
+                request = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _embed(self, kind: str, requests: List[_Request]):
+        texts = [text for request in requests for text in request.texts]
+        try:
+            if kind == "text":
+                embeddings = self._model.get_text_embedding_batch(texts)
+            else:
+                # Queries carry the model's query instruction, so they go
+                # through the query path one by one; they are short.
+                embeddings = [self._model.get_query_embedding(text) for text in texts]
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        offset = 0
+        for request in requests:
+            request.future.set_result(embeddings[offset:offset + len(request.texts)])
+            offset += len(request.texts)
+
+
+embedding_service = EmbeddingService()
+
+
+class SharedEmbedding(BaseEmbedding):
+    """LlamaIndex embed model that forwards to the process-wide service."""
+
+    model_name: str = EMBED_MODEL
+    # Hand whole ingest batches to the service; it does its own batching.
+    embed_batch_size: int = EMBED_MAX_BATCH
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SharedEmbedding"
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return embedding_service.embed([query], kind="query")[0]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return embedding_service.embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return embedding_service.embed(texts)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await asyncio.to_thread(self._get_text_embedding, text)
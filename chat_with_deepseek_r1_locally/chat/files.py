@@ -0,0 +1,85 @@
+import os
+import re
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+from urllib.parse import quote
+
+import reflex as rx
+from fastapi import HTTPException, Request
+from starlette.responses import Response, StreamingResponse
+
+PDF_ROUTE = "/pdf"
+READ_CHUNK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def file_url(file_id: str) -> str:
+    """Absolute URL the frontend uses to fetch an uploaded PDF."""
+    return f"{rx.config.get_config().api_url}{PDF_ROUTE}/{quote(file_id)}"
+
+
+def _resolve(file_id: str) -> Path:
+    """Map an id onto a file in the upload dir, refusing anything outside it."""
+    upload_dir = rx.get_upload_dir().resolve()
+    path = (upload_dir / file_id).resolve()
+    if path.parent != upload_dir or not path.is_file():
+        raise HTTPException(status_code=404)
+    return path
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range into inclusive offsets, or None if unusable."""
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last N bytes.
+        length = int(end)
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        return None
+    return start, end
+
+
+def _read(path: Path, start: int, end: int) -> Iterator[bytes]:
+    with path.open("rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = f.read(min(READ_CHUNK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+async def serve_pdf(file_id: str, request: Request) -> Response:
+    """Serve an uploaded PDF, honouring HTTP Range requests."""
+    path = _resolve(file_id)
+    size = os.path.getsize(path)
+    headers = {"Accept-Ranges": "bytes", "Content-Type": "application/pdf"}
+
+    range_header = request.headers.get("range", "")
+    if not _RANGE_RE.match(range_header.strip()):
+        # No (or a malformed) Range header: send the whole file.
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_read(path, 0, size - 1), headers=headers)
+
+    byte_range = _parse_range(range_header, size)
+    if byte_range is None:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_read(path, start, end), status_code=206, headers=headers)
+
+
+def register(app: rx.App):
+    """Mount the PDF endpoint on the app's backend."""
+    app.api.add_api_route(f"{PDF_ROUTE}/{{file_id}}", serve_pdf, methods=["GET"])
@@ -0,0 +1,215 @@
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from llama_index.core import Document, Settings, VectorStoreIndex
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from chat import store
+from chat.pages import iter_pages, page_count
+
+# Ingestion runs on its own pool so embedding never blocks the event loop.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "32"))
+
+# The in-memory vector store is not safe to read while it is being written,
+# so inserts and retrievals take turns on this lock. Both are short: the
+# embeddings are computed before the lock is taken.
+INDEX_LOCK = threading.RLock()
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+_jobs: Dict[str, "IngestJob"] = {}
+_jobs_lock = threading.Lock()
+
+
+class IngestCancelled(Exception):
+    """Raised inside the pipeline when the job has been cancelled."""
+
+
+@dataclass
+class IngestJob:
+    """Progress of one PDF moving through parse -> embed -> store."""
+    id: str
+    path: str
+    filename: str
+    doc_id: str
+    status: str = "queued"
+    error: str = ""
+    pages_total: int = 0
+    pages_parsed: int = 0
+    chunks_created: int = 0
+    chunks_embedded: int = 0
+    chunks_stored: int = 0
+    restored: bool = False
+    future: Optional[Future] = field(default=None, repr=False)
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def percent(self) -> int:
+        """Rough overall progress: pages parsed times the share of chunks stored."""
+        if not self.pages_total:
+            return 0
+        parsed = self.pages_parsed / self.pages_total
+        stored = self.chunks_stored / self.chunks_created if self.chunks_created else 0
+        return int(100 * parsed * stored)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise IngestCancelled()
+
+    def describe(self) -> str:
+        """One-line status for the sidebar."""
+        if self.status == "queued":
+            return f"Queued {self.filename}"
+        if self.status == "running":
+            return (
+                f"{self.filename}: parsed {self.pages_parsed}/{self.pages_total} pages, "
+                f"embedded {self.chunks_embedded}, stored {self.chunks_stored} chunks"
+            )
+        if self.status == "done":
+            if self.restored:
+                return f"Added {self.filename} to knowledge base (loaded from disk)"
+            return f"Added {self.filename} to knowledge base"
+        if self.status == "cancelled":
+            return f"Cancelled {self.filename}"
+        return f"Error: {self.error}"
+
+
+def _restore(job: IngestJob, index: VectorStoreIndex, nodes: List[BaseNode]):
+    """Insert a document persisted by an earlier run; its nodes carry embeddings."""
+    job.pages_total = job.pages_parsed = len({node.metadata.get("page_label") for node in nodes})
+    job.chunks_created = job.chunks_embedded = len(nodes)
+    for start in range(0, len(nodes), EMBED_BATCH_SIZE):
+        job.check_cancelled()
+        batch = nodes[start:start + EMBED_BATCH_SIZE]
+        with INDEX_LOCK:
+            index.insert_nodes(batch)
+        job.chunks_stored += len(batch)
+    job.restored = True
+
+
+def _run(job: IngestJob, index: VectorStoreIndex, after: Optional[Future] = None):
+    """Parse the PDF page by page, embedding and inserting nodes in batches.
+
+    A document that was already embedded by an earlier run is loaded from
+    its persisted store instead, and a fresh one is persisted once indexed.
+    """
+    if after is not None:
+        wait([after])
+    job.status = "running"
+    node_parser = Settings.node_parser
+    embed_model = Settings.embed_model
+    doc_id = job.doc_id
+    pending: List[BaseNode] = []
+    stored: List[BaseNode] = []
+
+    def flush():
+        if not pending:
+            return
+        job.check_cancelled()
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in pending]
+        for node, embedding in zip(pending, embed_model.get_text_embedding_batch(texts)):
+            node.embedding = embedding
+        job.chunks_embedded += len(pending)
+        job.check_cancelled()
+        with INDEX_LOCK:
+            index.insert_nodes(pending)
+        job.chunks_stored += len(pending)
+        stored.extend(pending)
+        pending.clear()
+
+    try:
+        persisted = store.load(doc_id)
+        if persisted is not None:
+            _restore(job, index, persisted)
+            job.status = "done"
+            return
+        job.pages_total = page_count(job.path)
+        # Later pages are parsed in other processes while this thread embeds.
+        for page_number, text in iter_pages(job.path, total=job.pages_total):
+            job.check_cancelled()
+            # Every page shares the file's id so the whole PDF is one ref doc.
+            # doc_id is also kept in metadata so retrieval can filter on it.
+            document = Document(
+                text=text,
+                id_=doc_id,
+                metadata={
+                    "file_name": job.filename,
+                    "page_label": str(page_number + 1),
+                    "doc_id": doc_id,
+                },
+                excluded_embed_metadata_keys=["doc_id"],
+                excluded_llm_metadata_keys=["doc_id"],
+            )
+            job.pages_parsed += 1
+            nodes = node_parser.get_nodes_from_documents([document])
+            pending.extend(nodes)
+            job.chunks_created += len(nodes)
+            if len(pending) >= EMBED_BATCH_SIZE:
+                flush()
+        flush()
+        store.save(doc_id, stored)
+        job.status = "done"
+    except IngestCancelled:
+        job.status = "cancelled"
+    except Exception as e:
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        if job.status != "done":
+            # Don't leave a half-indexed document behind.
+            with INDEX_LOCK:
+                index.delete_ref_doc(doc_id, delete_from_docstore=True)
+
+
+def start_ingest(
+    index: VectorStoreIndex,
+    path: str,
+    filename: str,
+    doc_id: str,
+    after: Optional[Future] = None,
+) -> IngestJob:
+    """Queue `path` for ingestion into `index` under `doc_id` and return its job.
+
+    If `after` is given the job waits for that future before it starts.
+    """
+    job = IngestJob(id=uuid.uuid4().hex, path=path, filename=filename, doc_id=doc_id)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job.future = _executor.submit(_run, job, index, after)
+    return job
+
+
+def start_removal(index: VectorStoreIndex, doc_id: str) -> Future:
+    """Queue the removal of `doc_id`'s nodes from `index`; callers never wait on INDEX_LOCK."""
+    def remove():
+        with INDEX_LOCK:
+            index.delete_ref_doc(doc_id, delete_from_docstore=True)
+
+    return _executor.submit(remove)
+
+
+def get_job(job_id: str) -> Optional[IngestJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def cancel_job(job_id: str):
+    job = get_job(job_id)
+    if job is not None:
+        job.cancel()
+
+
+def forget_job(job_id: str):
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
@@ -0,0 +1,259 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.data_structs.data_structs import IndexStruct
+from llama_index.core.storage.index_store import SimpleIndexStore
+from llama_index.core.vector_stores import FilterOperator, MetadataFilter, MetadataFilters
+
+from chat import store
+from chat.ingest import IngestJob, start_ingest, start_removal
+
+# A session that hasn't touched a document for this long stops holding it.
+SESSION_TTL = float(os.getenv("LIBRARY_SESSION_TTL", str(6 * 60 * 60)))
+# Seconds between sweeps of persisted documents past their TTL.
+STORE_SWEEP_SECONDS = 60 * 60
+# Seconds a freshly placed upload is kept for the session that is about to acquire it.
+UPLOAD_GRACE = 60.0
+
+
+class DeferredIndexStore(SimpleIndexStore):
+    """Index store that keeps structs by reference and serialises them lazily.
+
+    SimpleIndexStore re-serialises the whole IndexDict, which has an entry
+    for every node in the corpus, on every insert. Holding a reference instead
+    makes inserting a document cost proportional to that document alone;
+    a struct is serialised at most once per change, when it is next read.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._live: Dict[str, IndexStruct] = {}
+
+    def _flush(self):
+        # The index calls add_index_struct after every change it makes, so a
+        # struct that has been written stays current until it is added again.
+        live, self._live = self._live, {}
+        for index_struct in live.values():
+            super().add_index_struct(index_struct)
+
+    def add_index_struct(self, index_struct: IndexStruct) -> None:
+        self._live[index_struct.index_id] = index_struct
+
+    async def async_add_index_struct(self, index_struct: IndexStruct) -> None:
+        self.add_index_struct(index_struct)
+
+    def delete_index_struct(self, key: str) -> None:
+        self._live.pop(key, None)
+        super().delete_index_struct(key)
+
+    async def adelete_index_struct(self, key: str) -> None:
+        self.delete_index_struct(key)
+
+    def get_index_struct(self, struct_id: Optional[str] = None) -> Optional[IndexStruct]:
+        self._flush()
+        return super().get_index_struct(struct_id)
+
+    async def aget_index_struct(self, struct_id: Optional[str] = None) -> Optional[IndexStruct]:
+        return self.get_index_struct(struct_id)
+
+    def index_structs(self) -> List[IndexStruct]:
+        self._flush()
+        return super().index_structs()
+
+    async def async_index_structs(self) -> List[IndexStruct]:
+        return self.index_structs()
+
+    def persist(self, *args, **kwargs) -> None:
+        self._flush()
+        super().persist(*args, **kwargs)
+
+
+def new_index() -> VectorStoreIndex:
+    """An empty index whose inserts and deletes scale with the document, not the corpus."""
+    storage_context = StorageContext.from_defaults(index_store=DeferredIndexStore())
+    return VectorStoreIndex(nodes=[], storage_context=storage_context)
+
+
+@dataclass
+class LibraryDocument:
+    """One PDF in the shared index, keyed by the SHA-256 of its bytes."""
+    doc_id: str
+    filename: str
+    path: str
+    job: Optional[IngestJob] = None
+    # session token -> last time that session used the document
+    holders: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def status(self) -> str:
+        return self.job.status if self.job is not None else "done"
+
+
+class DocumentLibrary:
+    """Content-addressed documents shared by every session in the process.
+
+    All PDFs live in one VectorStoreIndex. A PDF is ingested the first time
+    any session uploads it; later uploads of the same bytes just attach it to
+    the session. Each session restricts retrieval to the documents it holds,
+    and a document no session holds is removed from the index. Embedded
+    documents are persisted per hash (see chat.store) so a restart, or a
+    later upload of the same bytes, reloads them instead of re-embedding.
+    """
+
+    def __init__(self, session_ttl: float = SESSION_TTL):
+        self.session_ttl = session_ttl
+        self._docs: Dict[str, LibraryDocument] = {}
+        # Collected documents whose nodes are still being removed: the
+        # cancelled job cleaning up after itself, or the queued removal.
+        self._draining: Dict[str, Future] = {}
+        self._index: Optional[VectorStoreIndex] = None
+        # Upload paths placed but not yet acquired -> when they were placed.
+        self._uploads: Dict[str, float] = {}
+        self._swept = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"ingested": 0, "reused": 0, "reloaded": 0, "collected": 0, "expired": 0}
+
+    @property
+    def index(self) -> VectorStoreIndex:
+        """The shared index, created on first use with the configured Settings."""
+        with self._lock:
+            if self._index is None:
+                self._index = new_index()
+            return self._index
+
+    def place_upload(self, tmp: str, dest: Path):
+        """Move a finished upload into place for `save_upload`.
+
+        Uploads of the same bytes share one path, which collecting the
+        document unlinks. Renaming under the lock and reserving the path
+        until `acquire` keeps a concurrent collection from deleting the
+        file between the upload and its ingestion.
+        """
+        with self._lock:
+            os.replace(tmp, dest)
+            self._uploads[str(dest)] = time.monotonic()
+
+    def acquire(self, doc_id: str, filename: str, path: str, session: str) -> LibraryDocument:
+        """Attach a document to `session`, ingesting it only if nobody has yet."""
+        index = self.index
+        with self._lock:
+            self._uploads.pop(path, None)
+            doc = self._docs.get(doc_id)
+            if doc is None or doc.status in ("failed", "cancelled"):
+                # A collected copy of the same document must finish removing
+                # its nodes before we start inserting them again. The pool
+                # starts jobs in order, so it is running before we wait on it.
+                previous = self._draining.pop(doc_id, None)
+                doc = LibraryDocument(doc_id=doc_id, filename=filename, path=path)
+                doc.job = start_ingest(
+                    index, path, filename, doc_id,
+                    after=previous,
+                )
+                self._docs[doc_id] = doc
+                self._stats["ingested"] += 1
+            else:
+                self._stats["reused"] += 1
+            doc.holders[session] = time.monotonic()
+            self._collect()
+            return doc
+
+    def ensure(self, docs: Iterable[Tuple[str, str]],
+               session: str) -> Tuple[List[IngestJob], List[str]]:
+        """Make sure `session`'s (doc_id, filename) pairs are in the index.
+
+        After a restart the index starts empty while sessions still list
+        their documents. The first query reloads them from their persisted
+        stores; the returned jobs finish once they are back in the index.
+        Documents that are neither loaded nor persisted are returned as
+        missing; they have to be uploaded again.
+        """
+        index = self.index
+        now = time.monotonic()
+        pending, missing = [], []
+        with self._lock:
+            for doc_id, filename in docs:
+                doc = self._docs.get(doc_id)
+                if doc is None:
+                    if not store.has(doc_id):
+                        missing.append(doc_id)
+                        continue
+                    doc = LibraryDocument(doc_id=doc_id, filename=filename, path="")
+                    doc.job = start_ingest(
+                        index, "", filename, doc_id, after=self._draining.pop(doc_id, None)
+                    )
+                    self._docs[doc_id] = doc
+                    self._stats["reloaded"] += 1
+                if doc.job is not None and not doc.job.done:
+                    pending.append(doc.job)
+                doc.holders[session] = now
+        return pending, missing
+
+    def get(self, doc_id: str) -> Optional[LibraryDocument]:
+        with self._lock:
+            return self._docs.get(doc_id)
+
+    def release(self, doc_id: str, session: str):
+        """Detach a document from `session`, collecting it if unused."""
+        with self._lock:
+            doc = self._docs.get(doc_id)
+            if doc is not None:
+                doc.holders.pop(session, None)
+            self._collect()
+
+    def _collect(self):
+        """Drop expired holders and remove documents nobody holds. Caller holds the lock."""
+        now = time.monotonic()
+        cutoff = now - self.session_ttl
+        for path, placed in list(self._uploads.items()):
+            if placed < now - UPLOAD_GRACE:
+                # Never acquired; remove it unless a document still uses it.
+                del self._uploads[path]
+                if not any(doc.path == path for doc in self._docs.values()):
+                    Path(path).unlink(missing_ok=True)
+        for doc_id, future in list(self._draining.items()):
+            if future.done():
+                del self._draining[doc_id]
+        for doc in list(self._docs.values()):
+            for session, last_used in list(doc.holders.items()):
+                if last_used < cutoff:
+                    del doc.holders[session]
+            if doc.holders:
+                continue
+            del self._docs[doc.doc_id]
+            self._stats["collected"] += 1
+            if doc.job is not None and not doc.job.done:
+                # The pipeline removes whatever it has inserted when it stops.
+                doc.job.cancel()
+                self._draining[doc.doc_id] = doc.job.future
+            elif self._index is not None:
+                # Callers run on the event loop, so the index is edited on
+                # the ingest pool rather than waiting here for INDEX_LOCK.
+                self._draining[doc.doc_id] = start_removal(self._index, doc.doc_id)
+            # The persisted store is kept so the document can come back
+            # cheaply, until it has gone unused for STORE_TTL.
+            store.touch(doc.doc_id)
+            if doc.path and doc.path not in self._uploads:
+                Path(doc.path).unlink(missing_ok=True)
+        if now - self._swept >= STORE_SWEEP_SECONDS:
+            self._swept = now
+            self._stats["expired"] += store.sweep(list(self._docs) + list(self._draining))
+
+    def query_engine(self, doc_ids: List[str], **kwargs):
+        """A query engine over the shared index restricted to `doc_ids`."""
+        filters = MetadataFilters(
+            filters=[MetadataFilter(key="doc_id", value=list(doc_ids), operator=FilterOperator.IN)]
+        )
+        return self.index.as_query_engine(filters=filters, **kwargs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "documents": len(self._docs)}
+
+
+library = DocumentLibrary()
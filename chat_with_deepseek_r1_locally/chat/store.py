@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from llama_index.core import StorageContext
+from llama_index.core.schema import BaseNode
+
+from chat.embeddings import EMBED_MODEL
+
+# Where embedded documents are kept between restarts.
+DATA_DIR = Path(os.getenv("LIBRARY_DATA_DIR", "library_data"))
+# Persisted documents nobody has used for this long are deleted.
+STORE_TTL = float(os.getenv("LIBRARY_STORE_TTL", str(7 * 24 * 60 * 60)))
+
+
+def _model_dir(data_dir: Optional[Path]) -> Path:
+    # Vectors are only valid for the model that produced them.
+    return Path(data_dir or DATA_DIR) / EMBED_MODEL.replace("/", "--")
+
+
+def _doc_dir(doc_id: str, data_dir: Optional[Path]) -> Path:
+    return _model_dir(data_dir) / doc_id
+
+
+def has(doc_id: str, data_dir: Optional[Path] = None) -> bool:
+    return _doc_dir(doc_id, data_dir).is_dir()
+
+
+def touch(doc_id: str, data_dir: Optional[Path] = None):
+    """Mark a persisted document as just used, restarting its TTL."""
+    try:
+        os.utime(_doc_dir(doc_id, data_dir))
+    except FileNotFoundError:
+        pass
+
+
+def save(doc_id: str, nodes: List[BaseNode], data_dir: Optional[Path] = None):
+    """Persist one document's embedded nodes in a storage context of its own.
+
+    The context is written to a temp dir and renamed into place, so a crash
+    never leaves a half-written document that would be loaded next time.
+    """
+    dest = _doc_dir(doc_id, data_dir)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    storage_context = StorageContext.from_defaults()
+    # The vectors live in the vector store; don't write them out twice.
+    storage_context.docstore.add_documents(
+        [node.model_copy(update={"embedding": None}) for node in nodes]
+    )
+    storage_context.vector_store.add(nodes)
+    tmp = tempfile.mkdtemp(dir=dest.parent, prefix=f".{doc_id}-")
+    try:
+        storage_context.persist(persist_dir=tmp)
+        if not dest.is_dir():
+            os.replace(tmp, dest)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load(doc_id: str, data_dir: Optional[Path] = None) -> Optional[List[BaseNode]]:
+    """Nodes of a persisted document with their embeddings, or None if absent."""
+    src = _doc_dir(doc_id, data_dir)
+    if not src.is_dir():
+        return None
+    storage_context = StorageContext.from_defaults(persist_dir=str(src))
+    vector_store = storage_context.vector_store
+    nodes = list(storage_context.docstore.docs.values())
+    for node in nodes:
+        node.embedding = vector_store.get(node.node_id)
+    return nodes
+
+
+def remove(doc_id: str, data_dir: Optional[Path] = None):
+    shutil.rmtree(_doc_dir(doc_id, data_dir), ignore_errors=True)
+
+
+def sweep(keep: Iterable[str], ttl: float = STORE_TTL, data_dir: Optional[Path] = None) -> int:
+    """Remove persisted documents not in `keep` that were last used over `ttl` seconds ago.
+
+    Temp dirs left behind by a crash in `save` are swept the same way.
+    Returns how many were removed.
+    """
+    keep = set(keep)
+    cutoff = time.time() - ttl
+    removed = 0
+    try:
+        entries = list(_model_dir(data_dir).iterdir())
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if entry.name in keep or not entry.is_dir():
+            continue
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        remove(entry.name, data_dir)
+        removed += 1
+    return removed
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+
+from llama_index.core import QueryBundle, Settings
+from llama_index.core.query_engine import RetrieverQueryEngine
+
+from chat.ingest import INDEX_LOCK
+
+# How long to accumulate tokens before pushing a delta to the browser.
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.05"))
+
+_DONE = object()
+
+
+@dataclass
+class StreamStats:
+    """Timing for one streamed answer."""
+    started: float = 0.0
+    first_token: Optional[float] = None
+    finished: Optional[float] = None
+    tokens: int = 0
+    flushes: int = 0
+
+    @property
+    def ttft_ms(self) -> int:
+        """Milliseconds from the request to the first token."""
+        if self.first_token is None:
+            return 0
+        return int((self.first_token - self.started) * 1000)
+
+    @property
+    def tokens_per_second(self) -> float:
+        if self.first_token is None or self.finished is None or self.finished <= self.first_token:
+            return 0.0
+        return self.tokens / (self.finished - self.first_token)
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class _Abort:
+    """Callbacks that cut a worker's blocking I/O short once its reader is gone."""
+
+    def __init__(self):
+        self.aborted = False
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, callback: Callable[[], None]):
+        with self._lock:
+            if not self.aborted:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+_worker = threading.local()
+
+
+def on_abort(callback: Callable[[], None]):
+    """Run `callback` if the stream this worker thread produces is abandoned."""
+    abort = getattr(_worker, "abort", None)
+    if abort is not None:
+        abort.register(callback)
+
+
+def stream_answer(query_engine: RetrieverQueryEngine, question: str) -> Iterator[str]:
+    """Retrieve context and stream the answer from a streaming query engine."""
+    # The question is embedded before the lock is taken, as ingested chunks
+    # are, so the lock covers only the vector-store lookup; embedding can
+    # queue behind an ingest batch and generation runs unlocked.
+    query = QueryBundle(question, embedding=Settings.embed_model.get_query_embedding(question))
+    with INDEX_LOCK:
+        nodes = query_engine.retrieve(query)
+    response = query_engine.synthesize(query, nodes)
+    tokens = response.response_gen
+    try:
+        yield from tokens
+    finally:
+        # Closing the generator stops Ollama when the reader goes away.
+        close = getattr(tokens, "close", None)
+        if close is not None:
+            close()
+
+
+async def stream_in_thread(
+    factory: Callable[..., Iterator[str]],
+    *args,
+    interval: float = STREAM_FLUSH_INTERVAL,
+    stats: Optional[StreamStats] = None,
+) -> AsyncIterator[str]:
+    """Run a blocking token generator on a worker thread.
+
+    Tokens are coalesced so that at most one delta is yielded per `interval`
+    seconds. Closing the async iterator aborts the worker's request and
+    waits for the worker to finish, so callers holding a generation slot
+    only give it back once Ollama has really stopped.
+    """
+    stats = stats if stats is not None else StreamStats()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    abort = _Abort()
+
+    def produce():
+        _worker.abort = abort
+        tokens = None
+        try:
+            tokens = factory(*args)
+            for token in tokens:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, token)
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, _Failure(e))
+        finally:
+            close = getattr(tokens, "close", None)
+            if close is not None:
+                close()
+            _worker.abort = None
+            loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+    stats.started = time.perf_counter()
+    worker = loop.run_in_executor(None, produce)
+    buffer = []
+    deadline = None
+    try:
+        while True:
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            if item is not None:
+                if stats.first_token is None:
+                    stats.first_token = time.perf_counter()
+                    # Push the first token straight away; it is what users wait for.
+                    deadline = loop.time()
+                elif deadline is None:
+                    deadline = loop.time() + interval
+                stats.tokens += 1
+                buffer.append(item)
+            if buffer and loop.time() >= deadline:
+                stats.flushes += 1
+                yield "".join(buffer)
+                buffer.clear()
+                deadline = None
+        if buffer:
+            stats.flushes += 1
+            yield "".join(buffer)
+    finally:
+        stop.set()
+        stats.finished = time.perf_counter()
+        abort.abort()
+        await worker
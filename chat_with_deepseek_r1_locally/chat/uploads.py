@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional
+
+import reflex as rx
+from fastapi import HTTPException, Request
+from reflex.components.core.upload import DEFAULT_UPLOAD_ID, upload_files_context_var_data
+from reflex.event import EventSpec
+from reflex.vars import Var
+from starlette.responses import JSONResponse, Response
+
+UPLOAD_ROUTE = "/stream_upload"
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024)
+
+
+class UploadFailed(Exception):
+    """Raised when an upload did not arrive."""
+
+
+class UploadTooLarge(UploadFailed):
+    """Raised when an upload exceeds the configured size limit."""
+
+
+@dataclass
+class UploadResult:
+    """Where an upload landed and what it cost to get it there."""
+    path: Path
+    size: int
+    sha256: str
+    seconds: float
+
+    @property
+    def mb_per_second(self) -> float:
+        if self.seconds <= 0:
+            return 0.0
+        return self.size / (1024 * 1024) / self.seconds
+
+    def describe(self) -> str:
+        return f"{self.size / (1024 * 1024):.1f} MB at {self.mb_per_second:.0f} MB/s"
+
+
+async def save_upload(
+    chunks: AsyncIterator[bytes],
+    filename: str,
+    dest_dir: Optional[Path] = None,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    chunk_size: int = CHUNK_SIZE,
+    content_addressed: bool = False,
+    place: Callable[[str, Path], None] = os.replace,
+) -> UploadResult:
+    """Stream an upload to disk as it arrives.
+
+    The file is hashed as it is copied and written to a temp file in
+    `dest_dir` that is renamed into place only once it is complete, so
+    readers never see a partial file. Incoming pieces are buffered up to
+    `chunk_size` before each write, and the upload is abandoned as soon as
+    it passes `max_bytes`. With `content_addressed` the file is stored as
+    `<sha256><suffix>`, so identical uploads land on the same path whatever
+    they were called. `place` moves the finished temp file to its destination.
+    """
+    dest_dir = Path(dest_dir or rx.get_upload_dir())
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    # Never trust the client's path components.
+    filename = Path(filename).name
+
+    digest = hashlib.sha256()
+    size = 0
+    buffer = bytearray()
+    start = time.perf_counter()
+    fd, tmp_name = tempfile.mkstemp(dir=dest_dir, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(
+                        f"{filename} is larger than {max_bytes / (1024 * 1024):g} MB"
+                    )
+                digest.update(chunk)
+                buffer += chunk
+                if len(buffer) >= chunk_size:
+                    await asyncio.to_thread(tmp.write, bytes(buffer))
+                    buffer.clear()
+            await asyncio.to_thread(tmp.write, bytes(buffer))
+        if content_addressed:
+            dest = dest_dir / f"{digest.hexdigest()}{Path(filename).suffix}"
+        else:
+            dest = dest_dir / filename
+        place(tmp_name, dest)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    return UploadResult(
+        path=dest,
+        size=size,
+        sha256=digest.hexdigest(),
+        seconds=time.perf_counter() - start,
+    )
+
+
+async def receive_upload(
+    filename: str, request: Request, place: Callable[[str, Path], None] = os.replace
+) -> Response:
+    """Write a PUT body to the upload dir under its hash, without holding it in memory."""
+    try:
+        length = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPException(status_code=400)
+    too_large = f"{filename} is larger than {MAX_UPLOAD_BYTES / (1024 * 1024):g} MB"
+    if length > MAX_UPLOAD_BYTES:
+        # Refuse before reading anything the client has sent.
+        return JSONResponse({"error": too_large}, status_code=413)
+    try:
+        upload = await save_upload(
+            request.stream(), filename, max_bytes=MAX_UPLOAD_BYTES, content_addressed=True, place=place
+        )
+    except UploadTooLarge as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
+    return JSONResponse({
+        "name": upload.path.name,
+        "filename": Path(filename).name,
+        "sha256": upload.sha256,
+        "seconds": upload.seconds,
+    })
+
+
+def received_upload(response: dict, dest_dir: Optional[Path] = None) -> UploadResult:
+    """The upload `receive_upload` described in `response`.
+
+    The response comes back through the browser, so the file is looked up
+    in `dest_dir` by name and its size taken from disk.
+    """
+    if response.get("error"):
+        raise UploadFailed(response["error"])
+    dest_dir = Path(dest_dir or rx.get_upload_dir())
+    path = dest_dir / str(response.get("name", ""))
+    if path.resolve().parent != dest_dir.resolve() or not path.is_file():
+        raise UploadFailed("The upload did not arrive")
+    return UploadResult(
+        path=path,
+        size=path.stat().st_size,
+        sha256=str(response.get("sha256", "")),
+        seconds=float(response.get("seconds", 0.0)),
+    )
+
+
+def send_upload(callback, upload_id: str = DEFAULT_UPLOAD_ID) -> EventSpec:
+    """Upload the file selected in `upload_id` to UPLOAD_ROUTE.
+
+    Reflex's own upload endpoint reads the whole file into memory before
+    any handler runs, so the browser sends the file body straight to the
+    route `register` mounts instead. `callback` receives the JSON response,
+    to pass to `received_upload`.
+    """
+    url = f"{rx.config.get_config().api_url}{UPLOAD_ROUTE}/"
+    send = Var(
+        _js_expr=f"""() => {{
+    const file = (filesById[{json.dumps(upload_id)}] || [])[0];
+    if (!file) {{
+        return {{error: "No file uploaded!"}};
+    }}
+    return fetch({json.dumps(url)} + encodeURIComponent(file.name), {{method: "PUT", body: file}})
+        .then((r) => r.json())
+        .catch((e) => ({{error: e.message}}));
+}}""",
+        _var_data=upload_files_context_var_data,
+    )
+    return rx.call_function(send, callback=callback)
+
+
+def register(app: rx.App, place: Callable[[str, Path], None] = os.replace):
+    """Mount the streaming upload endpoint on the app's backend."""
+
+    async def receive(filename: str, request: Request) -> Response:
+        return await receive_upload(filename, request, place)
+
+    app.api.add_api_route(f"{UPLOAD_ROUTE}/{{filename}}", receive, methods=["PUT"])
@@ -0,0 +1,557 @@
+"""Benchmarks for the GitHub app's repository sync.
+
+Run from the app directory with `python -m chat.benchmarks [name ...]`. The
+GitHub API is replaced by StubGitHub, a local server that speaks the few
+endpoints the sync uses, and embeddings are random vectors, so the numbers
+isolate fetch, chunking and bookkeeping cost from the network and the model.
+The chunking and reembed benchmarks are the exception: they need a running
+Ollama server to embed a real checkout.
+"""
+import ast
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Tuple
+from urllib.parse import urlparse
+
+import chromadb
+
+from chat.chunking import chunk_files, estimate_tokens
+from chat.github_api import GitHubAPI
+from chat.local_repo import LocalRepo
+from chat.namespaces import Namespaces
+from chat.reembed import EMBED_MODEL, Generations, batched_embedding_fn, dir_size
+from chat.symbols import SymbolIndex, format_answer, lookup
+from chat.sync import _decode, _filter, symbols_path, sync_repo
+
+EMBED_DIM = 384
+# The repository to chunk; defaults to the checkout this app lives in.
+BENCH_REPO = os.getenv("BENCH_REPO", str(Path(__file__).resolve().parents[2]))
+BENCH_EMBED_MODEL = os.getenv("BENCH_EMBED_MODEL", "llama3:instruct")
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+
+
+def _git_sha(kind: str, payload: bytes) -> str:
+    return hashlib.sha1(f"{kind} {len(payload)}\0".encode() + payload).hexdigest()
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections from a wide client pool.
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class StubGitHub:
+    """A local stand-in for api.github.com serving one in-memory repository.
+
+    Edit `files` and call `commit()` to publish a new head. Responses carry
+    ETags and honour If-None-Match; `latency` adds a delay per request and
+    `rate_limit` = (requests, window seconds) enforces a primary rate limit
+    with GitHub's headers.
+    """
+
+    def __init__(self, repo: str = "octo/monorepo", files: Dict[str, str] = None,
+                 latency: float = 0.0, rate_limit: Tuple[int, float] = (5000, 3600.0)):
+        self.repo = repo
+        self.files: Dict[str, str] = dict(files or {})
+        self.latency = latency
+        self.limit, self.window = rate_limit
+        self.requests = 0
+        self.rejected = 0
+        self._window_start = time.time()
+        self._used = 0
+        self._lock = threading.Lock()
+        self._blobs: Dict[str, bytes] = {}
+        self._tree: dict = {}
+        self._head = ""
+        self.commit()
+        self.server = _Server(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def commit(self):
+        entries = []
+        for path, text in sorted(self.files.items()):
+            data = text.encode()
+            sha = _git_sha("blob", data)
+            self._blobs[sha] = data
+            entries.append({"path": path, "type": "blob", "sha": sha, "size": len(data)})
+        tree_sha = _git_sha("tree", json.dumps(entries).encode())
+        self._tree = {"sha": tree_sha, "tree": entries, "truncated": False}
+        self._head = _git_sha("commit", (tree_sha + self._head).encode())
+
+    def close(self):
+        self.server.shutdown()
+
+    def route(self, path: str):
+        base = f"/repos/{self.repo}"
+        if path == base:
+            return {"default_branch": "main"}
+        if path.startswith(f"{base}/commits/"):
+            return {"sha": self._head, "commit": {"tree": {"sha": self._tree["sha"]}}}
+        if path.startswith(f"{base}/git/trees/"):
+            return self._tree
+        if path.startswith(f"{base}/git/blobs/"):
+            data = self._blobs.get(path.rsplit("/", 1)[1])
+            if data is not None:
+                return {"encoding": "base64", "content": base64.b64encode(data).decode()}
+        return None
+
+    def _take(self) -> Tuple[bool, Dict[str, str]]:
+        """Count a request against the rate limit; False if it is over."""
+        with self._lock:
+            self.requests += 1
+            now = time.time()
+            if now >= self._window_start + self.window:
+                self._window_start, self._used = now, 0
+            allowed = self._used < self.limit
+            if allowed:
+                self._used += 1
+            else:
+                self.rejected += 1
+            return allowed, {
+                "X-RateLimit-Limit": str(self.limit),
+                "X-RateLimit-Remaining": str(self.limit - self._used),
+                "X-RateLimit-Reset": str(math.ceil(self._window_start + self.window)),
+            }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; don't let Nagle
+            # hold the body back for a delayed ACK.
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                allowed, headers = stub._take()
+                body = stub.route(urlparse(self.path).path) if allowed else None
+                payload = json.dumps(body if body is not None else {"message": "Not Found"}).encode()
+                etag = f'"{hashlib.sha1(payload).hexdigest()}"'
+                if not allowed:
+                    status = 403
+                elif body is None:
+                    status = 404
+                elif self.headers.get("If-None-Match") == etag:
+                    status, payload = 304, b""
+                else:
+                    status = 200
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if status in (200, 304):
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _stub_app(db_dir: str):
+    """Just the parts of an embedchain App that the sync touches."""
+    calls = []
+    # One vector for every chunk keeps the model out of the timings.
+    vector = [random.random() for _ in range(EMBED_DIM)]
+
+    def embedding_fn(texts):
+        calls.append(len(texts))
+        return [vector] * len(texts)
+
+    collection = chromadb.EphemeralClient().get_or_create_collection(f"bench-{time.time_ns()}")
+    return SimpleNamespace(
+        config=SimpleNamespace(id=None),
+        db=SimpleNamespace(collection=collection, config=SimpleNamespace(dir=db_dir)),
+        embedder=SimpleNamespace(embedding_fn=embedding_fn),
+    ), calls
+
+
+def _source_file(n: int, revision: int = 0) -> str:
+    return "\n\n".join(
+        f"def handler_{n}_{i}(request):\n    return respond(request, {revision}, {i})"
+        for i in range(20)
+    )
+
+
+def bench_sync(file_count=2000, change_ratio=0.01):
+    """Full first sync vs a daily re-sync where ~1% of files changed."""
+    stub = StubGitHub(files={f"src/pkg_{n % 50}/mod_{n}.py": _source_file(n) for n in range(file_count)})
+    db_dir = tempfile.mkdtemp()
+    try:
+        app, calls = _stub_app(db_dir)
+        api = GitHubAPI(base_url=stub.url, cache_dir=Path(db_dir, "http"))
+
+        first = sync_repo(app, stub.repo, api)
+        print(f"initial:   {first.describe()}")
+
+        again = sync_repo(app, stub.repo, api)
+        print(f"no change: {again.describe()}")
+
+        paths = sorted(stub.files)
+        changed = random.sample(paths, max(int(len(paths) * change_ratio), 1))
+        for path in changed[: len(changed) // 2]:
+            stub.files[path] = _source_file(paths.index(path), revision=1)
+        for path in changed[len(changed) // 2:]:
+            del stub.files[path]
+        stub.files["src/new_module.py"] = _source_file(-1)
+        stub.commit()
+
+        resync = sync_repo(app, stub.repo, api)
+        print(f"re-sync:   {resync.describe()}")
+
+        # The store must hold exactly the chunks of the current files.
+        stored = {m["path"] for m in app.db.collection.get(include=["metadatas"])["metadatas"]}
+        assert stored == set(stub.files), "vectors out of sync with the repository"
+        print(f"re-sync fetched {resync.files_fetched} of {len(stub.files)} files, "
+              f"{first.seconds / resync.seconds:.0f}x faster than the initial sync")
+    finally:
+        stub.close()
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+def _git_repo(files: Dict[str, str]) -> str:
+    path = tempfile.mkdtemp()
+    for name, text in files.items():
+        target = Path(path, name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(text)
+    git = ["git", "-C", path, "-c", "user.name=bench", "-c", "user.email=bench@localhost"]
+    subprocess.run([*git, "init", "-q"], check=True)
+    subprocess.run([*git, "add", "-A", "-f"], check=True)
+    subprocess.run([*git, "commit", "-q", "-m", "bench"], check=True)
+    return path
+
+
+def bench_local(file_count=5000):
+    """Initial sync of the same repository from a local clone vs the API."""
+    files = {f"src/pkg_{n % 50}/mod_{n}.py": _source_file(n) for n in range(file_count)}
+    # Content the ignore rules should keep out of the index.
+    files.update({
+        ".gitignore": "*.log\ngenerated/\n",
+        "server.log": "noise",
+        "generated/schema.py": _source_file(-2),
+        "vendor/lib/util.py": _source_file(-3),
+        "package-lock.json": "{}",
+    })
+    checkout = _git_repo(files)
+    # An authenticated hour's budget is 5000 requests; don't wait for a reset.
+    stub = StubGitHub(files=files, rate_limit=(2 * file_count, 3600.0))
+    db_dirs = []
+    try:
+        print(f"{'source':>7} {'files':>6} {'ignored':>7} {'requests':>8} {'seconds':>8}")
+        for name, repo, source in [
+            ("local", checkout, LocalRepo()),
+            ("api", stub.repo, GitHubAPI(base_url=stub.url, cache_dir=Path(checkout, "http"))),
+        ]:
+            db_dirs.append(tempfile.mkdtemp())
+            app, _ = _stub_app(db_dirs[-1])
+            report = sync_repo(app, repo, source)
+            print(f"{name:>7} {report.added:>6} {report.ignored:>7} "
+                  f"{report.requests:>8} {report.seconds:>8.2f}")
+    finally:
+        stub.close()
+        for path in [checkout, *db_dirs]:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def bench_fetch(file_count=1000, latency=0.01, concurrency=(1, 4, 16, 64)):
+    """Files/sec fetching through the API at several concurrency levels."""
+    files = {f"src/mod_{n}.py": _source_file(n) for n in range(file_count)}
+    stub = StubGitHub(files=files, latency=latency)
+    scratch = tempfile.mkdtemp()
+    try:
+        print(f"{file_count} files, {latency * 1000:.0f} ms per request")
+        print(f"{'concurrency':>11} {'files/s':>8} {'requests':>8} {'304s':>5} {'cache hits':>10}")
+        cache_dir = None
+        for workers in concurrency:
+            cache_dir = Path(tempfile.mkdtemp(dir=scratch))
+            app, _ = _stub_app(tempfile.mkdtemp(dir=scratch))
+            api = GitHubAPI(base_url=stub.url, concurrency=workers, cache_dir=cache_dir)
+            report = sync_repo(app, stub.repo, api)
+            print(f"{workers:>11} {report.files_fetched / report.seconds:>8.0f} "
+                  f"{report.requests:>8} {api.stats.not_modified:>5} {api.stats.cache_hits:>10}")
+
+        # A fresh store over a warm cache, as after a restart.
+        app, _ = _stub_app(tempfile.mkdtemp(dir=scratch))
+        api = GitHubAPI(base_url=stub.url, concurrency=concurrency[-1], cache_dir=cache_dir)
+        report = sync_repo(app, stub.repo, api)
+        print(f"{'warm cache':>11} {report.files_fetched / report.seconds:>8.0f} "
+              f"{report.requests:>8} {api.stats.not_modified:>5} {api.stats.cache_hits:>10}")
+    finally:
+        stub.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def bench_rate_limit(file_count=600, limit=200, window=2.0):
+    """A sync that needs several rate-limit windows finishes without errors."""
+    files = {f"src/mod_{n}.py": _source_file(n) for n in range(file_count)}
+    stub = StubGitHub(files=files, rate_limit=(limit, window))
+    scratch = tempfile.mkdtemp()
+    try:
+        app, _ = _stub_app(scratch)
+        api = GitHubAPI(base_url=stub.url, cache_dir=Path(scratch, "http"))
+        report = sync_repo(app, stub.repo, api)
+        print(f"{report.files_fetched} files at {limit} requests per {window:.0f} s: "
+              f"{report.seconds:.1f} s, {api.stats.rate_limit_waits} paced waits "
+              f"({api.stats.rate_limit_seconds:.1f} s summed over fetch threads), "
+              f"{stub.rejected} requests rejected")
+    finally:
+        stub.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _ollama_embedder(model: str = BENCH_EMBED_MODEL):
+    import ollama
+
+    client = ollama.Client(host=OLLAMA_URL)
+
+    def embed(texts):
+        vectors = []
+        for start in range(0, len(texts), 32):
+            vectors += client.embed(model=model, input=texts[start:start + 32])["embeddings"]
+        return vectors
+
+    return embed
+
+
+def _docstring_queries(texts: Dict[str, str]):
+    """(question, path, function) for every documented Python function."""
+    queries = []
+    for path, text in texts.items():
+        if not path.endswith(".py"):
+            continue
+        try:
+            tree = ast.parse(text)
+        except SyntaxError:
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                docstring = ast.get_docstring(node)
+                if docstring:
+                    queries.append((docstring.splitlines()[0], path, node.name))
+    return queries
+
+
+def bench_chunking(repo: str = BENCH_REPO, top_k=3):
+    """Chunk count, embedding time and hit rate: plain text vs syntax-aware."""
+    import numpy as np
+
+    source = LocalRepo()
+    repo = source.normalize(repo)
+    files = _filter(source, repo, source.tree(repo, source.head(repo).tree))
+    texts = {}
+    for path, data in zip(files, dict(source.blobs(repo, files.values())).values()):
+        text = _decode(data)
+        if text is not None:
+            texts[path] = text
+    queries = _docstring_queries(texts)
+    embed = _ollama_embedder()
+    print(f"{repo}: {len(texts)} files, {len(queries)} docstring queries, top-{top_k}")
+    print(f"{'chunker':>7} {'chunks':>7} {'avg tokens':>10} {'chunk s':>8} "
+          f"{'embed s':>8} {'hit rate':>8} {'prompt tokens':>13}")
+    for chunker in ("text", "syntax"):
+        start = time.perf_counter()
+        chunks = [
+            (path, chunk.text)
+            for path, file_chunks in zip(texts, chunk_files(list(texts.items()), chunker=chunker))
+            for chunk in file_chunks
+        ]
+        chunk_seconds = time.perf_counter() - start
+        average = sum(len(text) for _, text in chunks) / len(chunks) / 4
+
+        start = time.perf_counter()
+        vectors = np.array(embed([text for _, text in chunks]), dtype=np.float32)
+        embed_seconds = time.perf_counter() - start
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        questions = np.array(embed([q for q, _, _ in queries]), dtype=np.float32)
+        questions /= np.linalg.norm(questions, axis=1, keepdims=True)
+        hits = 0
+        for (_, path, name), scores in zip(queries, questions @ vectors.T):
+            best = np.argsort(-scores)[:top_k]
+            hits += any(
+                chunks[i][0] == path and f"def {name}(" in chunks[i][1] for i in best
+            )
+        print(f"{chunker:>7} {len(chunks):>7} {average:>10.0f} {chunk_seconds:>8.2f} "
+              f"{embed_seconds:>8.1f} {hits / max(len(queries), 1):>8.0%} "
+              f"{average * top_k:>13.0f}")
+
+
+def bench_namespaces(chunks_per_repo=2000, repo_counts=(1, 8, 32), queries=50):
+    """Querying one selected repo: a shared collection vs one per repo."""
+    client = chromadb.EphemeralClient()
+    rng = random.Random(0)
+
+    def vectors(n):
+        return [[rng.random() for _ in range(EMBED_DIM)] for _ in range(n)]
+
+    def fill(collection, repo):
+        for start in range(0, chunks_per_repo, 1000):
+            count = min(1000, chunks_per_repo - start)
+            collection.add(
+                ids=[f"{repo}:{start + i}" for i in range(count)],
+                embeddings=vectors(count),
+                documents=[f"chunk {start + i} of {repo}" for i in range(count)],
+                metadatas=[{"repo": repo}] * count,
+            )
+
+    question = vectors(1)[0]
+
+    class BenchNamespaces(Namespaces):
+        def _open(self, collection, generation):
+            collection = client.get_or_create_collection(collection)
+            return SimpleNamespace(
+                db=SimpleNamespace(collection=collection, count=collection.count),
+                embedder=SimpleNamespace(embedding_fn=lambda texts: [question] * len(texts)),
+            )
+
+    shared = client.get_or_create_collection("shared")
+    per_repo = BenchNamespaces(tempfile.mkdtemp(), max_open=max(repo_counts))
+    print(f"{chunks_per_repo} chunks per repo, {queries} queries on repo-0 "
+          f"(ms per query)")
+    print(f"{'repos':>6} {'shared + where':>15} {'own collection':>15}")
+    ingested = 0
+    for repo_count in repo_counts:
+        for n in range(ingested, repo_count):
+            fill(shared, f"repo-{n}")
+            fill(per_repo.get(f"repo-{n}").db.collection, f"repo-{n}")
+        ingested = repo_count
+
+        start = time.perf_counter()
+        for _ in range(queries):
+            shared.query(query_embeddings=[question], n_results=3, where={"repo": "repo-0"})
+        shared_ms = (time.perf_counter() - start) / queries * 1000
+
+        start = time.perf_counter()
+        for _ in range(queries):
+            per_repo.retrieve(["repo-0"], "question", 3)
+        own_ms = (time.perf_counter() - start) / queries * 1000
+        print(f"{repo_count:>6} {shared_ms:>15.2f} {own_ms:>15.2f}")
+
+
+def bench_symbols(repo: str = BENCH_REPO, top_k=3):
+    """Symbol index lookups vs the context a vector search would send."""
+    db_dir = tempfile.mkdtemp()
+    try:
+        app, _ = _stub_app(db_dir)
+        source = LocalRepo()
+        report = sync_repo(app, repo, source)
+        repo = source.normalize(repo)
+        path = symbols_path(app, repo)
+        indexes = {repo: SymbolIndex(path)}
+        with closing(sqlite3.connect(path)) as db:
+            names = [name for name, in db.execute("SELECT DISTINCT name FROM definitions")]
+        print(f"{repo}: {report.definitions} definitions, {len(names)} names, "
+              f"{path.stat().st_size / 1024:.0f} KiB on disk")
+
+        timings = {"exact": [], "prefix": [], "question": []}
+        answers = []
+        for name in names:
+            start = time.perf_counter()
+            indexes[repo].definitions(name)
+            timings["exact"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            indexes[repo].complete(name[:3])
+            timings["prefix"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            hits = lookup(indexes, f"Where is `{name}` defined?")
+            answers.append(format_answer(indexes, hits))
+            timings["question"].append(time.perf_counter() - start)
+        print(f"{'lookup':>9} {'p50 ms':>7} {'p99 ms':>7}")
+        for kind, samples in timings.items():
+            samples.sort()
+            print(f"{kind:>9} {samples[len(samples) // 2] * 1000:>7.2f} "
+                  f"{samples[int(len(samples) * 0.99)] * 1000:>7.2f}")
+
+        documents = app.db.collection.get(include=["documents"])["documents"]
+        chunk_tokens = sum(map(estimate_tokens, documents)) / len(documents)
+        answer_tokens = sum(map(estimate_tokens, answers)) / len(answers)
+        print(f"'Where is X' questions: vector search sends ~{chunk_tokens * top_k:.0f} context "
+              f"tokens to the model (top-{top_k}); the index answers in ~{answer_tokens:.0f} "
+              f"tokens with no embedding or model call")
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+def bench_reembed(repo: str = BENCH_REPO, old_model=BENCH_EMBED_MODEL, new_model=EMBED_MODEL):
+    """Embedding with the chat model vs a dedicated model, via the migration."""
+    source = LocalRepo()
+    repo = source.normalize(repo)
+    files = _filter(source, repo, source.tree(repo, source.head(repo).tree))
+    texts = {}
+    for path, data in zip(files, dict(source.blobs(repo, files.values())).values()):
+        text = _decode(data)
+        if text is not None:
+            texts[path] = text
+    chunks = [
+        chunk.text
+        for file_chunks in chunk_files(list(texts.items()), chunker="syntax")
+        for chunk in file_chunks
+    ]
+    data_dir = Path(tempfile.mkdtemp())
+    try:
+        def open_client(generation):
+            return chromadb.PersistentClient(path=str(data_dir / generation.dir))
+
+        before = Generations(data_dir, old_model)
+        collection = open_client(before.target()).get_or_create_collection(
+            "bench", metadata={"hnsw:space": "cosine"}
+        )
+        embed = batched_embedding_fn(old_model, OLLAMA_URL)
+        start = time.perf_counter()
+        for batch in range(0, len(chunks), 64):
+            documents = chunks[batch:batch + 64]
+            collection.add(
+                ids=[hashlib.sha256(d.encode()).hexdigest() for d in documents],
+                embeddings=embed(documents),
+                documents=documents,
+            )
+        seconds = time.perf_counter() - start
+        before._activate(before.target())
+        dimensions = len(embed(["x"])[0])
+        print(f"{old_model}: {len(chunks)} chunks, {len(chunks) / seconds:.0f} embeddings/s, "
+              f"{dimensions} dims, {dir_size(data_dir / before.target().dir) / 2**20:.1f} MB")
+
+        after = Generations(data_dir, new_model)
+        progress = after.migrate(open_client, batched_embedding_fn(new_model, OLLAMA_URL))
+        dimensions = len(batched_embedding_fn(new_model, OLLAMA_URL)(["x"])[0])
+        print(f"{new_model}: {dimensions} dims; {progress.describe()}")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+BENCHMARKS = {
+    "sync": bench_sync,
+    "local": bench_local,
+    "fetch": bench_fetch,
+    "rate-limit": bench_rate_limit,
+    "chunking": bench_chunking,
+    "namespaces": bench_namespaces,
+    "symbols": bench_symbols,
+    "reembed": bench_reembed,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or ["sync"]:
+        BENCHMARKS[name]()
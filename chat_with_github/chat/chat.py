@@ -1,12 +1,15 @@
 import reflex as rx
 from typing import List
 from dataclasses import dataclass
-import tempfile
 import asyncio
 import os
-from embedchain import App
-from embedchain.loaders.github import GithubLoader
-import asyncio
+
+from chat.github_api import github_api
+from chat.local_repo import LocalRepo, check_local_repo, is_local_repo
+from chat.namespaces import namespaces
+from chat.scheduler import scheduler
+from chat.streaming import StreamStats, stream_in_thread
+from chat.symbols import LookupStats
 
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 
@@ -53,42 +56,25 @@ class State(rx.State):
     chats: List[List[QA]] = [[]]
     current_chat: int = 0
     processing: bool = False
-    db_path: str = tempfile.mkdtemp()
     upload_status: str = ""
     is_loading: bool = False
     repo: str = ""
-
-    _app_instance = None
-
-    def get_app(self):
-        """Get or create the app instance."""
-        if State._app_instance is None:
-            State._app_instance = App.from_config(
-                config={
-                    "llm": {
-                        "provider": "ollama",
-                        "config": {
-                            "model": "llama3:instruct",
-                            "max_tokens": 250,
-                            "temperature": 0.5,
-                            "stream": True,
-                            "base_url": "http://localhost:11434",
-                        },
-                    },
-                    "vectordb": {"provider": "chroma", "config": {"dir": self.db_path}},
-                    "embedder": {
-                        "provider": "ollama",
-                        "config": {
-                            "model": "llama3:instruct",
-                            "base_url": "http://localhost:11434",
-                        },
-                    },
-                }
-            )
-        return State._app_instance
+    first_token_ms: int = 0
+    queue_position: int = 0
+    lookup_status: str = ""
+    # Repositories this session asks questions about.
+    repos: List[str] = []
 
     def get_loader(self):
-        return GithubLoader(config={"token": GITHUB_TOKEN})
+        """Read a local clone from disk; anything else comes from the GitHub API."""
+        if is_local_repo(self.repo):
+            check_local_repo(self.repo)
+            return LocalRepo()
+        return github_api(GITHUB_TOKEN)
+
+    def _session(self) -> str:
+        """Token identifying this browser session to the generation scheduler."""
+        return self.router.session.client_token
 
     @rx.event(background=True)
     async def process_question(self, form_data: dict):
@@ -101,18 +87,54 @@ class State(rx.State):
         async with self:
             self.processing = True
             self.chats[self.current_chat].append(QA(question=question, answer=""))
-            yield
-            await asyncio.sleep(1)
+            chat_index = self.current_chat
+            repos = list(self.repos)
+            self.lookup_status = ""
 
-        app = self.get_app()
-        answer = app.chat(question)
+        if not repos:
+            async with self:
+                self.chats[chat_index][-1].answer = "Process a repository first."
+                self.chats = self.chats
+                self.processing = False
+            return
 
-        async with self:
-            self.chats[self.current_chat][-1].answer = answer
-            self.processing = False
-            self.chats = self.chats
-            yield
-            await asyncio.sleep(1)
+        stats = StreamStats()
+        lookup_stats = LookupStats()
+        answer = ""
+        # Wait our turn for Ollama; sessions are served round-robin.
+        ticket = scheduler.submit(self._session())
+        try:
+            while not await ticket.wait(timeout=0.5):
+                async with self:
+                    self.queue_position = ticket.position
+            async with self:
+                self.queue_position = 0
+            async for delta in stream_in_thread(
+                namespaces.stream_answer, repos, question, lookup_stats, stats=stats
+            ):
+                answer += delta
+                async with self:
+                    self.chats[chat_index][-1].answer = answer
+                    self.chats = self.chats
+                    self.first_token_ms = stats.ttft_ms
+                    self.lookup_status = lookup_stats.describe()
+        except asyncio.CancelledError:
+            if not ticket.cancelled:
+                raise
+            answer += "\n\n_Stopped._"
+        except Exception as e:
+            answer += f"\n\nError: {e}"
+        finally:
+            ticket.release()
+            async with self:
+                self.chats[chat_index][-1].answer = answer
+                self.chats = self.chats
+                self.queue_position = 0
+                self.processing = False
+
+    def stop_generation(self):
+        """Cancel this session's queued or in-flight answer and free its slot."""
+        scheduler.cancel(self._session())
 
     @rx.event(background=True)
     async def handle_repo_input(self):
@@ -126,12 +148,17 @@ class State(rx.State):
             await asyncio.sleep(1)
 
         try:
-            app = self.get_app()
             loader = self.get_loader()
-            app.add(f"repo:{self.repo} type:repo", data_type="github", loader=loader)
+            repo = loader.normalize(self.repo)
+            # Each repository has a collection of its own. Only files whose
+            # blobs changed since the last sync are fetched and embedded;
+            # the sync runs on a worker thread.
+            report = await asyncio.to_thread(namespaces.sync, repo, loader)
 
             async with self:
-                self.upload_status = f"Added {self.repo} to knowledge base!"
+                self.upload_status = report.describe()
+                if repo not in self.repos:
+                    self.repos.append(repo)
                 yield
         except Exception as e:
             async with self:
@@ -146,6 +173,10 @@ class State(rx.State):
         """Update the repo"""
         self.repo = repo
 
+    def remove_repo(self, repo: str):
+        """Stop searching `repo` in this session; its vectors are kept."""
+        self.repos = [r for r in self.repos if r != repo]
+
 
 def message(qa: QA) -> rx.Component:
     """A single question/answer message."""
@@ -215,6 +246,16 @@ def action_bar() -> rx.Component:
                         variant="surface",
                         cursor="pointer",
                     ),
+                    rx.cond(
+                        State.processing,
+                        rx.button(
+                            "Stop",
+                            type_="button",
+                            on_click=State.stop_generation,
+                            variant="outline",
+                            cursor="pointer",
+                        ),
+                    ),
                     align_items="center",
                     spacing="3",
                 ),
@@ -222,6 +263,26 @@ def action_bar() -> rx.Component:
                 width="100%",
                 reset_on_submit=True,
             ),
+            rx.cond(
+                State.queue_position > 0,
+                rx.text(
+                    "Waiting for the model: number ", State.queue_position, " in the queue",
+                    size="1",
+                    color=rx.color("slate", 10),
+                ),
+            ),
+            rx.cond(
+                State.lookup_status != "",
+                rx.text(State.lookup_status, size="1", color=rx.color("slate", 10)),
+            ),
+            rx.cond(
+                State.first_token_ms > 0,
+                rx.text(
+                    "First token in ", State.first_token_ms, " ms",
+                    size="1",
+                    color=rx.color("slate", 10),
+                ),
+            ),
             align_items="center",
             width="100%",
         ),
@@ -237,6 +298,16 @@ def action_bar() -> rx.Component:
     )
 
 
+def repo_badge(repo: str) -> rx.Component:
+    """A selected repository, with a button to leave it out of answers."""
+    return rx.badge(
+        repo,
+        rx.icon("x", size=12, cursor="pointer", on_click=State.remove_repo(repo)),
+        variant="surface",
+        size="1",
+    )
+
+
 def nav_icon(component: rx.Component) -> rx.badge:
     return rx.badge(
         component,
@@ -342,6 +413,13 @@ def index():
                 variant="surface",
                 cursor="pointer",
             ),
+            rx.hstack(
+                rx.foreach(State.repos, repo_badge),
+                wrap="wrap",
+                spacing="2",
+                width="100%",
+                padding_top="0.5em",
+            ),
             rx.divider(height="2em", opacity="0"),
             rx.vstack(
                 rx.text(State.upload_status, size="1", align="center", width="100%"),
@@ -0,0 +1,221 @@
+import ast
+import io
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple, TypeVar
+
+# Splitting is CPU bound, so large batches are chunked in worker processes.
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", str(os.cpu_count() or 1)))
+# Below this many files the pool's overhead outweighs the parallelism.
+MIN_PARALLEL_FILES = 32
+# "syntax" cuts code on definitions; "text" is embedchain's plain splitter.
+REPO_CHUNKER = os.getenv("REPO_CHUNKER", "syntax")
+# Small units are packed together up to roughly this many tokens.
+CHUNK_TOKEN_BUDGET = int(os.getenv("CHUNK_TOKEN_BUDGET", "384"))
+
+# Start of a top-level definition in the usual brace and indent languages.
+DEFINITION = re.compile(
+    r"^(?:export\s+)?(?:default\s+)?(?:pub(?:\(\w+\))?\s+)?(?:public\s+|private\s+|protected\s+)?"
+    r"(?:static\s+)?(?:async\s+)?(?:abstract\s+)?"
+    r"(?:function\*?|class|def|func|fn|impl|struct|enum|trait|interface|type|module|object)\s+"
+    r"(?:\([^)]*\)\s*)?([A-Za-z_$][\w$]*)"
+)
+_HEADING = re.compile(r"^#{1,6}\s+(.+)")
+_MARKUP = (".md", ".rst", ".txt")
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+_splitter = None
+
+
+@dataclass
+class Chunk:
+    """A piece of one file, with the lines and symbols it covers."""
+    text: str
+    start_line: int
+    end_line: int
+    symbols: List[str] = field(default_factory=list)
+
+    def metadata(self) -> dict:
+        # Chroma metadata values must be scalars.
+        return {
+            "start_line": self.start_line,
+            "end_line": self.end_line,
+            "symbols": ",".join(self.symbols),
+        }
+
+
+# A unit is a run of lines [start, end] that should stay together.
+Unit = Tuple[int, int, List[str]]
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # Forking a server that is running threads is unsafe; spawn instead.
+            pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pools[workers] = pool
+        return pool
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for code and English alike.
+    return len(text) // 4 + 1
+
+
+def split_text(text: str) -> List[str]:
+    """embedchain's text chunking, with the splitter built once per process."""
+    global _splitter
+    if _splitter is None:
+        from embedchain.chunkers.text import TextChunker
+
+        _splitter = TextChunker().text_splitter
+    return _splitter.split_text(text)
+
+
+def _python_units(text: str, lines: List[str], budget: int) -> List[Unit]:
+    """One unit per top-level statement; oversized classes split per method.
+
+    Each unit starts right after the previous one ends, so comments and
+    blank lines travel with the definition that follows them.
+    """
+    units: List[Unit] = []
+    cursor = 1
+    for node in ast.parse(text).body:
+        end = node.end_lineno
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            units.append((cursor, end, [node.name]))
+        elif isinstance(node, ast.ClassDef):
+            if estimate_tokens("".join(lines[cursor - 1:end])) <= budget:
+                units.append((cursor, end, [node.name]))
+            else:
+                start = cursor
+                for child in node.body:
+                    if not isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        continue
+                    first = min([d.lineno for d in child.decorator_list] + [child.lineno])
+                    if first > start:
+                        # The class header, attributes or code between methods.
+                        units.append((start, first - 1, [node.name]))
+                    units.append((first, child.end_lineno, [f"{node.name}.{child.name}"]))
+                    start = child.end_lineno + 1
+                if start <= end:
+                    units.append((start, end, [node.name]))
+        else:
+            units.append((cursor, end, []))
+        cursor = end + 1
+    if units and cursor <= len(lines):
+        start, _, symbols = units[-1]
+        units[-1] = (start, len(lines), symbols)
+    return units
+
+
+def _heuristic_units(path: str, lines: List[str]) -> List[Unit]:
+    """Cut before top-level definitions (or headings, for markup)."""
+    markup = path.lower().endswith(_MARKUP)
+    boundaries: List[Tuple[int, List[str]]] = [(1, [])]
+    for number, line in enumerate(lines, 1):
+        match = (_HEADING if markup else DEFINITION).match(line)
+        if match and number > 1:
+            boundaries.append((number, [match.group(1).strip()]))
+        elif match:
+            boundaries[0] = (1, [match.group(1).strip()])
+    units = []
+    for i, (start, symbols) in enumerate(boundaries):
+        end = boundaries[i + 1][0] - 1 if i + 1 < len(boundaries) else len(lines)
+        units.append((start, end, symbols))
+    return units
+
+
+def _pack(path: str, lines: List[str], units: List[Unit], budget: int) -> List[Chunk]:
+    """Merge neighbouring units up to `budget`; split units that exceed it."""
+    chunks: List[Chunk] = []
+    current: List[Unit] = []
+    size = 0
+
+    def emit():
+        nonlocal size
+        if current:
+            start, end = current[0][0], current[-1][1]
+            symbols = list(dict.fromkeys(s for unit in current for s in unit[2]))
+            body = "".join(lines[start - 1:end])
+            if body.strip():
+                chunks.append(Chunk(f"# {path}\n{body}", start, end, symbols))
+        current.clear()
+        size = 0
+
+    for unit in units:
+        start, end, symbols = unit
+        tokens = estimate_tokens("".join(lines[start - 1:end]))
+        if tokens > budget:
+            emit()
+            # Too big to keep whole: cut on line boundaries, same symbols.
+            window_start, window_size = start, 0
+            for number in range(start, end + 1):
+                line_tokens = estimate_tokens(lines[number - 1])
+                if window_size and window_size + line_tokens > budget:
+                    current.append((window_start, number - 1, symbols))
+                    emit()
+                    window_start, window_size = number, 0
+                window_size += line_tokens
+            current.append((window_start, end, symbols))
+            emit()
+            continue
+        if size and size + tokens > budget:
+            emit()
+        current.append(unit)
+        size += tokens
+    emit()
+    return chunks
+
+
+def chunk_file(path: str, text: str, chunker: str = REPO_CHUNKER,
+               budget: int = CHUNK_TOKEN_BUDGET) -> List[Chunk]:
+    """Chunks of one file, cut on syntax where possible."""
+    if chunker == "text":
+        return [Chunk(piece, 0, 0) for piece in split_text(text)]
+    # Split on "\n" only, so line numbers agree with the ast module's.
+    lines = io.StringIO(text).readlines()
+    if not lines:
+        return []
+    units = None
+    if path.endswith(".py"):
+        try:
+            units = _python_units(text, lines, budget)
+        except (SyntaxError, ValueError):
+            units = None
+    if not units:
+        units = _heuristic_units(path, lines)
+    return _pack(path, lines, units, budget)
+
+
+def _chunk_one(item: Tuple[str, str, str, int]) -> List[Chunk]:
+    return chunk_file(*item)
+
+
+def map_files(fn: Callable[[T], R], items: List[T], workers: int = CHUNK_WORKERS) -> List[R]:
+    """`fn` of each item, in order, spread over `workers` processes for large batches.
+
+    `fn` must be a module-level function, since it runs in spawned workers.
+    """
+    if workers <= 1 or len(items) < MIN_PARALLEL_FILES:
+        return [fn(item) for item in items]
+    chunksize = max(len(items) // (workers * 4), 1)
+    return list(_pool(workers).map(fn, items, chunksize=chunksize))
+
+
+def chunk_files(files: List[Tuple[str, str]], workers: int = CHUNK_WORKERS,
+                chunker: str = REPO_CHUNKER, budget: int = CHUNK_TOKEN_BUDGET) -> List[List[Chunk]]:
+    """Chunks for each (path, text), in order, spread over `workers` processes."""
+    items = [(path, text, chunker, budget) for path, text in files]
+    return map_files(_chunk_one, items, workers)
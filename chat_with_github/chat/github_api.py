@@ -0,0 +1,255 @@
+import base64
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from chat.http_cache import GITHUB_CACHE_DIR, CachedResponse, HttpCache, token_scope
+
+# Point at a stand-in server for offline runs and benchmarks.
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+# Larger files are usually generated or vendored; they are not indexed.
+MAX_FILE_BYTES = int(os.getenv("GITHUB_MAX_FILE_BYTES", str(512 * 1024)))
+# Requests in flight at once; also the size of the keep-alive pool.
+FETCH_CONCURRENCY = int(os.getenv("GITHUB_FETCH_CONCURRENCY", "16"))
+# Below this share of the hourly budget, requests are spread out until reset.
+RATE_LIMIT_RESERVE = float(os.getenv("GITHUB_RATE_LIMIT_RESERVE", "0.1"))
+MAX_RETRIES = 3
+
+# Trees and blobs are addressed by content, so a cached copy never goes stale.
+_IMMUTABLE = re.compile(r"/git/(trees|blobs)/[0-9a-f]{40}$")
+
+class GitHubError(Exception):
+    """A GitHub API request failed."""
+
+
+@dataclass
+class Commit:
+    sha: str
+    tree: str
+
+
+@dataclass
+class FetchStats:
+    requests: int = 0
+    not_modified: int = 0
+    cache_hits: int = 0
+    rate_limit_waits: int = 0
+    rate_limit_seconds: float = 0.0
+
+
+class RateLimiter:
+    """Token bucket paced by GitHub's X-RateLimit-* headers.
+
+    While plenty of the budget is left requests go out unpaced. Below
+    `reserve` of the limit the bucket refills just fast enough to spread what
+    remains until the window resets, and at zero everything waits for reset.
+    """
+
+    def __init__(self, reserve: float = RATE_LIMIT_RESERVE, burst: int = FETCH_CONCURRENCY):
+        self.reserve = reserve
+        self.burst = burst
+        self.rate: Optional[float] = None
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def _delay(self) -> float:
+        """Seconds to wait before a request may go out; 0 takes a token."""
+        delay = self.resume_at - time.time()
+        if delay <= 0 and self.rate is not None:
+            now = time.monotonic()
+            self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+            self.updated = now
+            if self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+            else:
+                self.tokens -= 1
+        return max(delay, 0.0)
+
+    def acquire(self, stats: FetchStats):
+        while True:
+            with self._lock:
+                delay = self._delay()
+                if delay == 0:
+                    return
+                stats.rate_limit_waits += 1
+                stats.rate_limit_seconds += delay
+            time.sleep(delay)
+
+    def update(self, headers):
+        try:
+            limit = int(headers["x-ratelimit-limit"])
+            remaining = int(headers["x-ratelimit-remaining"])
+            reset = float(headers["x-ratelimit-reset"])
+        except (KeyError, ValueError):
+            return
+        with self._lock:
+            if remaining == 0:
+                self.resume_at = max(self.resume_at, reset)
+            elif remaining > limit * self.reserve:
+                self.rate = None
+            else:
+                if self.rate is None:
+                    self.tokens = 0.0
+                    self.updated = time.monotonic()
+                self.rate = remaining / max(reset - time.time(), 1.0)
+
+    def backoff(self, seconds: float):
+        """Hold every request for `seconds`, e.g. after a secondary rate limit."""
+        with self._lock:
+            self.resume_at = max(self.resume_at, time.time() + seconds)
+
+
+class GitHubAPI:
+    """The handful of REST calls a repository sync needs.
+
+    Files are addressed by blob SHA, so unchanged files can be recognised
+    from the tree listing alone without downloading them. Blobs are fetched
+    `concurrency` at a time over a pool of keep-alive connections, and
+    responses are cached on disk with their ETag/Last-Modified so repeat
+    requests come back as 304s.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        base_url: str = GITHUB_API_URL,
+        concurrency: int = FETCH_CONCURRENCY,
+        cache_dir: Path = GITHUB_CACHE_DIR,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = max(concurrency, 1)
+        self.session = requests.Session()
+        # One pooled connection per fetch thread, reused across requests.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept"] = "application/vnd.github+json"
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        self.cache = HttpCache(cache_dir, scope=token_scope(token))
+        self.limiter = RateLimiter(burst=self.concurrency)
+        self.stats = FetchStats()
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="github-fetch"
+        )
+
+    @property
+    def requests(self) -> int:
+        return self.stats.requests
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            setattr(self.stats, name, getattr(self.stats, name) + 1)
+
+    def _get(self, path: str, **params) -> dict:
+        url = f"{self.base_url}{path}"
+        if params:
+            url += "?" + "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+        cached = self.cache.get(url)
+        if cached is not None and _IMMUTABLE.search(path):
+            self._count("cache_hits")
+            return json.loads(cached.body)
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        for _ in range(MAX_RETRIES + 1):
+            self.limiter.acquire(self.stats)
+            self._count("requests")
+            response = self.session.get(url, headers=headers, timeout=30)
+            self.limiter.update(response.headers)
+            if response.status_code in (403, 429) and (
+                response.headers.get("x-ratelimit-remaining") == "0"
+                or "retry-after" in response.headers
+            ):
+                # Rate limited: wait as told, then try again.
+                if "retry-after" in response.headers:
+                    self.limiter.backoff(float(response.headers["retry-after"]))
+                continue
+            break
+        if response.status_code == 304 and cached is not None:
+            self._count("not_modified")
+            return json.loads(cached.body)
+        if response.status_code != 200:
+            raise GitHubError(f"GET {path}: {response.status_code} {response.text[:200]}")
+        etag = response.headers.get("etag", "")
+        last_modified = response.headers.get("last-modified", "")
+        if etag or last_modified or _IMMUTABLE.search(path):
+            self.cache.put(url, CachedResponse(response.text, etag, last_modified))
+        return response.json()
+
+    @staticmethod
+    def normalize(repo: str) -> str:
+        """`owner/name` from either that form or a GitHub URL."""
+        repo = re.sub(r"^(https?://)?(www\.)?github\.com/", "", repo.strip())
+        return repo.removesuffix(".git").strip("/")
+
+    def head(self, repo: str, ref: Optional[str] = None) -> Commit:
+        """The commit at `ref`, or at the tip of the default branch."""
+        if ref is None:
+            ref = self._get(f"/repos/{repo}")["default_branch"]
+        commit = self._get(f"/repos/{repo}/commits/{ref}")
+        return Commit(sha=commit["sha"], tree=commit["commit"]["tree"]["sha"])
+
+    def tree(self, repo: str, tree_sha: str, max_size: int = MAX_FILE_BYTES) -> Dict[str, str]:
+        """Map every indexable file path in the tree to its blob SHA."""
+        listing = self._get(f"/repos/{repo}/git/trees/{tree_sha}", recursive="1")
+        files: Dict[str, str] = {}
+        if listing.get("truncated"):
+            # Recursive listings are capped; walk the tree a level at a time.
+            self._walk(repo, tree_sha, "", max_size, files)
+            return files
+        for entry in listing["tree"]:
+            if entry["type"] == "blob" and entry.get("size", 0) <= max_size:
+                files[entry["path"]] = entry["sha"]
+        return files
+
+    def _walk(self, repo: str, tree_sha: str, prefix: str, max_size: int, files: Dict[str, str]):
+        for entry in self._get(f"/repos/{repo}/git/trees/{tree_sha}")["tree"]:
+            path = prefix + entry["path"]
+            if entry["type"] == "tree":
+                self._walk(repo, entry["sha"], path + "/", max_size, files)
+            elif entry["type"] == "blob" and entry.get("size", 0) <= max_size:
+                files[path] = entry["sha"]
+
+    def blob(self, repo: str, blob_sha: str) -> bytes:
+        data = self._get(f"/repos/{repo}/git/blobs/{blob_sha}")
+        if data.get("encoding") == "base64":
+            return base64.b64decode(data["content"])
+        return data["content"].encode()
+
+    def blobs(self, repo: str, shas: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        """Fetch blobs `concurrency` at a time, yielding them in order."""
+        shas = list(dict.fromkeys(shas))
+        yield from zip(shas, self._executor.map(lambda sha: self.blob(repo, sha), shas))
+
+    def url(self, repo: str, commit: str, path: str) -> str:
+        return f"https://github.com/{repo}/blob/{commit}/{path}"
+
+
+_apis: Dict[Tuple[Optional[str], str], GitHubAPI] = {}
+_apis_lock = threading.Lock()
+
+
+def github_api(token: Optional[str] = None, base_url: str = GITHUB_API_URL) -> GitHubAPI:
+    """The process-wide client for `token`, so syncs share its pool and limits."""
+    with _apis_lock:
+        api = _apis.get((token, base_url))
+        if api is None:
+            api = _apis[(token, base_url)] = GitHubAPI(token=token, base_url=base_url)
+        return api
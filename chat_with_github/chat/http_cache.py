@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+# Responses are kept across restarts so re-ingesting costs 304s, not downloads.
+GITHUB_CACHE_DIR = Path(
+    os.getenv("GITHUB_CACHE_DIR", Path.home() / ".cache" / "chat_with_github" / "http")
+)
+# The cache is trimmed back to this size, least recently used entries first.
+GITHUB_CACHE_MAX_MB = float(os.getenv("GITHUB_CACHE_MAX_MB", "1024"))
+# Entries unused for this many seconds are dropped.
+GITHUB_CACHE_MAX_AGE = float(os.getenv("GITHUB_CACHE_MAX_AGE", str(30 * 24 * 60 * 60)))
+# Writes between two trims of the cache directory.
+PRUNE_EVERY = 1000
+
+
+@dataclass
+class CachedResponse:
+    body: str
+    etag: str = ""
+    last_modified: str = ""
+
+
+def token_scope(token: Optional[str]) -> str:
+    """Fingerprint of a token, so responses are only served to the token that fetched them."""
+    return hashlib.sha256(token.encode()).hexdigest()[:16] if token else ""
+
+
+class HttpCache:
+    """On-disk store of response bodies with their validators, keyed by URL.
+
+    Keys include `scope`, so what one token could read is never served to
+    another. An entry's mtime records its last use; `prune` drops entries
+    older than `max_age` and then the least recently used ones beyond
+    `max_bytes`, and runs every PRUNE_EVERY writes.
+    """
+
+    def __init__(self, directory: Path = GITHUB_CACHE_DIR, scope: str = "",
+                 max_bytes: int = int(GITHUB_CACHE_MAX_MB * 1024 * 1024),
+                 max_age: float = GITHUB_CACHE_MAX_AGE):
+        self.directory = Path(directory)
+        self.scope = scope
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    def _path(self, url: str) -> Path:
+        key = hashlib.sha256(f"{self.scope}\n{url}".encode()).hexdigest()
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        path = self._path(url)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                return None
+            cached = CachedResponse(**json.loads(path.read_text()))
+            os.utime(path)
+        except (OSError, ValueError, TypeError):
+            return None
+        return cached
+
+    def put(self, url: str, response: CachedResponse):
+        path = self._path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(response.__dict__))
+        os.replace(tmp, path)
+        with self._lock:
+            self._puts += 1
+            due = self._puts % PRUNE_EVERY == 1
+        if due:
+            self.prune()
+
+    def prune(self) -> int:
+        """Trim the cache to `max_age` and `max_bytes`; returns the entries removed."""
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(reverse=True)
+        cutoff = time.time() - self.max_age
+        total = removed = 0
+        for mtime, size, path in entries:
+            total += size
+            if mtime < cutoff or total > self.max_bytes:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
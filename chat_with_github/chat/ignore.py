@@ -0,0 +1,95 @@
+import os
+import posixpath
+import re
+from typing import Dict, Iterable, List, Pattern, Tuple
+
+# Vendored trees, lockfiles and binary formats add noise and no answers.
+DEFAULT_IGNORE = [
+    "vendor/", "third_party/", "node_modules/", "dist/", "build/", ".git/",
+    "*.min.js", "*.map", "*.lock", "package-lock.json", "pnpm-lock.yaml", "go.sum",
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.ico", "*.svg", "*.pdf",
+    "*.zip", "*.gz", "*.tar", "*.jar", "*.whl", "*.so", "*.dylib", "*.dll", "*.exe",
+    "*.pyc", "*.bin", "*.woff", "*.woff2", "*.ttf", "*.mp3", "*.mp4",
+]
+# Extra gitignore-style patterns, comma separated.
+EXTRA_IGNORE = [p.strip() for p in os.getenv("REPO_IGNORE", "").split(",") if p.strip()]
+
+
+def _translate(pattern: str) -> str:
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            out.append("[" + pattern[i + 1:end].replace("!", "^", 1) + "]")
+            i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+def _compile(line: str, base: str):
+    """(regex, negated) for one gitignore line relative to `base`, or None."""
+    line = line.rstrip()
+    if not line or line.startswith("#"):
+        return None
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    anchored = "/" in line
+    line = line.lstrip("/")
+    prefix = re.escape(base + "/") if base else ""
+    if not anchored:
+        prefix += "(?:.*/)?"
+    # A directory pattern matches everything below it.
+    suffix = "/.*" if dir_only else "(?:/.*)?"
+    return re.compile(f"^{prefix}{_translate(line)}{suffix}$"), negated
+
+
+class IgnoreRules:
+    """gitignore-style path filter; like git, the last matching rule wins."""
+
+    def __init__(self, rules: List[Tuple[Pattern, bool]]):
+        self.rules = rules
+
+    @classmethod
+    def build(cls, gitignores: Dict[str, str] = None, extra: Iterable[str] = ()) -> "IgnoreRules":
+        """Rules from .gitignore files (path -> contents) plus repo-wide patterns."""
+        rules = []
+        for line in [*DEFAULT_IGNORE, *EXTRA_IGNORE, *extra]:
+            rule = _compile(line, "")
+            if rule is not None:
+                rules.append(rule)
+        # Deeper .gitignore files override shallower ones.
+        for path in sorted(gitignores or {}, key=lambda p: p.count("/")):
+            base = posixpath.dirname(path)
+            for line in gitignores[path].splitlines():
+                rule = _compile(line, base)
+                if rule is not None:
+                    rules.append(rule)
+        return cls(rules)
+
+    def ignored(self, path: str) -> bool:
+        result = False
+        for regex, negated in self.rules:
+            if regex.match(path):
+                result = not negated
+        return result
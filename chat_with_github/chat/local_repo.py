@@ -0,0 +1,112 @@
+import os
+import subprocess
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from chat.github_api import MAX_FILE_BYTES, Commit
+
+# Directory local checkouts may be ingested from. Unset, only GitHub
+# repositories can be added.
+LOCAL_REPO_ROOT = os.getenv("LOCAL_REPO_ROOT", "")
+
+
+class LocalRepoError(Exception):
+    """A git command against a local repository failed."""
+
+
+def is_local_repo(repo: str) -> bool:
+    """True if `repo` names a local clone or bare repository."""
+    path = Path(repo).expanduser()
+    return path.is_dir() and ((path / ".git").exists() or (path / "HEAD").is_file())
+
+
+def check_local_repo(repo: str, root: str = LOCAL_REPO_ROOT):
+    """Raise LocalRepoError unless `repo` resolves to a path inside `root`.
+
+    Symlinks and `..` are resolved first, so neither can reach outside it.
+    """
+    if not root:
+        raise LocalRepoError("Local repositories are disabled; set LOCAL_REPO_ROOT to allow them")
+    path = Path(repo).expanduser().resolve()
+    if not path.is_relative_to(Path(root).expanduser().resolve()):
+        raise LocalRepoError(f"{repo} is outside LOCAL_REPO_ROOT")
+
+
+class LocalRepo:
+    """Reads a clone or bare repository straight from its object store.
+
+    Same interface as GitHubAPI, with `repo` being the repository path, so
+    the sync works offline without a token, HTTP round-trips or rate limits.
+    Blobs are streamed in bulk through one `git cat-file --batch` process.
+    """
+
+    def __init__(self):
+        self.requests = 0
+
+    @staticmethod
+    def normalize(repo: str) -> str:
+        return str(Path(repo).expanduser().resolve())
+
+    def _git(self, repo: str, *args: str) -> bytes:
+        self.requests += 1
+        result = subprocess.run(["git", "-C", repo, *args], capture_output=True)
+        if result.returncode != 0:
+            raise LocalRepoError(result.stderr.decode(errors="replace").strip())
+        return result.stdout
+
+    def head(self, repo: str, ref: Optional[str] = None) -> Commit:
+        ref = ref or "HEAD"
+        sha, tree = self._git(repo, "rev-parse", f"{ref}^{{commit}}", f"{ref}^{{tree}}").split()
+        return Commit(sha=sha.decode(), tree=tree.decode())
+
+    def tree(self, repo: str, tree_sha: str, max_size: int = MAX_FILE_BYTES) -> Dict[str, str]:
+        files: Dict[str, str] = {}
+        listing = self._git(repo, "ls-tree", "-r", "-l", "-z", tree_sha)
+        for entry in listing.split(b"\0"):
+            if not entry:
+                continue
+            info, path = entry.split(b"\t", 1)
+            _, kind, sha, size = info.split()
+            # Submodules appear as commits and symlinks have no useful text.
+            if kind == b"blob" and not info.startswith(b"120000") and int(size) <= max_size:
+                files[path.decode(errors="surrogateescape")] = sha.decode()
+        return files
+
+    def blobs(self, repo: str, shas: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        shas = list(dict.fromkeys(shas))
+        if not shas:
+            return
+        self.requests += 1
+        process = subprocess.Popen(
+            ["git", "-C", repo, "cat-file", "--batch"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+
+        def write():
+            # A separate writer keeps both pipes flowing for large batches.
+            try:
+                process.stdin.write("".join(f"{sha}\n" for sha in shas).encode())
+                process.stdin.close()
+            except (BrokenPipeError, ValueError):
+                # The reader gave up early and closed the pipes.
+                pass
+
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+        try:
+            for sha in shas:
+                header = process.stdout.readline().split()
+                if len(header) != 3:
+                    raise LocalRepoError(f"cannot read blob {sha}")
+                data = process.stdout.read(int(header[2]))
+                process.stdout.read(1)
+                yield sha, data
+        finally:
+            process.stdout.close()
+            process.kill()
+            process.wait()
+            writer.join()
+
+    def url(self, repo: str, commit: str, path: str) -> str:
+        return f"file://{repo}/{path}"
@@ -0,0 +1,238 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from embedchain import App
+
+from chat.chunking import estimate_tokens
+from chat.reembed import EMBED_MODEL, Generation, Generations, batched_embedding_fn
+from chat.streaming import remember, stream_prompt
+from chat.symbols import Definition, LookupStats, SymbolIndex, asks_location, format_answer, lookup
+from chat.sync import SyncReport, sync_repo, symbols_path
+
+# Where each repository's vectors and sync manifest are kept between restarts.
+DATA_DIR = Path(os.getenv("REPO_DATA_DIR", "repo_data"))
+# Repositories whose App is kept open; the least recently used is dropped.
+MAX_OPEN_NAMESPACES = int(os.getenv("MAX_OPEN_NAMESPACES", "8"))
+# Chroma unloads the indexes of idle collections beyond this much memory.
+NAMESPACE_MEMORY_LIMIT_MB = int(os.getenv("NAMESPACE_MEMORY_LIMIT_MB", "1024"))
+
+OLLAMA_URL = "http://localhost:11434"
+MODEL = "llama3:instruct"
+# Placeholder collection opened just to reach a generation's Chroma client.
+_ANY_COLLECTION = "repo-migration"
+
+
+def collection_name(repo: str) -> str:
+    """A valid Chroma collection name for `repo`, readable and collision-free."""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", repo).strip("-_")[-40:]
+    return f"repo-{slug}-{hashlib.sha1(repo.encode()).hexdigest()[:12]}"
+
+
+def _config(collection: str, data_dir: Path, embed_model: str) -> dict:
+    return {
+        "llm": {
+            "provider": "ollama",
+            "config": {
+                "model": MODEL,
+                "max_tokens": 250,
+                "temperature": 0.5,
+                "stream": True,
+                "base_url": OLLAMA_URL,
+            },
+        },
+        "vectordb": {
+            "provider": "chroma",
+            "config": {
+                "dir": str(data_dir),
+                "collection_name": collection,
+                # Every namespace shares one Chroma system, which keeps only
+                # recently queried collections' indexes in memory.
+                "chroma_settings": {
+                    "chroma_segment_cache_policy": "LRU",
+                    "chroma_memory_limit_bytes": NAMESPACE_MEMORY_LIMIT_MB * 1024 * 1024,
+                },
+            },
+        },
+        "embedder": {
+            "provider": "ollama",
+            "config": {"model": embed_model, "base_url": OLLAMA_URL},
+        },
+    }
+
+
+class Namespaces:
+    """One embedchain App, and Chroma collection, per repository.
+
+    Queries only touch the collections of the repositories they name, so
+    their cost follows what a session selected rather than everything ever
+    ingested. Apps are opened on first use and the least recently used ones
+    are closed beyond `max_open`; their vectors stay on disk.
+
+    Vectors are kept per embedding model (see Generations). When EMBED_MODEL
+    changes, the first use starts re-embedding every repository in the
+    background, and queries keep using the old vectors until it is done.
+    """
+
+    def __init__(self, data_dir: Path = DATA_DIR, max_open: int = MAX_OPEN_NAMESPACES,
+                 embed_model: str = EMBED_MODEL):
+        # Repositories indexed before the embedder was configurable used the chat model.
+        self.generations = Generations(data_dir, embed_model, legacy_model=MODEL)
+        # Nothing has opened the vectors yet, so those retired by a migration can go.
+        self.generations.purge()
+        self.max_open = max(max_open, 1)
+        self._apps: "OrderedDict[Tuple[str, str], App]" = OrderedDict()
+        self._indexes: Dict[Tuple[str, str], SymbolIndex] = {}
+        self._lock = threading.Lock()
+
+    def _open(self, collection: str, generation: Generation) -> App:
+        app = App.from_config(config=_config(
+            collection, self.generations.path(generation), generation.model
+        ))
+        app.embedder.set_embedding_fn(batched_embedding_fn(generation.model, OLLAMA_URL))
+        return app
+
+    def get(self, repo: str) -> App:
+        """The App holding `repo`, a normalized repository name or path."""
+        if self.generations.pending():
+            self.migrate_in_background()
+        generation = self.generations.active()
+        key = (generation.dir, repo)
+        with self._lock:
+            app = self._apps.get(key)
+            if app is not None:
+                self._apps.move_to_end(key)
+                return app
+        # Opening an App is slow; don't hold the lock for it.
+        app = self._open(collection_name(repo), generation)
+        with self._lock:
+            app = self._apps.setdefault(key, app)
+            self._apps.move_to_end(key)
+            while len(self._apps) > self.max_open:
+                self._apps.popitem(last=False)
+        return app
+
+    @contextmanager
+    def writing(self, repo: str) -> Iterator[App]:
+        """The App for `repo`, held so a re-embedding cannot cut over mid-write."""
+        with self.generations.writing():
+            yield self.get(repo)
+
+    def sync(self, repo: str, source) -> SyncReport:
+        with self.writing(repo) as app:
+            return sync_repo(app, repo, source)
+
+    def migrate(self):
+        """Re-embed every repository with the configured embedding model."""
+        def open_client(generation: Generation):
+            return self._open(_ANY_COLLECTION, generation).db.client
+
+        def carry_over_sync_state(old_dir: Path, new_dir: Path):
+            # Manifests and symbol indexes don't depend on the model.
+            if (old_dir / "github_sync").is_dir():
+                shutil.copytree(old_dir / "github_sync", new_dir / "github_sync", dirs_exist_ok=True)
+
+        def close_old(old: Generation):
+            with self._lock:
+                for key in [key for key in self._apps if key[0] == old.dir]:
+                    del self._apps[key]
+                for key in [key for key in self._indexes if key[0] == old.dir]:
+                    del self._indexes[key]
+
+        target = self.generations.target()
+        return self.generations.migrate(
+            open_client, batched_embedding_fn(target.model, OLLAMA_URL), carry_over_sync_state,
+            on_retire=close_old,
+        )
+
+    def migrate_in_background(self):
+        self.generations.migrate_in_background(self.migrate)
+
+    def symbols(self, repo: str) -> SymbolIndex:
+        """The symbol index the sync keeps for `repo`."""
+        key = (self.generations.active().dir, repo)
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes[key] = SymbolIndex(symbols_path(self.get(repo), repo))
+        return index
+
+    def definition_chunks(self, definitions: List[Definition], k: int) -> List[str]:
+        """The chunks holding each definition's first line, at most `k`."""
+        contexts: List[str] = []
+        for definition in definitions:
+            if len(contexts) >= k:
+                break
+            result = self.get(definition.repo).db.collection.get(
+                where={"$and": [
+                    {"path": definition.path},
+                    {"start_line": {"$lte": definition.line}},
+                    {"end_line": {"$gte": definition.line}},
+                ]},
+                include=["documents"],
+            )
+            contexts += [doc for doc in result["documents"] if doc not in contexts]
+        return contexts[:k]
+
+    def retrieve(self, repos: List[str], question: str, k: int) -> List[Tuple[str, dict]]:
+        """The `k` chunks closest to `question` across `repos`, with metadata.
+
+        The question is embedded once and each repository's collection is
+        searched on its own thread; the hits are merged by distance.
+        """
+        if not repos:
+            return []
+        apps = [self.get(repo) for repo in repos]
+        vector = apps[0].embedder.embedding_fn([question])[0]
+
+        def search(app: App):
+            if app.db.count() == 0:
+                return []
+            result = app.db.collection.query(
+                query_embeddings=[vector],
+                n_results=k,
+                include=["documents", "metadatas", "distances"],
+            )
+            return list(zip(result["distances"][0], result["documents"][0], result["metadatas"][0]))
+
+        with ThreadPoolExecutor(max_workers=len(apps)) as pool:
+            hits = [hit for found in pool.map(search, apps) for hit in found]
+        hits.sort(key=lambda hit: hit[0])
+        return [(document, metadata) for _, document, metadata in hits[:k]]
+
+    def stream_answer(self, repos: List[str], question: str,
+                      stats: Optional[LookupStats] = None) -> Iterator[str]:
+        """Answer `question` from the chunks of `repos` only.
+
+        Identifiers the question names are looked up in the symbol indexes
+        first. "Where is X" questions with exact hits are answered from the
+        index alone; otherwise the chunks defining the hits lead the context
+        and vector search fills the remaining slots.
+        """
+        stats = stats if stats is not None else LookupStats()
+        app = self.get(repos[0])
+        k = app.llm.config.number_documents
+        indexes = {repo: self.symbols(repo) for repo in repos}
+        hits = lookup(indexes, question, stats)
+        if hits and asks_location(question):
+            stats.answered = True
+            yield format_answer(indexes, hits)
+            return
+        contexts = self.definition_chunks([d for found in hits.values() for d in found], k)
+        stats.context_tokens = sum(estimate_tokens(context) for context in contexts)
+        if len(contexts) < k:
+            found = self.retrieve(repos, question, k)
+            contexts += [doc for doc, _ in found if doc not in contexts][:k - len(contexts)]
+        # Follow-up questions see the conversation, as with `app.chat`.
+        app.llm.update_history(app_id=app.config.id)
+        prompt = app.llm.generate_prompt(question, contexts)
+        yield from remember(app, question, stream_prompt(app.llm.config, prompt))
+
+
+namespaces = Namespaces()
@@ -0,0 +1,314 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional
+
+import ollama
+
+# A small dedicated embedding model; the chat model is configured separately.
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "64"))
+# Catch-up passes for writes made while copying, before ingestion is paused.
+MAX_CATCH_UP_PASSES = 3
+
+EmbeddingFn = Callable[[List[str]], List[List[float]]]
+
+
+@dataclass
+class Generation:
+    """The vectors one embedding model produced, and where they live."""
+    model: str
+    dir: str
+
+
+@dataclass
+class MigrationProgress:
+    source: str = ""
+    target: str = ""
+    status: str = "idle"
+    error: str = ""
+    total: int = 0
+    embedded: int = 0
+    deleted: int = 0
+    embed_seconds: float = 0.0
+    seconds: float = 0.0
+    size_before: int = 0
+    size_after: int = 0
+
+    @property
+    def embeddings_per_second(self) -> float:
+        return self.embedded / self.embed_seconds if self.embed_seconds > 0 else 0.0
+
+    def describe(self) -> str:
+        if self.status == "running":
+            return (
+                f"Re-embedding with {self.target}: {self.embedded}/{self.total} chunks, "
+                f"{self.embeddings_per_second:.0f}/s"
+            )
+        if self.status == "done":
+            return (
+                f"Re-embedded {self.embedded} chunks from {self.source} to {self.target} "
+                f"in {self.seconds:.0f} s ({self.embeddings_per_second:.0f}/s); index "
+                f"{self.size_before / 2**20:.1f} MB -> {self.size_after / 2**20:.1f} MB"
+            )
+        if self.status == "failed":
+            return f"Re-embedding failed: {self.error}"
+        return ""
+
+
+def slug(model: str) -> str:
+    return re.sub(r"[^\w.-]+", "-", model).strip("-")
+
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def batched_embedding_fn(model: str, base_url: str) -> EmbeddingFn:
+    """Embed a whole batch per request through Ollama's /api/embed.
+
+    embedchain's Ollama embedder makes one request per text.
+    """
+    client = ollama.Client(host=base_url)
+
+    def embed(texts: List[str]) -> List[List[float]]:
+        return client.embed(model=model, input=list(texts))["embeddings"]
+
+    return embed
+
+
+def _collections(client) -> List[str]:
+    # Chroma returns Collection objects before 0.6 and names after.
+    return [getattr(c, "name", c) for c in client.list_collections()]
+
+
+class Generations:
+    """Which embedding model's vectors under `data_dir` the app queries.
+
+    Vectors are only comparable with vectors from the same model, so each
+    model gets a directory of its own and `embeddings.json` names the
+    active one. Switching EMBED_MODEL starts a migration into a new
+    directory; queries keep using the active one until it is complete.
+
+    Ingestion runs inside `writing()`. The migration's last catch-up pass
+    and the cut-over run with ingestion paused, so nothing written to the
+    old vectors is lost. Queries are never paused.
+
+    Clients handed out before the cut-over may still be reading the old
+    generation, so it is only recorded as retired then; `purge` deletes
+    retired generations at the next startup, before anything opens them.
+    """
+
+    def __init__(self, data_dir: Path, model: str = EMBED_MODEL, legacy_model: Optional[str] = None):
+        self.data_dir = Path(data_dir)
+        self.model = model
+        # Stores from before this file existed sit in `data_dir` itself.
+        self.legacy_model = legacy_model
+        self.progress = MigrationProgress()
+        self._writers = 0
+        self._paused = False
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def _state(self) -> Path:
+        return self.data_dir / "embeddings.json"
+
+    def _read_state(self) -> dict:
+        try:
+            return json.loads(self._state.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def active(self) -> Generation:
+        try:
+            return Generation(**self._read_state()["active"])
+        except (KeyError, TypeError):
+            pass
+        if self.legacy_model and (self.data_dir / "chroma.sqlite3").exists():
+            return Generation(self.legacy_model, ".")
+        return self.target()
+
+    def target(self) -> Generation:
+        return Generation(self.model, slug(self.model))
+
+    def path(self, generation: Generation) -> Path:
+        return self.data_dir / generation.dir
+
+    def pending(self) -> bool:
+        return self.active().model != self.model
+
+    def _entries(self, generation: Generation) -> List[Path]:
+        """What on disk belongs to `generation`.
+
+        The legacy generation is `data_dir` itself, which also holds the
+        state file and the other generations; a directory with a Chroma
+        database of its own is another generation.
+        """
+        path = self.path(generation)
+        if generation.dir != ".":
+            return [path] if path.exists() else []
+        return [
+            entry for entry in path.iterdir()
+            if not entry.name.startswith("embeddings.")
+            and not (entry / "chroma.sqlite3").exists()
+        ]
+
+    def size(self, generation: Generation) -> int:
+        return sum(dir_size(e) if e.is_dir() else e.stat().st_size for e in self._entries(generation))
+
+    def _retired(self) -> List[Generation]:
+        try:
+            return [Generation(**g) for g in self._read_state().get("retired", [])]
+        except TypeError:
+            return []
+
+    def purge(self) -> List[Generation]:
+        """Delete the generations earlier migrations retired; returns them.
+
+        Call at startup, before any client of the old vectors exists.
+        """
+        active, retired = self.active(), self._retired()
+        for generation in retired:
+            if generation.dir == active.dir:
+                continue
+            for entry in self._entries(generation):
+                if entry.is_dir():
+                    shutil.rmtree(entry, ignore_errors=True)
+                else:
+                    entry.unlink(missing_ok=True)
+        if retired:
+            self._activate(active)
+        return retired
+
+    def _activate(self, generation: Generation, retired: List[Generation] = ()):
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        state = {"active": asdict(generation), "retired": [asdict(g) for g in retired]}
+        tmp = self._state.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, self._state)
+
+    @contextmanager
+    def writing(self) -> Iterator[Generation]:
+        """Hold off the cut-over while writing; yields the generation to write to."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._paused)
+            self._writers += 1
+        try:
+            yield self.active()
+        finally:
+            with self._condition:
+                self._writers -= 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def _paused_writers(self):
+        with self._condition:
+            self._paused = True
+            self._condition.wait_for(lambda: self._writers == 0)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._paused = False
+                self._condition.notify_all()
+
+    def _copy(self, source, target, embed: EmbeddingFn, batch_size: int) -> int:
+        """Make `target` hold the same chunk ids as `source`; returns changes made.
+
+        Chunk ids are hashes of their content, so an id present on both
+        sides needs no work.
+        """
+        changes = 0
+        for name in _collections(source):
+            old = source.get_collection(name)
+            new = target.get_or_create_collection(name, metadata=old.metadata)
+            old_ids = old.get(include=[])["ids"]
+            new_ids = set(new.get(include=[])["ids"])
+            missing = [i for i in old_ids if i not in new_ids]
+            extra = list(new_ids - set(old_ids))
+            self.progress.total += len(missing)
+            for start in range(0, len(missing), batch_size):
+                batch = old.get(ids=missing[start:start + batch_size], include=["documents", "metadatas"])
+                started = time.perf_counter()
+                embeddings = embed(batch["documents"])
+                self.progress.embed_seconds += time.perf_counter() - started
+                new.upsert(
+                    ids=batch["ids"], embeddings=embeddings,
+                    documents=batch["documents"], metadatas=batch["metadatas"],
+                )
+                self.progress.embedded += len(batch["ids"])
+            if extra:
+                new.delete(ids=extra)
+                self.progress.deleted += len(extra)
+            changes += len(missing) + len(extra)
+        return changes
+
+    def migrate(
+        self,
+        open_client: Callable[[Generation], object],
+        embed: EmbeddingFn,
+        on_cutover: Optional[Callable[[Path, Path], None]] = None,
+        batch_size: int = REEMBED_BATCH_SIZE,
+        on_retire: Optional[Callable[[Generation], None]] = None,
+    ) -> MigrationProgress:
+        """Re-embed every collection of the active generation with `self.model`.
+
+        `open_client` returns the Chroma client of a generation and `embed`
+        embeds with the new model. `on_cutover(old_dir, new_dir)` runs with
+        ingestion paused, to carry over state kept next to the vectors.
+        Once the new generation is active, `on_retire(old)` lets the caller
+        drop its clients of the old one, whose vectors `purge` deletes at
+        the next startup.
+        """
+        source_generation, target_generation = self.active(), self.target()
+        self.progress = MigrationProgress(
+            source=source_generation.model, target=target_generation.model, status="running"
+        )
+        if source_generation == target_generation:
+            self.progress.status = "done"
+            return self.progress
+        start = time.perf_counter()
+        try:
+            source, target = open_client(source_generation), open_client(target_generation)
+            self.progress.size_before = self.size(source_generation)
+            for _ in range(MAX_CATCH_UP_PASSES):
+                if not self._copy(source, target, embed, batch_size):
+                    break
+            with self._paused_writers():
+                self._copy(source, target, embed, batch_size)
+                if on_cutover is not None:
+                    on_cutover(self.path(source_generation), self.path(target_generation))
+                retired = [g for g in self._retired() if g != target_generation]
+                self._activate(target_generation, retired + [source_generation])
+            if on_retire is not None:
+                on_retire(source_generation)
+            self.progress.size_after = self.size(target_generation)
+            self.progress.status = "done"
+        except Exception as e:
+            self.progress.error = str(e)
+            self.progress.status = "failed"
+        self.progress.seconds = time.perf_counter() - start
+        return self.progress
+
+    def migrate_in_background(self, run: Callable[[], object]):
+        """Start `run`, which calls `migrate`, on a thread once per process."""
+        with self._condition:
+            if self._thread is not None or not self.pending():
+                return
+            self._thread = threading.Thread(target=run, name="reembed", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until a background migration has finished; False on timeout."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
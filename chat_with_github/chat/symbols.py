@@ -0,0 +1,283 @@
+import ast
+import keyword
+import re
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from chat.chunking import CHUNK_WORKERS, DEFINITION, map_files
+
+# Lines kept per (symbol, file) reference; the count is always exact.
+MAX_REFERENCE_LINES = 10
+
+# Definitions anywhere in a line, so nested methods and closures count too.
+_NESTED_DEFINITION = re.compile(r"^\s*" + DEFINITION.pattern[1:])
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+# Words that look like code: snake_case, CamelCase, dotted or called.
+_CODE_WORD = re.compile(r"`([^`]+)`|\b([A-Za-z_]\w*(?:\.\w+)+|\w*_\w*|[a-z]+[A-Z]\w*|[A-Z][a-z]+[A-Z]\w*)(?:\(\))?")
+# "Where is X defined?", "which file has X", "find X", "definition of X".
+_LOCATE = re.compile(
+    r"^\s*(where(?:'s| is| are| do| does)?\b|which files?\b|find\b|locate\b|definition of\b|go to\b)",
+    re.IGNORECASE,
+)
+_COMMON = frozenset(keyword.kwlist) | {"self", "cls", "None", "True", "False", "def", "return"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, sha TEXT, url TEXT);
+CREATE TABLE IF NOT EXISTS definitions (
+    name TEXT, qualname TEXT, kind TEXT, path TEXT, line INTEGER, end_line INTEGER
+);
+CREATE INDEX IF NOT EXISTS definitions_name ON definitions (name);
+CREATE INDEX IF NOT EXISTS definitions_qualname ON definitions (qualname);
+CREATE INDEX IF NOT EXISTS definitions_path ON definitions (path);
+CREATE TABLE IF NOT EXISTS refs (
+    name TEXT, path TEXT, count INTEGER, lines TEXT, PRIMARY KEY (name, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS refs_path ON refs (path);
+"""
+
+
+@dataclass
+class Definition:
+    name: str
+    qualname: str
+    kind: str
+    path: str
+    line: int
+    end_line: int
+    url: str = ""
+    repo: str = ""
+
+    def link(self) -> str:
+        location = f"{self.path}:{self.line}"
+        return f"[{location}]({self.url}#L{self.line})" if self.url else f"`{location}`"
+
+
+@dataclass
+class FileSymbols:
+    """What one file defines and which identifiers it mentions where."""
+    definitions: List[Tuple[str, str, str, int, int]] = field(default_factory=list)
+    references: Dict[str, List[int]] = field(default_factory=dict)
+
+
+def _python_definitions(text: str) -> List[Tuple[str, str, str, int, int]]:
+    found = []
+
+    def visit(body, prefix: str, in_class: bool):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                kind = "method" if in_class else "function"
+                found.append((node.name, prefix + node.name, kind, node.lineno, node.end_lineno))
+                visit(node.body, f"{prefix}{node.name}.", False)
+            elif isinstance(node, ast.ClassDef):
+                found.append((node.name, prefix + node.name, "class", node.lineno, node.end_lineno))
+                visit(node.body, f"{prefix}{node.name}.", True)
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)) and not prefix:
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        found.append((target.id, target.id, "variable", node.lineno, node.end_lineno))
+
+    visit(ast.parse(text).body, "", False)
+    return found
+
+
+def extract(path: str, text: str) -> FileSymbols:
+    """Definitions (ast for Python, keywords elsewhere) and references of a file."""
+    symbols = FileSymbols()
+    if path.endswith(".py"):
+        try:
+            symbols.definitions = _python_definitions(text)
+        except (SyntaxError, ValueError):
+            pass
+    lines = text.split("\n")
+    if not symbols.definitions and not path.lower().endswith((".md", ".rst", ".txt")):
+        for number, line in enumerate(lines, 1):
+            match = _NESTED_DEFINITION.match(line)
+            if match:
+                name = match.group(1)
+                symbols.definitions.append((name, name, "definition", number, number))
+    defined_at = {(name, line) for name, _, _, line, _ in symbols.definitions}
+    references: Dict[str, List[int]] = defaultdict(list)
+    for number, line in enumerate(lines, 1):
+        for name in dict.fromkeys(_IDENTIFIER.findall(line)):
+            if name not in _COMMON and (name, number) not in defined_at:
+                references[name].append(number)
+    symbols.references = dict(references)
+    return symbols
+
+
+def _extract_one(item: Tuple[str, str]) -> FileSymbols:
+    return extract(*item)
+
+
+def extract_files(files: List[Tuple[str, str]], workers: int = CHUNK_WORKERS) -> List[FileSymbols]:
+    """Symbols for each (path, text), in order, on the chunking worker pool."""
+    return map_files(_extract_one, files, workers)
+
+
+def code_words(question: str) -> List[str]:
+    """Identifiers a question names, in order: `quoted`, snake_case, CamelCase, a.b."""
+    words = []
+    for quoted, bare in _CODE_WORD.findall(question):
+        word = (quoted or bare).strip().removesuffix("()")
+        if word and word not in _COMMON:
+            words.append(word)
+    return list(dict.fromkeys(words))
+
+
+def asks_location(question: str) -> bool:
+    return bool(_LOCATE.match(question))
+
+
+class SymbolIndex:
+    """Definitions, references and paths of one repository, in SQLite.
+
+    Names are B-tree indexed, so exact and prefix lookups cost a few page
+    reads regardless of repository size, with no model or embedding call.
+    Files are stored with the blob SHA they were indexed at, so the sync
+    can bring the index up to date independently of the vectors.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    def commit(self) -> str:
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'commit'").fetchone()
+        return row[0] if row else ""
+
+    def files(self) -> Dict[str, str]:
+        with closing(self._connect()) as db:
+            return dict(db.execute("SELECT path, sha FROM files"))
+
+    def update(self, removed: Iterable[str], indexed: Dict[str, Tuple[str, str, FileSymbols]],
+               commit: Optional[str] = None):
+        """Drop `removed` paths and replace `indexed` ones ({path: (sha, url, symbols)})."""
+        paths = [(path,) for path in list(removed) + list(indexed)]
+        with closing(self._connect()) as db, db:
+            for table in ("files", "definitions", "refs"):
+                db.executemany(f"DELETE FROM {table} WHERE path = ?", paths)
+            db.executemany(
+                "INSERT INTO files VALUES (?, ?, ?)",
+                [(path, sha, url) for path, (sha, url, _) in indexed.items()],
+            )
+            db.executemany(
+                "INSERT INTO definitions VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (name, qualname, kind, path, line, end_line)
+                    for path, (_, _, symbols) in indexed.items()
+                    for name, qualname, kind, line, end_line in symbols.definitions
+                ],
+            )
+            db.executemany(
+                "INSERT INTO refs VALUES (?, ?, ?, ?)",
+                [
+                    (name, path, len(lines), ",".join(map(str, lines[:MAX_REFERENCE_LINES])))
+                    for path, (_, _, symbols) in indexed.items()
+                    for name, lines in symbols.references.items()
+                ],
+            )
+            if commit is not None:
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('commit', ?)", (commit,))
+
+    def definitions(self, name: str, limit: int = 20) -> List[Definition]:
+        """Where `name` (bare, or qualified like `State.get_app`) is defined."""
+        column = "qualname" if "." in name else "name"
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT d.name, d.qualname, d.kind, d.path, d.line, d.end_line, f.url "
+                f"FROM definitions d JOIN files f USING (path) WHERE d.{column} = ? "
+                "ORDER BY d.path, d.line LIMIT ?",
+                (name, limit),
+            ).fetchall()
+        return [Definition(*row) for row in rows]
+
+    def references(self, name: str, limit: int = 20) -> List[Tuple[str, int, List[int]]]:
+        """(path, count, first lines) of files mentioning `name`, most first."""
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT path, count, lines FROM refs WHERE name = ? ORDER BY count DESC LIMIT ?",
+                (name.rsplit(".", 1)[-1], limit),
+            ).fetchall()
+        return [(path, count, [int(n) for n in lines.split(",") if n]) for path, count, lines in rows]
+
+    def complete(self, prefix: str, limit: int = 20) -> List[str]:
+        """Defined names starting with `prefix`."""
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT DISTINCT name FROM definitions WHERE name >= ? AND name < ? "
+                "ORDER BY name LIMIT ?",
+                (prefix, prefix + "\U0010ffff", limit),
+            ).fetchall()
+        return [name for name, in rows]
+
+    def paths(self, prefix: str, limit: int = 20) -> List[str]:
+        """Indexed file paths starting with `prefix`."""
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT path FROM files WHERE path >= ? AND path < ? ORDER BY path LIMIT ?",
+                (prefix, prefix + "\U0010ffff", limit),
+            ).fetchall()
+        return [path for path, in rows]
+
+
+@dataclass
+class LookupStats:
+    """What the symbol index contributed to one answer."""
+    seconds: float = 0.0
+    definitions: int = 0
+    answered: bool = False
+    context_tokens: int = 0
+
+    def describe(self) -> str:
+        if not self.definitions:
+            return ""
+        text = f"Symbol index: {self.definitions} definitions in {self.seconds * 1000:.1f} ms"
+        if self.answered:
+            return text + ", answered without the model"
+        return text + f", {self.context_tokens} context tokens from exact hits"
+
+
+def lookup(indexes: Dict[str, SymbolIndex], question: str,
+           stats: Optional[LookupStats] = None) -> Dict[str, List[Definition]]:
+    """Definitions, across `indexes` ({repo: index}), of each word the question names."""
+    start = time.perf_counter()
+    hits: Dict[str, List[Definition]] = {}
+    for word in code_words(question):
+        for repo, index in indexes.items():
+            for definition in index.definitions(word):
+                definition.repo = repo
+                hits.setdefault(word, []).append(definition)
+    if stats is not None:
+        stats.seconds = time.perf_counter() - start
+        stats.definitions = sum(len(found) for found in hits.values())
+    return hits
+
+
+def format_answer(indexes: Dict[str, SymbolIndex], hits: Dict[str, List[Definition]]) -> str:
+    """A direct answer to a "where is X" question, with links."""
+    parts = []
+    for word, definitions in hits.items():
+        lines = [f"`{word}` is defined in:"]
+        lines += [f"- {d.link()} ({d.kind} `{d.qualname}`)" for d in definitions]
+        referencing = [ref for index in indexes.values() for ref in index.references(word)]
+        if referencing:
+            referencing.sort(key=lambda ref: -ref[1])
+            shown = ", ".join(f"`{path}` ({count})" for path, count, _ in referencing[:5])
+            more = f" and {len(referencing) - 5} more" if len(referencing) > 5 else ""
+            lines.append(f"\nReferenced in {shown}{more}.")
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts)
+
@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import posixpath
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from embedchain import App
+
+from chat.chunking import chunk_files
+from chat.github_api import GitHubAPI
+from chat.ignore import IgnoreRules
+from chat.local_repo import LocalRepo
+from chat.symbols import FileSymbols, SymbolIndex, extract_files
+
+RepoSource = Union[GitHubAPI, LocalRepo]
+
+EMBED_BATCH_SIZE = int(os.getenv("SYNC_EMBED_BATCH_SIZE", "32"))
+# Files fetched and chunked together; bounds how much text is held at once.
+FETCH_GROUP_SIZE = int(os.getenv("SYNC_FETCH_GROUP_SIZE", "256"))
+# Deletes are issued in groups so the `$in` filter stays small.
+DELETE_BATCH_SIZE = 500
+
+
+@dataclass
+class Manifest:
+    """What was last indexed for a repository: its commit and file blobs."""
+    repo: str
+    commit: str = ""
+    files: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path, repo: str) -> "Manifest":
+        if not path.exists():
+            return cls(repo=repo)
+        return cls(**json.loads(path.read_text()))
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(asdict(self)))
+        # Replace atomically so a crash never leaves a half-written manifest.
+        os.replace(tmp, path)
+
+
+@dataclass
+class SyncReport:
+    """What one sync changed and what it cost."""
+    repo: str
+    commit: str
+    previous_commit: str = ""
+    added: int = 0
+    modified: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+    ignored: int = 0
+    files_fetched: int = 0
+    definitions: int = 0
+    chunks_embedded: int = 0
+    embedding_calls: int = 0
+    requests: int = 0
+    seconds: float = 0.0
+
+    def describe(self) -> str:
+        if self.commit == self.previous_commit and not self.files_fetched:
+            return f"{self.repo} is up to date at {self.commit[:7]} ({self.seconds:.1f} s)"
+        return (
+            f"Synced {self.repo} to {self.commit[:7]}: {self.added} added, "
+            f"{self.modified} modified, {self.removed} removed, {self.unchanged} unchanged; "
+            f"{self.ignored} ignored; {self.definitions} definitions indexed; "
+            f"{self.chunks_embedded} chunks in "
+            f"{self.embedding_calls} embedding calls, {self.requests} requests, {self.seconds:.1f} s"
+        )
+
+
+def _state_path(app: App, repo: str, suffix: str) -> Path:
+    # Kept next to the vectors so both disappear together.
+    name = re.sub(r"[^\w.-]+", "__", repo).strip("_")
+    return Path(app.db.config.dir) / "github_sync" / f"{name}{suffix}"
+
+
+def manifest_path(app: App, repo: str) -> Path:
+    return _state_path(app, repo, ".json")
+
+
+def symbols_path(app: App, repo: str) -> Path:
+    return _state_path(app, repo, ".symbols.db")
+
+
+def _doc_id(app: App, repo: str, path: str) -> str:
+    doc_id = f"{repo}:{path}"
+    if app.config.id is not None:
+        doc_id = f"{app.config.id}--{doc_id}"
+    return doc_id
+
+
+def _decode(content: bytes) -> Optional[str]:
+    """Text of a blob, or None for binary content."""
+    if b"\0" in content[:8192]:
+        return None
+    try:
+        return content.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def _delete(app: App, doc_ids: List[str]):
+    for start in range(0, len(doc_ids), DELETE_BATCH_SIZE):
+        app.db.collection.delete(where={"doc_id": {"$in": doc_ids[start:start + DELETE_BATCH_SIZE]}})
+
+
+def _filter(source: RepoSource, repo: str, files: Dict[str, str]) -> Dict[str, str]:
+    """Drop files matched by the repo's .gitignore files or the ignore list."""
+    gitignores = [p for p in files if posixpath.basename(p) == ".gitignore"]
+    contents = dict(source.blobs(repo, [files[p] for p in gitignores]))
+    rules = IgnoreRules.build(
+        {p: contents[files[p]].decode(errors="replace") for p in gitignores}
+    )
+    return {p: sha for p, sha in files.items() if not rules.ignored(p)}
+
+
+def sync_repo(app: App, repo: str, source: RepoSource, ref: Optional[str] = None) -> SyncReport:
+    """Bring `app`'s vectors for `repo` up to date with its latest commit.
+
+    Only files whose blob SHA changed since the last sync are fetched and
+    embedded; vectors of modified and removed files are deleted. The symbol
+    index tracks blob SHAs of its own, so it is filled in for files that
+    were embedded before it existed. The manifest is written last, so an
+    interrupted sync is redone next time.
+    """
+    start = time.perf_counter()
+    requests_before = source.requests
+    repo = source.normalize(repo)
+    path = manifest_path(app, repo)
+    manifest = Manifest.load(path, repo)
+    symbols = SymbolIndex(symbols_path(app, repo))
+    head = source.head(repo, ref)
+    report = SyncReport(repo=repo, commit=head.sha, previous_commit=manifest.commit)
+    if head.sha == manifest.commit and head.sha == symbols.commit():
+        report.unchanged = len(manifest.files)
+        report.requests = source.requests - requests_before
+        report.seconds = time.perf_counter() - start
+        return report
+
+    tree = source.tree(repo, head.tree)
+    files = _filter(source, repo, tree)
+    report.ignored = len(tree) - len(files)
+    changed = [p for p, sha in files.items() if manifest.files.get(p) != sha]
+    removed = [p for p in manifest.files if p not in files]
+    report.added = sum(1 for p in changed if p not in manifest.files)
+    report.modified = len(changed) - report.added
+    report.removed = len(removed)
+    report.unchanged = len(files) - len(changed)
+    indexed = symbols.files()
+    to_embed = set(changed)
+    to_fetch = changed + [p for p, sha in files.items() if indexed.get(p) != sha and p not in to_embed]
+
+    app_id = app.config.id
+    documents: List[str] = []
+    metadatas: List[dict] = []
+    ids: List[str] = []
+    stale: List[str] = []
+
+    def flush():
+        embeddings = []
+        for batch in range(0, len(documents), EMBED_BATCH_SIZE):
+            embeddings += app.embedder.embedding_fn(documents[batch:batch + EMBED_BATCH_SIZE])
+            report.embedding_calls += 1
+        # Replace a file's old chunks right before its new ones go in.
+        _delete(app, stale)
+        if documents:
+            app.db.collection.upsert(
+                ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas
+            )
+        report.chunks_embedded += len(documents)
+        for items in (documents, metadatas, ids, stale):
+            items.clear()
+
+    # Files are fetched and chunked a group at a time, which keeps memory
+    # bounded while still reading blobs in bulk and chunking in parallel.
+    for group_start in range(0, len(to_fetch), FETCH_GROUP_SIZE):
+        group = to_fetch[group_start:group_start + FETCH_GROUP_SIZE]
+        contents = dict(source.blobs(repo, [files[p] for p in group]))
+        report.files_fetched += len(group)
+        texts = {}
+        for file_path in group:
+            if file_path in to_embed and file_path in manifest.files:
+                stale.append(_doc_id(app, repo, file_path))
+            text = _decode(contents[files[file_path]])
+            if text is None:
+                report.skipped += file_path in to_embed
+            else:
+                texts[file_path] = text
+        del contents
+
+        found = dict(zip(texts, extract_files(list(texts.items()))))
+        symbols.update([], {
+            p: (files[p], source.url(repo, head.sha, p), found.get(p, FileSymbols()))
+            for p in group
+        })
+        report.definitions += sum(len(s.definitions) for s in found.values())
+
+        texts = {p: text for p, text in texts.items() if p in to_embed}
+        for file_path, chunks in zip(texts, chunk_files(list(texts.items()))):
+            doc_id = _doc_id(app, repo, file_path)
+            url = source.url(repo, head.sha, file_path)
+            for number, chunk in enumerate(chunks):
+                chunk_id = hashlib.sha256(f"{doc_id}:{number}:{chunk.text}".encode()).hexdigest()
+                if app_id is not None:
+                    chunk_id = f"{app_id}--{chunk_id}"
+                metadata = {
+                    "url": url,
+                    "data_type": "github",
+                    "repo": repo,
+                    "path": file_path,
+                    "blob_sha": files[file_path],
+                    "doc_id": doc_id,
+                    "hash": doc_id,
+                    **chunk.metadata(),
+                }
+                if app_id:
+                    metadata["app_id"] = app_id
+                documents.append(chunk.text)
+                metadatas.append(metadata)
+                ids.append(chunk_id)
+            if len(documents) >= EMBED_BATCH_SIZE:
+                flush()
+    flush()
+    _delete(app, [_doc_id(app, repo, p) for p in removed])
+    symbols.update([p for p in indexed if p not in files], {}, commit=head.sha)
+
+    Manifest(repo=repo, commit=head.sha, files=files).save(path)
+    report.requests = source.requests - requests_before
+    report.seconds = time.perf_counter() - start
+    return report
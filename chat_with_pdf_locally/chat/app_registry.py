@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Tuple
+
+from embedchain import App
+
+from chat.reembed import batched_embedding_fn
+
+
+@dataclass
+class RegistryStats:
+    """Counters describing how well the registry is doing."""
+    hits: int = 0
+    misses: int = 0
+    builds: int = 0
+    evictions: int = 0
+    build_seconds: float = 0.0
+
+
+class AppRegistry:
+    """Process-wide cache of warm embedchain Apps keyed by their resolved config.
+
+    Building an App creates the Chroma client, the LLM wrapper and the embedder,
+    so every event that asks for the same knowledge base shares one instance.
+    Entries are evicted least-recently-used first, and after `idle_timeout`
+    seconds without use.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 4,
+        idle_timeout: float = 30 * 60,
+        factory: Callable[..., App] = App.from_config,
+    ):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._factory = factory
+        self._apps: "OrderedDict[str, Tuple[App, float]]" = OrderedDict()
+        self._building: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stats = RegistryStats()
+
+    @staticmethod
+    def key(config: dict) -> str:
+        """Stable key for a config dict."""
+        return json.dumps(config, sort_keys=True)
+
+    def get(self, config: dict) -> App:
+        """Return the warm App for `config`, building it on first use."""
+        key = self.key(config)
+        with self._lock:
+            app = self._lookup(key)
+            if app is not None:
+                return app
+            build_lock = self._building.setdefault(key, threading.Lock())
+
+        # Only one caller builds a given key; the others wait and then hit.
+        with build_lock:
+            with self._lock:
+                app = self._lookup(key)
+                if app is not None:
+                    return app
+                self._stats.misses += 1
+
+            start = time.perf_counter()
+            try:
+                app = self._factory(config=config)
+            except BaseException:
+                with self._lock:
+                    self._building.pop(key, None)
+                raise
+            elapsed = time.perf_counter() - start
+
+            # Publish the App and retire the build lock together, so no
+            # caller can find neither and start a second build.
+            with self._lock:
+                self._stats.builds += 1
+                self._stats.build_seconds += elapsed
+                self._apps[key] = (app, time.monotonic())
+                self._building.pop(key, None)
+                while len(self._apps) > self.max_size:
+                    self._apps.popitem(last=False)
+                    self._stats.evictions += 1
+        return app
+
+    def _lookup(self, key: str):
+        """Return a cached App and mark it as used. Caller holds the lock."""
+        self._evict_idle()
+        entry = self._apps.get(key)
+        if entry is None:
+            return None
+        self._apps[key] = (entry[0], time.monotonic())
+        self._apps.move_to_end(key)
+        self._stats.hits += 1
+        return entry[0]
+
+    def _evict_idle(self):
+        """Drop entries that have not been used for `idle_timeout` seconds."""
+        cutoff = time.monotonic() - self.idle_timeout
+        for key in [k for k, (_, last_used) in self._apps.items() if last_used < cutoff]:
+            del self._apps[key]
+            self._stats.evictions += 1
+
+    def evict(self, config: dict):
+        """Drop the App for `config`, if it is cached."""
+        with self._lock:
+            if self._apps.pop(self.key(config), None) is not None:
+                self._stats.evictions += 1
+
+    def clear(self):
+        """Drop every cached App."""
+        with self._lock:
+            self._stats.evictions += len(self._apps)
+            self._apps.clear()
+
+    def stats(self) -> dict:
+        """Snapshot of the counters plus the current number of warm Apps."""
+        with self._lock:
+            return {**asdict(self._stats), "size": len(self._apps)}
+
+
+def build_app(config: dict) -> App:
+    """An App whose embedder sends whole batches to Ollama."""
+    app = App.from_config(config=config)
+    embedder = config["embedder"]["config"]
+    app.embedder.set_embedding_fn(batched_embedding_fn(embedder["model"], embedder["base_url"]))
+    return app
+
+
+app_registry = AppRegistry(factory=build_app)
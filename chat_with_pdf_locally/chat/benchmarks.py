@@ -0,0 +1,51 @@
+"""Micro-benchmarks for the PDF app's ingestion paths.
+
+Run from the app directory with `python -m chat.benchmarks [name ...]`.
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from chat.pages import iter_pages
+
+SAMPLE_PDF = Path(__file__).resolve().parent.parent / "uploaded_files" / "Attention is all you need.pdf"
+
+
+def bench_parse(copies=20, worker_counts=None):
+    """Pages/sec parsing a long PDF serially vs on 1, 4 and N worker processes."""
+    from pypdf import PdfReader, PdfWriter
+
+    worker_counts = worker_counts or sorted({1, 4, os.cpu_count() or 1})
+    writer = PdfWriter()
+    for _ in range(copies):
+        writer.append(str(SAMPLE_PDF))
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        writer.write(f)
+    try:
+        start = time.perf_counter()
+        reader = PdfReader(path)
+        pages = sum(1 for page in reader.pages if page.extract_text() is not None)
+        serial = pages / (time.perf_counter() - start)
+        print(f"{pages} pages, serial in-thread {serial:.0f} pages/s")
+        print(f"{'workers':>7} {'pages/s':>8} {'speedup':>8}")
+        for workers in worker_counts:
+            # The first pass starts the pool's processes; time the second.
+            for _ in range(2):
+                start = time.perf_counter()
+                count = sum(1 for _ in iter_pages(path, workers=workers))
+                rate = count / (time.perf_counter() - start)
+            print(f"{workers:>7} {rate:>8.0f} {rate / serial:>7.1f}x")
+    finally:
+        os.unlink(path)
+
+
+BENCHMARKS = {
+    "parse": bench_parse,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or ["parse"]:
+        BENCHMARKS[name]()
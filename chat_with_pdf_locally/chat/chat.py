@@ -1,5 +1,6 @@
 import reflex as rx
 from chat.components.chat import State, chat, action_bar, sidebar
+from chat import files, uploads
 
 def index() -> rx.Component:
     """The main app."""
@@ -31,4 +32,6 @@ def index() -> rx.Component:
     )
 
 app = rx.App()
-app.add_page(index)
\ No newline at end of file
+app.add_page(index)
+files.register(app)
+uploads.register(app)
\ No newline at end of file
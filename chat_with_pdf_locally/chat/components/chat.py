@@ -1,12 +1,15 @@
 import reflex as rx
-from typing import List
+from typing import Any, Dict, List
 from dataclasses import dataclass
-import tempfile
-import base64
 from pathlib import Path
 import asyncio
 
-from embedchain import App
+from chat.files import file_url
+from chat.ingest import start_ingest, cancel_job, forget_job
+from chat.knowledge_base import get_app, writable_app
+from chat.scheduler import scheduler
+from chat.streaming import StreamStats, stream_answer, stream_in_thread
+from chat.uploads import UploadFailed, received_upload, send_upload
 
 # Styles
 message_style = dict(
@@ -64,38 +67,21 @@ class State(rx.State):
     """The app state."""
 
     chats: List[List[QA]] = [[]]
-    base64_pdf: str = ""
+    pdf_url: str = ""
     uploading: bool = False
     current_chat: int = 0
     processing: bool = False
-    db_path: str = tempfile.mkdtemp()
     pdf_filename: str = ""
     knowledge_base_files: List[str] = []
     upload_status: str = ""
+    ingest_job_id: str = ""
+    ingest_progress: int = 0
+    first_token_ms: int = 0
+    queue_position: int = 0
 
-    def get_app(self):
-        return App.from_config(
-            config={
-                "llm": {
-                    "provider": "ollama",
-                    "config": {
-                        "model": "llama3.2:latest",
-                        "max_tokens": 250,
-                        "temperature": 0.5,
-                        "stream": True,
-                        "base_url": 'http://localhost:11434'
-                    }
-                },
-                "vectordb": {"provider": "chroma", "config": {"dir": self.db_path}},
-                "embedder": {
-                    "provider": "ollama",
-                    "config": {
-                        "model": "llama3.2:latest",
-                        "base_url": 'http://localhost:11434'
-                    }
-                },
-            }
-        )
+    def _session(self) -> str:
+        """Token identifying this browser session to the generation scheduler."""
+        return self.router.session.client_token
 
     @rx.event(background=True)
     async def process_question(self, form_data: dict):
@@ -108,49 +94,89 @@ class State(rx.State):
         async with self:
             self.processing = True
             self.chats[self.current_chat].append(QA(question=question, answer=""))
-            yield
-            await asyncio.sleep(1)
-
-        app = self.get_app()
-        answer = app.chat(question)
-
-        async with self:
-            self.chats[self.current_chat][-1].answer = answer
-            self.processing = False
-            self.chats = self.chats
-            yield
-            await asyncio.sleep(1)
-
-    async def handle_upload(self, files: List[rx.UploadFile]):
-        """Handle file upload and processing."""
-        if not files:
-            self.upload_status = "No file uploaded!"
+            chat_index = self.current_chat
+
+        # A registry miss builds the App and its Chroma client; keep that off the loop.
+        app = await asyncio.to_thread(get_app)
+        stats = StreamStats()
+        answer = ""
+        # Wait our turn for Ollama; sessions are served round-robin.
+        ticket = scheduler.submit(self._session())
+        try:
+            while not await ticket.wait(timeout=0.5):
+                async with self:
+                    self.queue_position = ticket.position
+            async with self:
+                self.queue_position = 0
+            async for delta in stream_in_thread(stream_answer, app, question, stats=stats):
+                answer += delta
+                async with self:
+                    self.chats[chat_index][-1].answer = answer
+                    self.chats = self.chats
+                    self.first_token_ms = stats.ttft_ms
+        except asyncio.CancelledError:
+            if not ticket.cancelled:
+                raise
+            answer += "\n\n_Stopped._"
+        except Exception as e:
+            answer += f"\n\nError: {e}"
+        finally:
+            ticket.release()
+            async with self:
+                self.chats[chat_index][-1].answer = answer
+                self.chats = self.chats
+                self.queue_position = 0
+                self.processing = False
+
+    def stop_generation(self):
+        """Cancel this session's queued or in-flight answer and free its slot."""
+        scheduler.cancel(self._session())
+
+    def handle_upload(self, response: Dict[str, Any]):
+        """Hand a PDF the browser has streamed to disk off to background ingestion."""
+        try:
+            upload = received_upload(response)
+        except UploadFailed as e:
+            self.upload_status = str(e)
+            self.uploading = False
             return
-            yield
+        self.pdf_filename = upload.path.name
+        self.upload_status = f"Saved {self.pdf_filename} ({upload.describe()})"
 
-        self.uploading = True
-        yield
+        # The preview is served from disk; state only carries its URL
+        self.pdf_url = file_url(self.pdf_filename)
 
-        file = files[0]
-        upload_data = await file.read()
-        outfile = rx.get_upload_dir() / file.filename
-        self.pdf_filename = file.filename
+        yield State.ingest_pdf(str(upload.path), self.pdf_filename)
 
-        with outfile.open("wb") as file_object:
-            file_object.write(upload_data)
-
-        # Base64 encode the PDF content
-        base64_pdf = base64.b64encode(upload_data).decode('utf-8')
-
-        self.base64_pdf = base64_pdf
+    @rx.event(background=True)
+    async def ingest_pdf(self, path: str, filename: str):
+        """Parse, embed and store a PDF off the event loop, streaming progress."""
+        job = start_ingest(writable_app, path, filename)
+        async with self:
+            self.ingest_job_id = job.id
+            self.upload_status = job.describe()
 
-        app = self.get_app()
-        app.add(str(outfile), data_type="pdf_file")
-        self.knowledge_base_files.append(self.pdf_filename)
-        self.upload_status = f"Added {self.pdf_filename} to knowledge base"
+        future = asyncio.wrap_future(job.future)
+        while not future.done():
+            await asyncio.wait({future}, timeout=0.5)
+            async with self:
+                self.upload_status = job.describe()
+                self.ingest_progress = job.percent
 
-        self.uploading = False
-        yield
+        async with self:
+            if job.status == "done":
+                self.knowledge_base_files.append(filename)
+            self.upload_status = job.describe()
+            self.ingest_progress = 0
+            self.ingest_job_id = ""
+            self.uploading = False
+        forget_job(job.id)
+
+    def cancel_ingest(self):
+        """Cancel the PDF currently being ingested."""
+        if self.ingest_job_id:
+            cancel_job(self.ingest_job_id)
+            self.upload_status = "Cancelling..."
 
     def create_new_chat(self):
         """Create a new chat."""
@@ -162,16 +188,12 @@ def pdf_preview() -> rx.Component:
     return rx.box(
         rx.heading("PDF Preview", size="4", margin_bottom="1em"),
         rx.cond(
-            State.base64_pdf != "",
-            rx.html(
-                f'''
-                <iframe 
-                    src="data:application/pdf;base64,{State.base64_pdf}"
-                    width="100%" 
-                    height="600px"
-                    style="border: none; border-radius: 8px;">
-                </iframe>
-                '''
+            State.pdf_url != "",
+            rx.el.iframe(
+                src=State.pdf_url,
+                width="100%",
+                height="600px",
+                style={"border": "none", "border_radius": "8px"},
             ),
             rx.text("No PDF uploaded yet", color="red"),
         ),
@@ -253,6 +275,16 @@ def action_bar() -> rx.Component:
                         color="white",
                         _hover={"bg": rx.color("accent", 10)},
                     ),
+                    rx.cond(
+                        State.processing,
+                        rx.button(
+                            "Stop",
+                            type_="button",
+                            on_click=State.stop_generation,
+                            variant="outline",
+                            cursor="pointer",
+                        ),
+                    ),
                     align_items="center",
                     spacing="3",
                 ),
@@ -260,6 +292,22 @@ def action_bar() -> rx.Component:
                 width="100%",
                 reset_on_submit=True,
             ),
+            rx.cond(
+                State.queue_position > 0,
+                rx.text(
+                    "Waiting for the model: number ", State.queue_position, " in the queue",
+                    font_size="xs",
+                    color=rx.color("mauve", 10),
+                ),
+            ),
+            rx.cond(
+                State.first_token_ms > 0,
+                rx.text(
+                    "First token in ", State.first_token_ms, " ms",
+                    font_size="xs",
+                    color=rx.color("mauve", 10),
+                ),
+            ),
             align_items="center",
             width="100%",
         ),
@@ -300,10 +348,22 @@ def sidebar() -> rx.Component:
             ),
             rx.button(
                 "Add to Knowledge Base",
-                on_click=State.handle_upload(rx.upload_files()),
+                on_click=[State.set_uploading(True), send_upload(State.handle_upload)],
                 loading=State.uploading,
                 **UPLOAD_BUTTON_STYLE,
             ),
+            rx.cond(
+                State.ingest_job_id != "",
+                rx.vstack(
+                    rx.progress(value=State.ingest_progress, max=100, width="100%"),
+                    rx.button(
+                        "Cancel",
+                        on_click=State.cancel_ingest,
+                        **UPLOAD_BUTTON_STYLE,
+                    ),
+                    align_items="stretch",
+                ),
+            ),
             rx.cond(
                 State.pdf_filename != "",
                 pdf_preview(),
@@ -0,0 +1,189 @@
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, ContextManager, Dict, List, Optional
+
+from embedchain import App
+from embedchain.chunkers.pdf_file import PdfFileChunker
+
+from chat.pages import iter_pages, page_count
+
+# Ingestion runs on its own pool so embedding never blocks the event loop.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+_jobs: Dict[str, "IngestJob"] = {}
+_jobs_lock = threading.Lock()
+
+
+class IngestCancelled(Exception):
+    """Raised inside the pipeline when the job has been cancelled."""
+
+
+@dataclass
+class IngestJob:
+    """Progress of one PDF moving through parse -> embed -> store."""
+    id: str
+    path: str
+    filename: str
+    status: str = "queued"
+    error: str = ""
+    pages_total: int = 0
+    pages_parsed: int = 0
+    chunks_created: int = 0
+    chunks_embedded: int = 0
+    chunks_stored: int = 0
+    future: Optional[Future] = field(default=None, repr=False)
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def percent(self) -> int:
+        """Rough overall progress: pages parsed times the share of chunks stored."""
+        if not self.pages_total:
+            return 0
+        parsed = self.pages_parsed / self.pages_total
+        stored = self.chunks_stored / self.chunks_created if self.chunks_created else 0
+        return int(100 * parsed * stored)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise IngestCancelled()
+
+    def describe(self) -> str:
+        """One-line status for the sidebar."""
+        if self.status == "queued":
+            return f"Queued {self.filename}"
+        if self.status == "running":
+            return (
+                f"{self.filename}: parsed {self.pages_parsed}/{self.pages_total} pages, "
+                f"embedded {self.chunks_embedded}, stored {self.chunks_stored} chunks"
+            )
+        if self.status == "done":
+            return f"Added {self.filename} to knowledge base"
+        if self.status == "cancelled":
+            return f"Cancelled {self.filename}"
+        return f"Error: {self.error}"
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _run(job: IngestJob, open_app: Callable[[], ContextManager[App]]):
+    """Parse the PDF page by page, embedding and storing chunks in batches."""
+    try:
+        with open_app() as app:
+            _ingest(job, app)
+    except Exception as e:
+        # Opening the App failed; _ingest reports its own errors.
+        job.error = str(e)
+        job.status = "failed"
+
+
+def _ingest(job: IngestJob, app: App):
+    job.status = "running"
+    app_id = app.config.id
+    splitter = PdfFileChunker().text_splitter
+    collection = app.db.collection
+    doc_id = None
+
+    documents: List[str] = []
+    metadatas: List[dict] = []
+    ids: List[str] = []
+    seen = set()
+
+    def flush():
+        if not documents:
+            return
+        job.check_cancelled()
+        embeddings = app.embedder.embedding_fn(documents)
+        job.chunks_embedded += len(documents)
+        job.check_cancelled()
+        collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        job.chunks_stored += len(documents)
+        documents.clear()
+        metadatas.clear()
+        ids.clear()
+
+    try:
+        doc_id = _file_hash(job.path)
+        if app_id is not None:
+            doc_id = f"{app_id}--{doc_id}"
+        job.pages_total = page_count(job.path)
+        # Later pages are parsed in other processes while this thread embeds.
+        for page_number, text in iter_pages(job.path, total=job.pages_total):
+            job.check_cancelled()
+            job.pages_parsed += 1
+            for chunk in splitter.split_text(text):
+                chunk_id = hashlib.sha256((chunk + job.path).encode()).hexdigest()
+                if app_id is not None:
+                    chunk_id = f"{app_id}--{chunk_id}"
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                metadata = {
+                    "url": job.path,
+                    "page": page_number,
+                    "data_type": "pdf_file",
+                    "doc_id": doc_id,
+                    "hash": doc_id,
+                }
+                if app_id:
+                    metadata["app_id"] = app_id
+                documents.append(chunk)
+                metadatas.append(metadata)
+                ids.append(chunk_id)
+                job.chunks_created += 1
+            if len(documents) >= EMBED_BATCH_SIZE:
+                flush()
+        flush()
+        job.status = "done"
+    except IngestCancelled:
+        job.status = "cancelled"
+    except Exception as e:
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        if job.status != "done" and doc_id is not None:
+            # Don't leave a half-indexed document behind.
+            collection.delete(where={"doc_id": doc_id})
+
+
+def start_ingest(open_app: Callable[[], ContextManager[App]], path: str, filename: str) -> IngestJob:
+    """Queue `path` for ingestion into the App `open_app()` yields, and return its job."""
+    job = IngestJob(id=uuid.uuid4().hex, path=path, filename=filename)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job.future = _executor.submit(_run, job, open_app)
+    return job
+
+
+def get_job(job_id: str) -> Optional[IngestJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def cancel_job(job_id: str):
+    job = get_job(job_id)
+    if job is not None:
+        job.cancel()
+
+
+def forget_job(job_id: str):
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
@@ -0,0 +1,65 @@
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from embedchain import App
+
+from chat.app_registry import app_registry
+from chat.reembed import Generation, Generations, MigrationProgress, batched_embedding_fn
+
+# Where the knowledge base is kept. It outlives the process, so changing
+# EMBED_MODEL migrates the stored vectors instead of dropping them.
+DATA_DIR = Path(os.getenv("PDF_DATA_DIR", "pdf_data"))
+LLM_MODEL = "llama3.2:latest"
+OLLAMA_URL = "http://localhost:11434"
+
+generations = Generations(DATA_DIR)
+# Nothing has opened the vectors yet, so those retired by a migration can go.
+generations.purge()
+
+
+def get_config(generation: Optional[Generation] = None) -> dict:
+    """The embedchain config for the knowledge base embedded with `generation`."""
+    generation = generation or generations.active()
+    return {
+        "llm": {
+            "provider": "ollama",
+            "config": {
+                "model": LLM_MODEL,
+                "max_tokens": 250,
+                "temperature": 0.5,
+                "stream": True,
+                "base_url": OLLAMA_URL,
+            },
+        },
+        "vectordb": {"provider": "chroma", "config": {"dir": str(generations.path(generation))}},
+        "embedder": {
+            "provider": "ollama",
+            "config": {"model": generation.model, "base_url": OLLAMA_URL},
+        },
+    }
+
+
+def get_app(generation: Optional[Generation] = None) -> App:
+    """The warm App for the active vectors; starts a pending re-embedding."""
+    if generation is None and generations.pending():
+        generations.migrate_in_background(migrate)
+    return app_registry.get(get_config(generation))
+
+
+@contextmanager
+def writable_app() -> Iterator[App]:
+    """The App to ingest into, held so a re-embedding cannot cut over mid-write."""
+    with generations.writing() as generation:
+        yield get_app(generation)
+
+
+def migrate() -> MigrationProgress:
+    """Re-embed the knowledge base with the configured embedding model."""
+    target = generations.target()
+    return generations.migrate(
+        lambda generation: get_app(generation).db.client,
+        batched_embedding_fn(target.model, OLLAMA_URL),
+        on_retire=lambda old: app_registry.evict(get_config(old)),
+    )
@@ -0,0 +1,32 @@
+"""Re-embed the stored knowledge base with EMBED_MODEL.
+
+The app starts this by itself, in the background, the first time it runs
+with a new EMBED_MODEL; queries use the old vectors until it has finished.
+Run `python -m chat.migrate` to do it up front while the app is stopped.
+"""
+import sys
+import threading
+
+from chat.knowledge_base import generations, migrate
+
+
+def main() -> int:
+    if not generations.pending():
+        print(f"Vectors are already embedded with {generations.model}.")
+        return 0
+    worker = threading.Thread(target=migrate, daemon=True)
+    worker.start()
+    while worker.is_alive():
+        worker.join(2)
+        if generations.progress.status == "running":
+            print(generations.progress.describe(), flush=True)
+    print(generations.progress.describe())
+    if generations.progress.status != "done":
+        return 1
+    # Nothing else is reading the old vectors while the app is stopped.
+    generations.purge()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import math
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from pypdf import PdfReader
+
+# Text extraction is CPU bound, so pages are parsed in worker processes.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+# Shards each worker parses per PDF. Every shard reopens the PDF, which for
+# a long one costs about as much as parsing a handful of pages, so shards
+# are sized from the page count rather than fixed.
+SHARDS_PER_WORKER = int(os.getenv("PARSE_SHARDS_PER_WORKER", "4"))
+# Tasks allowed to run ahead of the consumer, per worker.
+PARSE_AHEAD = int(os.getenv("PARSE_AHEAD", "2"))
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # Forking a server that is running threads is unsafe; spawn instead.
+            pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pools[workers] = pool
+        return pool
+
+
+def page_count(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def _extract(path: str, start: int, stop: int) -> List[str]:
+    """Text of pages [start, stop). Runs in a worker process."""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_pages(
+    path: str,
+    total: Optional[int] = None,
+    workers: int = PARSE_WORKERS,
+    pages_per_task: Optional[int] = None,
+    ahead: int = PARSE_AHEAD,
+) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) in order while later pages parse in parallel.
+
+    The PDF is split into shards of `pages_per_task` pages, by default
+    SHARDS_PER_WORKER per worker, that run on a process pool. At most `workers * ahead` shards are in flight, so memory
+    is bounded no matter how far the pool could get ahead of whoever is
+    consuming the pages (typically the embedder). Closing the generator
+    cancels the shards that haven't started. With one worker the pages are
+    parsed in the calling thread.
+    """
+    if workers <= 1:
+        # A single worker gains nothing from the pool, and each shard would
+        # pay for reopening the PDF; parse here with one reader instead.
+        reader = PdfReader(path)
+        for page_number, page in enumerate(reader.pages):
+            yield page_number, page.extract_text() or ""
+        return
+    if total is None:
+        total = page_count(path)
+    if pages_per_task is None:
+        pages_per_task = math.ceil(total / (workers * SHARDS_PER_WORKER))
+    pages_per_task = max(pages_per_task, 1)
+    pool = _pool(workers)
+    depth = max(workers * ahead, 1)
+    shards: Deque = deque()
+    next_page = 0
+    try:
+        while shards or next_page < total:
+            while next_page < total and len(shards) < depth:
+                stop = min(next_page + pages_per_task, total)
+                shards.append((next_page, pool.submit(_extract, path, next_page, stop)))
+                next_page = stop
+            start, future = shards.popleft()
+            for offset, text in enumerate(future.result()):
+                yield start + offset, text
+    finally:
+        for _, future in shards:
+            future.cancel()
@@ -0,0 +1,129 @@
+import asyncio
+import os
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional
+
+# How many answers may be generated by Ollama at the same time.
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "1"))
+
+
+class Ticket:
+    """One session's claim on a generation slot."""
+
+    def __init__(self, scheduler: "GenerationScheduler", session: str):
+        self.scheduler = scheduler
+        self.session = session
+        self.cancelled = False
+        self._granted: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._task: Optional[asyncio.Task] = asyncio.current_task()
+
+    @property
+    def position(self) -> int:
+        """1-based place in the queue, or 0 once the ticket holds a slot."""
+        return self.scheduler.position(self)
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait up to `timeout` seconds for a slot; True once one is held."""
+        try:
+            await asyncio.wait_for(asyncio.shield(self._granted), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def cancel(self):
+        """Drop out of the queue, or stop the owner of a running ticket.
+
+        A running ticket keeps its slot until the owner calls `release`,
+        which it does only after the token stream's worker has exited, so
+        the next session never shares Ollama with an abandoned answer.
+        """
+        if self.cancelled:
+            return
+        self.cancelled = True
+        owner = self._task if self._task is not asyncio.current_task() else None
+        if self not in self.scheduler._running or owner is None:
+            self.scheduler._discard(self)
+        if owner is not None:
+            # Interrupts whatever the owner is awaiting, which for a running
+            # ticket is the token stream; closing it aborts the Ollama request.
+            owner.cancel()
+
+    def release(self):
+        """Give the slot back once the answer is finished."""
+        self.scheduler._discard(self)
+
+
+class GenerationScheduler:
+    """Hands out a fixed number of generation slots round-robin by session.
+
+    Each session queues its own tickets; whenever a slot frees up the next
+    session in the rotation gets it, so one user asking many questions waits
+    behind everyone else rather than in front. Everything runs on the event
+    loop, so no locking is needed.
+    """
+
+    def __init__(self, limit: int = GENERATION_CONCURRENCY):
+        self.limit = max(limit, 1)
+        self._waiting: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+        self._running: List[Ticket] = []
+
+    def submit(self, session: str) -> Ticket:
+        """Queue a ticket for `session`; await `Ticket.wait` to get the slot."""
+        ticket = Ticket(self, session)
+        self._waiting.setdefault(session, deque()).append(ticket)
+        self._dispatch()
+        return ticket
+
+    def cancel(self, session: str) -> int:
+        """Cancel every queued or running ticket of `session`."""
+        tickets = [t for t in self._running if t.session == session]
+        tickets += list(self._waiting.get(session, ()))
+        for ticket in tickets:
+            ticket.cancel()
+        return len(tickets)
+
+    def position(self, ticket: Ticket) -> int:
+        if ticket not in self._waiting.get(ticket.session, ()):
+            return 0
+        depth = self._waiting[ticket.session].index(ticket)
+        # Every session gets up to `depth` turns before this ticket's round,
+        # and the sessions ahead of it in the rotation get one more.
+        ahead = sum(min(len(queue), depth) for queue in self._waiting.values())
+        for session, queue in self._waiting.items():
+            if session == ticket.session:
+                break
+            if len(queue) > depth:
+                ahead += 1
+        return ahead + 1
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._waiting.values())
+
+    def describe(self) -> str:
+        return f"{len(self._running)}/{self.limit} generating, {self.queued} queued"
+
+    def _discard(self, ticket: Ticket):
+        if ticket in self._running:
+            self._running.remove(ticket)
+        else:
+            queue = self._waiting.get(ticket.session)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._waiting[ticket.session]
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiting and len(self._running) < self.limit:
+            session, queue = next(iter(self._waiting.items()))
+            ticket = queue.popleft()
+            # The session goes to the back of the rotation for its next turn.
+            del self._waiting[session]
+            if queue:
+                self._waiting[session] = queue
+            self._running.append(ticket)
+            ticket._granted.set_result(None)
+
+
+scheduler = GenerationScheduler()
@@ -0,0 +1,198 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+
+import ollama
+from embedchain import App
+
+# How long to accumulate tokens before pushing a delta to the browser.
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.05"))
+
+_DONE = object()
+
+
+@dataclass
+class StreamStats:
+    """Timing for one streamed answer."""
+    started: float = 0.0
+    first_token: Optional[float] = None
+    finished: Optional[float] = None
+    tokens: int = 0
+    flushes: int = 0
+
+    @property
+    def ttft_ms(self) -> int:
+        """Milliseconds from the request to the first token."""
+        if self.first_token is None:
+            return 0
+        return int((self.first_token - self.started) * 1000)
+
+    @property
+    def tokens_per_second(self) -> float:
+        if self.first_token is None or self.finished is None or self.finished <= self.first_token:
+            return 0.0
+        return self.tokens / (self.finished - self.first_token)
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class _Abort:
+    """Callbacks that cut a worker's blocking I/O short once its reader is gone."""
+
+    def __init__(self):
+        self.aborted = False
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, callback: Callable[[], None]):
+        with self._lock:
+            if not self.aborted:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+_worker = threading.local()
+
+
+def on_abort(callback: Callable[[], None]):
+    """Run `callback` if the stream this worker thread produces is abandoned."""
+    abort = getattr(_worker, "abort", None)
+    if abort is not None:
+        abort.register(callback)
+
+
+def _shutdown(sock: socket.socket):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def _abort_on_stop(response):
+    # Shutting the socket down ends a blocked read at once, even while
+    # Ollama is still evaluating the prompt; closing it does not. Ollama
+    # stops generating when the connection drops.
+    sock = response.extensions["network_stream"].get_extra_info("socket")
+    if sock is not None:
+        on_abort(lambda: _shutdown(sock))
+
+
+def stream_answer(app: App, question: str) -> Iterator[str]:
+    """Retrieve context through embedchain and stream the answer from Ollama.
+
+    embedchain's Ollama wrapper only streams to stdout callbacks, so we let
+    it build the prompt (retrieval and chat history included) and talk to
+    Ollama ourselves. `app.chat(dry_run=True)` would store the prompt as
+    the answer, so the history is loaded and recorded here instead.
+    """
+    app.llm.update_history(app_id=app.config.id)
+    prompt = app.query(question, dry_run=True)
+    config = app.llm.config
+    client = ollama.Client(host=config.base_url, event_hooks={"response": [_abort_on_stop]})
+    response = client.generate(
+        model=config.model,
+        prompt=prompt,
+        system=config.system_prompt,
+        stream=True,
+        options={"temperature": config.temperature, "num_predict": config.max_tokens},
+    )
+    answer = []
+    try:
+        for part in response:
+            if part["response"]:
+                answer.append(part["response"])
+                yield part["response"]
+    finally:
+        response.close()
+    app.llm.add_history(app.config.id, question, "".join(answer))
+
+
+async def stream_in_thread(
+    factory: Callable[..., Iterator[str]],
+    *args,
+    interval: float = STREAM_FLUSH_INTERVAL,
+    stats: Optional[StreamStats] = None,
+) -> AsyncIterator[str]:
+    """Run a blocking token generator on a worker thread.
+
+    Tokens are coalesced so that at most one delta is yielded per `interval`
+    seconds. Closing the async iterator aborts the worker's request and
+    waits for the worker to finish, so callers holding a generation slot
+    only give it back once Ollama has really stopped.
+    """
+    stats = stats if stats is not None else StreamStats()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    abort = _Abort()
+
+    def produce():
+        _worker.abort = abort
+        tokens = None
+        try:
+            tokens = factory(*args)
+            for token in tokens:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, token)
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, _Failure(e))
+        finally:
+            close = getattr(tokens, "close", None)
+            if close is not None:
+                close()
+            _worker.abort = None
+            loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+    stats.started = time.perf_counter()
+    worker = loop.run_in_executor(None, produce)
+    buffer = []
+    deadline = None
+    try:
+        while True:
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            if item is not None:
+                if stats.first_token is None:
+                    stats.first_token = time.perf_counter()
+                    # Push the first token straight away; it is what users wait for.
+                    deadline = loop.time()
+                elif deadline is None:
+                    deadline = loop.time() + interval
+                stats.tokens += 1
+                buffer.append(item)
+            if buffer and loop.time() >= deadline:
+                stats.flushes += 1
+                yield "".join(buffer)
+                buffer.clear()
+                deadline = None
+        if buffer:
+            stats.flushes += 1
+            yield "".join(buffer)
+    finally:
+        stop.set()
+        stats.finished = time.perf_counter()
+        abort.abort()
+        await worker
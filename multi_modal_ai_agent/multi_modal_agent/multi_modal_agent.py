@@ -6,6 +6,9 @@ from phi.tools.duckduckgo import DuckDuckGo
 import time
 import asyncio
 
+from multi_modal_agent import uploads
+from multi_modal_agent.uploads import UploadFailed, received_upload, send_upload
+
 
 class State(rx.State):
     """State for the multimodal AI agent application."""
@@ -16,27 +19,16 @@ class State(rx.State):
     video: str = ""
     question: str = ""
 
-    async def handle_upload(self, files: list[rx.UploadFile]):
-        """Handle video file upload."""
-        if not files:
-            return
-            
+    def handle_upload(self, response: dict):
+        """Handle a video the browser has streamed to disk."""
         try:
-            file = files[0]
-            upload_data = await file.read()
-            
-            filename = file.filename
-            outfile = rx.get_upload_dir() / filename
-            
-            # Save the file
-            with outfile.open("wb") as file_object:
-                file_object.write(upload_data)
+            upload = received_upload(response)
 
-            self.video_filename = filename
-            self.video = outfile
-            self.upload_status = "Video uploaded successfully!"
+            self.video_filename = upload.path.name
+            self.video = str(upload.path)
+            self.upload_status = f"Video uploaded successfully! ({upload.describe()})"
             
-        except Exception as e:
+        except UploadFailed as e:
             self.upload_status = f"Error uploading video: {str(e)}"
 
     @rx.event(background=True)        
@@ -116,7 +108,7 @@ def index():
                     ),
                 rx.button(
                     "Upload",
-                    on_click=State.handle_upload(rx.upload_files(upload_id="upload1"))
+                    on_click=send_upload(State.handle_upload, upload_id="upload1")
                 ),
                 rx.text(State.upload_status),
                 spacing="4",
@@ -166,4 +158,5 @@ def index():
 
 
 app = rx.App()
-app.add_page(index)
\ No newline at end of file
+app.add_page(index)
+uploads.register(app)
\ No newline at end of file
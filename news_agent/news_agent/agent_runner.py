@@ -0,0 +1,95 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+# Swarm calls running at once; further requests queue for a free worker.
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "4"))
+# Seconds a request may take, queueing included, before it is abandoned.
+AGENT_TIMEOUT = float(os.getenv("AGENT_TIMEOUT", "180"))
+
+
+class AgentCancelled(Exception):
+    """The request was cancelled, or timed out, before the agent finished."""
+
+
+class AgentTimeout(AgentCancelled):
+    """The request took longer than its timeout."""
+
+
+class AgentRunner:
+    """Runs blocking Swarm calls on a bounded thread pool.
+
+    `Swarm.run` blocks for the whole LLM round-trip, which inside an async
+    event handler stalls every session served by the same event loop. Here
+    each run happens on a worker thread in streaming mode, so a cancelled
+    or timed-out request stops at the next chunk and frees its worker
+    instead of running to completion in the background.
+    """
+
+    def __init__(self, client, workers: int = AGENT_WORKERS, timeout: float = AGENT_TIMEOUT):
+        self.client = client
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent")
+        self._cancels: Dict[str, Set[threading.Event]] = {}
+        self._lock = threading.Lock()
+
+    def _run(self, cancel: threading.Event, agent, messages: List[dict], kwargs: dict):
+        if cancel.is_set():
+            raise AgentCancelled()
+        chunks = self.client.run(agent=agent, messages=messages, stream=True, **kwargs)
+        try:
+            for chunk in chunks:
+                if cancel.is_set():
+                    raise AgentCancelled()
+                if "response" in chunk:
+                    return chunk["response"]
+        finally:
+            # Closes the model's HTTP stream when we stop early.
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+        raise RuntimeError("The agent finished without a response.")
+
+    async def run(self, agent, messages: List[dict], key: Optional[str] = None,
+                  timeout: Optional[float] = None, **kwargs):
+        """Run `agent` on `messages` and return Swarm's Response.
+
+        `key` groups requests so `cancel(key)` can stop them, e.g. a
+        session's. Raises AgentTimeout after `timeout` seconds.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        cancel = threading.Event()
+        if key is not None:
+            with self._lock:
+                self._cancels.setdefault(key, set()).add(cancel)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self._run, cancel, agent, messages, kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self._abandon(future, cancel)
+            raise AgentTimeout(f"The agent took longer than {timeout:.0f} s.") from None
+        except asyncio.CancelledError:
+            self._abandon(future, cancel)
+            raise
+        finally:
+            if key is not None:
+                with self._lock:
+                    events = self._cancels.get(key, set())
+                    events.discard(cancel)
+                    if not events:
+                        self._cancels.pop(key, None)
+
+    @staticmethod
+    def _abandon(future: asyncio.Future, cancel: threading.Event):
+        cancel.set()
+        # Nobody awaits the worker's AgentCancelled; don't log it as unhandled.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def cancel(self, key: str):
+        """Stop every running or queued request made under `key`."""
+        with self._lock:
+            for event in self._cancels.get(key, ()):
+                event.set()
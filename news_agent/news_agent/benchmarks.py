@@ -0,0 +1,443 @@
+"""Benchmarks for the news agent's request handling.
+
+Run from the app directory with `python -m news_agent.benchmarks [name ...]`.
+Swarm is replaced by FakeSwarm, whose runs sleep like a model would, so
+the numbers show what the app does around the model rather than the model.
+"""
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import List
+
+from news_agent.agent_runner import AgentRunner
+from news_agent.dedup import clusters, dedupe
+from news_agent.digests import Digests
+from news_agent.map_reduce import estimate_tokens
+from news_agent.pipeline import NewsPipeline
+from news_agent.search import Article, NewsCache, format_articles, normalize_topic
+
+
+class FakeSwarm:
+    """Stands in for `swarm.Swarm`: blocks for `seconds`, then answers.
+
+    An agent with `functions` takes two turns, like a real tool call: one
+    to choose the call, which then runs on the topic, and one to present
+    its result.
+    """
+
+    def __init__(self, seconds: float = 0.5, chunks: int = 50,
+                 prefill_seconds_per_1k: float = 0.0, reply_chars: int = 0):
+        self.seconds = seconds
+        self.chunks = chunks
+        # Reading the prompt costs time too, in proportion to its length.
+        self.prefill_seconds_per_1k = prefill_seconds_per_1k
+        self.reply_chars = reply_chars
+        self.prompt_tokens = 0
+        self.calls = 0
+        self.turns = 0
+
+    def run(self, agent, messages, stream=False, **kwargs):
+        self.calls += 1
+        functions = getattr(agent, "functions", None) or []
+        self.turns += 2 if functions else 1
+        tokens = estimate_tokens(messages[-1]["content"])
+        self.prompt_tokens += tokens
+        prefill = self.prefill_seconds_per_1k * tokens / 1000
+        if not stream:
+            time.sleep(prefill + self.seconds * (2 if functions else 1))
+            return self._response(agent, messages, functions)
+        return self._stream(agent, messages, functions, prefill)
+
+    def _response(self, agent, messages, functions):
+        content = messages[-1]["content"]
+        if functions:
+            reply = functions[0](content.rsplit(" about ", 1)[-1])
+        else:
+            reply = f"{getattr(agent, 'name', 'agent')} on: {content[:40]}"
+            reply = reply.ljust(self.reply_chars, ".")
+        return SimpleNamespace(messages=[{"role": "assistant", "content": reply}])
+
+    def _stream(self, agent, messages, functions, prefill=0.0):
+        time.sleep(prefill)
+        for turn in range(2 if functions else 1):
+            for _ in range(self.chunks):
+                time.sleep(self.seconds / self.chunks)
+                yield {"content": "token"}
+        yield {"response": self._response(agent, messages, functions)}
+
+
+async def _watch_lag(stop: asyncio.Event, interval: float = 0.01) -> List[float]:
+    """How late each `interval` tick fires, in seconds, until `stop` is set."""
+    lags = []
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+    return lags
+
+
+def bench_loop_lag(users=(1, 4, 16), llm_seconds=0.5):
+    """Event-loop lag while N users each run the search + summary agents."""
+    agent = SimpleNamespace(name="agent")
+    messages = [{"role": "user", "content": "Find recent news about AI Agents"}]
+
+    async def blocking(client, runner):
+        # What process_news used to do: call Swarm on the event loop.
+        client.run(agent=agent, messages=messages)
+        client.run(agent=agent, messages=messages)
+
+    async def threaded(client, runner):
+        await runner.run(agent, messages)
+        await runner.run(agent, messages)
+
+    async def measure(handler, count):
+        client = FakeSwarm(llm_seconds)
+        runner = AgentRunner(client, workers=count)
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(_watch_lag(stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(handler(client, runner) for _ in range(count)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        lags = sorted(await watcher) or [0.0]
+        return elapsed, lags[len(lags) // 2], lags[-1]
+
+    print(f"each agent call takes {llm_seconds:.1f} s; two calls per user")
+    print(f"{'users':>5} {'mode':>9} {'wall s':>7} {'p50 lag ms':>10} {'max lag ms':>10}")
+    for count in users:
+        for name, handler in (("on loop", blocking), ("threaded", threaded)):
+            elapsed, p50, worst = asyncio.run(measure(handler, count))
+            print(f"{count:>5} {name:>9} {elapsed:>7.2f} {p50 * 1000:>10.1f} {worst * 1000:>10.0f}")
+
+
+def bench_timeout(llm_seconds=2.0, timeout=0.5):
+    """A timed-out request frees its worker within a chunk, not a full run."""
+    client = FakeSwarm(llm_seconds)
+    runner = AgentRunner(client, workers=1, timeout=timeout)
+    agent = SimpleNamespace(name="agent")
+    messages = [{"role": "user", "content": "slow"}]
+
+    async def main():
+        start = time.perf_counter()
+        try:
+            await runner.run(agent, messages)
+        except Exception as e:
+            print(f"first request: {type(e).__name__} after {time.perf_counter() - start:.2f} s")
+        client.seconds = 0.1
+        start = time.perf_counter()
+        await runner.run(agent, messages)
+        print(f"next request on the same worker done in {time.perf_counter() - start:.2f} s")
+
+    asyncio.run(main())
+
+
+def _fake_search(seconds: float):
+    # About the size of a DuckDuckGo result snippet.
+    def search(topic: str, max_results: int):
+        time.sleep(seconds)
+        return [
+            Article(f"{topic} story {i}", f"https://example.com/{i}",
+                    " ".join(f"word{i}x{k}" for k in range(36)))
+            for i in range(max_results)
+        ]
+    return search
+
+
+def bench_pipeline(llm_seconds=1.0, search_seconds=0.8):
+    """End-to-end latency of agent vs direct mode, cold and with a cached search."""
+    topics = ["AI Agents", "ai agents", "AI agents!", "Climate policy", "climate  policy"]
+
+    async def measure(mode):
+        client = FakeSwarm(llm_seconds)
+        cache = NewsCache(_fake_search(search_seconds), ttl=600)
+        tool = lambda topic: format_articles(cache.get(topic), topic)
+        search_agent = SimpleNamespace(name="News Searcher", functions=[tool])
+        summary_agent = SimpleNamespace(name="Synthesizer", functions=[])
+        pipeline = NewsPipeline(AgentRunner(client), search_agent, summary_agent, cache=cache, mode=mode)
+        rows = []
+        for topic in topics:
+            start = time.perf_counter()
+            search = await pipeline.search(topic)
+            await pipeline.summarize(search)
+            rows.append((topic, time.perf_counter() - start))
+        return rows, client.turns, cache
+
+    print(f"model turn {llm_seconds:.1f} s, search {search_seconds:.1f} s")
+    print(f"{'topic':<18} {'agent s':>8} {'direct s':>8}")
+    agent, agent_turns, _ = asyncio.run(measure("agent"))
+    direct, direct_turns, cache = asyncio.run(measure("direct"))
+    for (topic, a), (_, d) in zip(agent, direct):
+        print(f"{topic!r:<18} {a:>8.2f} {d:>8.2f}")
+    print(f"{'total':<18} {sum(r[1] for r in agent):>8.2f} {sum(r[1] for r in direct):>8.2f}")
+    print(f"model turns: {agent_turns} agent mode, {direct_turns} direct mode; "
+          f"search cache {cache.hits} hits / {cache.misses} misses")
+
+
+def bench_coalescing(users=48, topics=("AI Agents", "ai agents!", "Climate Policy", "Elections"),
+                     llm_seconds=1.0, search_seconds=0.8, spread=3.0, stragglers=8):
+    """A burst of users on a few trending topics, with and without coalescing.
+
+    Users arrive evenly over `spread` seconds; `stragglers` more arrive
+    after the burst has been answered.
+    """
+    async def burst(coalesce):
+        client = FakeSwarm(llm_seconds, chunks=10)
+        cache = NewsCache(_fake_search(search_seconds), ttl=0)
+        summary_agent = SimpleNamespace(name="Synthesizer", functions=[])
+        pipeline = NewsPipeline(AgentRunner(client, workers=users), None, summary_agent, cache=cache)
+        latencies = []
+
+        async def user(i, delay):
+            await asyncio.sleep(delay)
+            topic = topics[i % len(topics)]
+            start = time.perf_counter()
+            if coalesce:
+                async with pipeline.subscribe(topic, key=f"session-{i}") as news:
+                    await news.result()
+            else:
+                search = await pipeline.search(topic)
+                await pipeline.summarize(search)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(i, spread * i / users) for i in range(users)))
+        await asyncio.gather(*(user(users + i, 0) for i in range(stragglers)))
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        return elapsed, latencies, client.turns, cache.misses, pipeline.stats
+
+    print(f"{users} users over {spread:.0f} s on {len(topics)} topic spellings, then {stragglers} stragglers")
+    print(f"{'mode':>10} {'wall s':>7} {'p50 s':>6} {'p95 s':>6} {'model turns':>11} {'searches':>8}")
+    for name, coalesce in (("separate", False), ("coalesced", True)):
+        elapsed, lat, turns, searches, stats = asyncio.run(burst(coalesce))
+        p50, p95 = lat[len(lat) // 2], lat[int(len(lat) * 0.95)]
+        print(f"{name:>10} {elapsed:>7.2f} {p50:>6.2f} {p95:>6.2f} {turns:>11} {searches:>8}")
+    print(stats.describe())
+
+
+def bench_coalesced_cancel(llm_seconds=2.0):
+    """Stopping one of two waiting sessions leaves the other's run alone."""
+    async def main():
+        client = FakeSwarm(llm_seconds)
+        cache = NewsCache(_fake_search(0.1), ttl=0)
+        pipeline = NewsPipeline(AgentRunner(client, workers=1), None,
+                                SimpleNamespace(name="Synthesizer", functions=[]), cache=cache)
+
+        async def session(key):
+            start = time.perf_counter()
+            try:
+                async with pipeline.subscribe("AI Agents", key=key) as news:
+                    await news.result()
+                return f"done in {time.perf_counter() - start:.2f} s"
+            except Exception as e:
+                return f"{type(e).__name__} after {time.perf_counter() - start:.2f} s"
+
+        first = asyncio.ensure_future(session("a"))
+        second = asyncio.ensure_future(session("b"))
+        await asyncio.sleep(0.5)
+        pipeline.cancel("a")
+        print(f"stopped session: {await first}; other session: {await second}")
+
+        pipeline.result_ttl = 0
+        start = time.perf_counter()
+        both = [asyncio.ensure_future(session(k)) for k in ("c", "d")]
+        await asyncio.sleep(0.5)
+        pipeline.cancel("c")
+        pipeline.cancel("d")
+        await asyncio.gather(*both)
+        client.seconds = 0.1
+        outcome = await session("e")
+        print(f"both stopped; the next request on the single worker: {outcome}, "
+              f"{time.perf_counter() - start:.2f} s after they started")
+
+    asyncio.run(main())
+
+
+def bench_map_reduce(counts=(3, 20, 100), llm_seconds=1.0, prefill_seconds_per_1k=0.5,
+                     budget=1024, concurrency=(4, 16)):
+    """Wall time to summarize N articles: one prompt vs map-reduce in the budget.
+
+    A real model truncates a prompt beyond its context, so "one prompt"
+    over budget only shows what the wall time would be if it did not.
+    """
+    async def measure(count, budget, cap):
+        client = FakeSwarm(llm_seconds, chunks=10, prefill_seconds_per_1k=prefill_seconds_per_1k,
+                           reply_chars=800)
+        agent = SimpleNamespace(name="agent", functions=[])
+        pipeline = NewsPipeline(AgentRunner(client, workers=16), None, agent, agent,
+                                cache=NewsCache(_fake_search(0), ttl=0), articles=count,
+                                budget=budget, concurrency=cap)
+        search = await pipeline.search("AI Agents")
+        start = time.perf_counter()
+        result = await pipeline.summarize(search)
+        return time.perf_counter() - start, result, estimate_tokens(search.raw_news)
+
+    print(f"model turn {llm_seconds:.1f} s + {prefill_seconds_per_1k:.1f} s per 1k prompt tokens; "
+          f"budget {budget} tokens")
+    header = "".join(f" {f'cap {cap} s':>9}" for cap in concurrency)
+    print(f"{'N':>4} {'tokens':>6} {'one prompt s':>12}{header} {'calls':>5} {'depth':>5}")
+    for count in counts:
+        single, _, tokens = asyncio.run(measure(count, 10 ** 9, 1))
+        row = ""
+        for cap in concurrency:
+            elapsed, result, _ = asyncio.run(measure(count, budget, cap))
+            row += f" {elapsed:>9.2f}"
+        note = "" if tokens <= budget else "  one prompt over budget"
+        print(f"{count:>4} {tokens:>6} {single:>12.2f}{row} {result.calls:>5} {result.depth:>5}{note}")
+
+
+def _syndicated(stories: int, copies: int, seed: int = 1) -> "tuple[List[Article], List[int]]":
+    """Search results where each story appears as up to `copies` syndicated copies.
+
+    Copies differ by a few edited words and by where their snippet starts
+    and ends. Different stories share a topical vocabulary, as results for
+    one search do.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(3000)]
+    topical = vocabulary[:40]
+    articles, labels = [], []
+    for story in range(stories):
+        title = rng.sample(vocabulary, 8)
+        body = [rng.choice(topical) if rng.random() < 0.3 else rng.choice(vocabulary) for _ in range(50)]
+        for copy in range(rng.randint(1, copies)):
+            edited = [rng.choice(vocabulary) if rng.random() < 0.03 else w for w in body]
+            start, cut = rng.randint(0, 5), rng.randint(0, 5)
+            articles.append(Article(
+                " ".join(([rng.choice(["Reuters:", "AP:", "Update:"])] if copy else []) + title),
+                f"https://site{copy}.example/{story}",
+                " ".join(edited[start:len(edited) - cut]),
+            ))
+            labels.append(story)
+    order = list(range(len(articles)))
+    rng.shuffle(order)
+    return [articles[i] for i in order], [labels[i] for i in order]
+
+
+def bench_dedup(sizes=((3, 2), (20, 4), (100, 4)), llm_seconds=1.0, prefill_seconds_per_1k=0.5):
+    """Near-duplicate removal on syndicated results: accuracy, cost and savings.
+
+    (stories, copies): each story appears 1..copies times, lightly edited.
+    """
+    print(f"{'results':>7} {'stories':>7} {'kept':>4} {'precision':>9} {'recall':>6} "
+          f"{'ms':>5} {'tokens':>11} {'summary s':>12}")
+    for stories, copies in sizes:
+        articles, labels = _syndicated(stories, copies)
+        start = time.perf_counter()
+        groups = clusters(articles)
+        elapsed = time.perf_counter() - start
+        kept, report = dedupe(articles)
+        same = {(i, j) for i in range(len(labels)) for j in range(i + 1, len(labels)) if labels[i] == labels[j]}
+        found = {(i, j) for group in groups for n, i in enumerate(group) for j in group[n + 1:]}
+        precision = len(same & found) / len(found) if found else 1.0
+        recall = len(same & found) / len(same) if same else 1.0
+
+        async def summarize(articles):
+            client = FakeSwarm(llm_seconds, chunks=10, prefill_seconds_per_1k=prefill_seconds_per_1k,
+                               reply_chars=800)
+            agent = SimpleNamespace(name="agent", functions=[])
+            pipeline = NewsPipeline(AgentRunner(client, workers=16), None, agent, agent, concurrency=16)
+            search_result = SimpleNamespace(articles=articles, raw_news="")
+            start = time.perf_counter()
+            await pipeline.summarize(search_result)
+            return time.perf_counter() - start
+
+        before, after = asyncio.run(summarize(articles)), asyncio.run(summarize(kept))
+        print(f"{len(articles):>7} {stories:>7} {len(kept):>4} {precision:>9.2f} {recall:>6.2f} "
+              f"{elapsed * 1000:>5.1f} {f'{report.tokens_before}->{report.tokens_after}':>11} "
+              f"{f'{before:.2f}->{after:.2f}':>12}")
+
+
+class _FullRefresh(Digests):
+    """Re-summarizes every article whenever a refresh finds something new."""
+
+    async def refresh(self, topic):
+        digest = self._digests.get(normalize_topic(topic))
+        if digest is not None:
+            digest.summary = ""
+        return await super().refresh(topic)
+
+
+def bench_digests(watched=20, unwatched=5, seconds=12.0, refresh_seconds=2.0, max_age=4.0,
+                  new_article_every=3.0, request_every=0.02, articles=20, llm_seconds=0.05):
+    """Watch-list digests under steady traffic, in compressed time.
+
+    Each topic gets a new article about every `new_article_every` seconds;
+    requests pick a topic at random, one in five unwatched. Prompt tokens
+    count the background refreshes only.
+    """
+    async def simulate(digests_class):
+        rng = random.Random(2)
+        start = time.monotonic()
+        offsets = {}
+
+        def search(topic, max_results):
+            # The newest `max_results` articles published on the topic so far.
+            offset = offsets.setdefault(topic, rng.uniform(0, new_article_every))
+            published = int((time.monotonic() - start + offset) / new_article_every) + max_results
+            return [
+                Article(f"{topic} story {n}", f"https://example.com/{topic}/{n}",
+                        " ".join(f"{topic}{n}x{k}" for k in range(36)))
+                for n in range(published - 1, published - max_results - 1, -1)
+            ]
+
+        def pipeline(client):
+            agent = SimpleNamespace(name="agent", functions=[])
+            return NewsPipeline(AgentRunner(client, workers=8), None, agent, agent,
+                                cache=NewsCache(search, ttl=0), articles=articles, result_ttl=0)
+
+        background = FakeSwarm(llm_seconds, chunks=5, reply_chars=1600)
+        on_demand = pipeline(FakeSwarm(llm_seconds, chunks=5, reply_chars=1600))
+        topics = [f"topic{i}" for i in range(watched)]
+        served, computed = [], []
+
+        async def request(topic):
+            started = time.perf_counter()
+            if digests.lookup(topic) is not None:
+                served.append(time.perf_counter() - started)
+                return
+            async with on_demand.subscribe(topic) as news:
+                await news.result()
+            computed.append(time.perf_counter() - started)
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            digests = digests_class(pipeline(background), topics, data_dir, refresh_seconds, max_age)
+            scheduler = asyncio.ensure_future(digests.run())
+            requests = []
+            while time.monotonic() - start < seconds:
+                await asyncio.sleep(request_every)
+                topic = rng.choice(topics + [f"other{i}" for i in range(unwatched)])
+                requests.append(asyncio.ensure_future(request(topic)))
+            await asyncio.gather(*requests)
+            scheduler.cancel()
+        served.sort()
+        computed.sort()
+        return digests.stats, served, computed, background
+
+    print(f"{watched} watched topics refreshed every {refresh_seconds:.0f} s, served up to "
+          f"{max_age:.0f} s old; {articles} articles per search, model turn {llm_seconds:.2f} s")
+    for name, digests_class in (("incremental", Digests), ("full re-summary", _FullRefresh)):
+        stats, served, computed, client = asyncio.run(simulate(digests_class))
+        print(f"{name}: {stats.describe()}")
+        print(f"  latency p50 from a digest {served[len(served) // 2] * 1000:.2f} ms, on demand "
+              f"{computed[len(computed) // 2]:.2f} s; refreshes read {client.prompt_tokens} prompt tokens")
+
+
+BENCHMARKS = {
+    "loop-lag": bench_loop_lag,
+    "timeout": bench_timeout,
+    "pipeline": bench_pipeline,
+    "coalescing": bench_coalescing,
+    "coalesced-cancel": bench_coalesced_cancel,
+    "map-reduce": bench_map_reduce,
+    "dedup": bench_dedup,
+    "digests": bench_digests,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or ["loop-lag"]:
+        BENCHMARKS[name]()
@@ -0,0 +1,112 @@
+import hashlib
+import heapq
+import os
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Sequence, Set, Tuple
+
+from .map_reduce import estimate_tokens
+
+if TYPE_CHECKING:
+    from .search import Article
+
+# Estimated Jaccard similarity above which two articles are the same story.
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.5"))
+SHINGLE_WORDS = 3
+# Hashes kept per article; snippets shorter than this are compared exactly.
+SKETCH_SIZE = 64
+
+
+@dataclass
+class DedupReport:
+    articles: int = 0
+    kept: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def dropped(self) -> int:
+        return self.articles - self.kept
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def describe(self) -> str:
+        if not self.dropped:
+            return ""
+        return f"dropped {self.dropped} duplicate articles (~{self.tokens_saved} tokens)"
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> Set[str]:
+    """Word `size`-grams of `text`; none when it has fewer words than that."""
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def sketch(features: Set[str]) -> List[int]:
+    """Bottom-k MinHash: the SKETCH_SIZE smallest hashes of the features."""
+    return heapq.nsmallest(SKETCH_SIZE, {
+        int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest(), "big") for f in features
+    })
+
+
+def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """Estimated Jaccard similarity of the feature sets behind two sketches.
+
+    Texts without features are similar to nothing, not even each other.
+    """
+    union = heapq.nsmallest(SKETCH_SIZE, set(a) | set(b))
+    both = set(a) & set(b)
+    return sum(h in both for h in union) / len(union) if union else 0.0
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def clusters(articles: List["Article"], threshold: float = DEDUP_THRESHOLD) -> List[List[int]]:
+    """Indexes of `articles` grouped by story, in order of first appearance.
+
+    Articles sharing a URL, or whose title and body shingles are at least
+    `threshold` similar, are grouped. Only pairs whose sketches share a
+    hash are compared, so articles too short to have shingles are only
+    grouped by URL.
+    """
+    sketches = [sketch(shingles(f"{a.title} {a.body}")) for a in articles]
+    parent = list(range(len(articles)))
+    postings: Dict[object, List[int]] = {}
+    for i, article in enumerate(articles):
+        postings.setdefault(article.url, []).append(i)
+        for h in sketches[i]:
+            postings.setdefault(h, []).append(i)
+    candidates: Set[Tuple[int, int]] = set()
+    for members in postings.values():
+        candidates.update((i, j) for n, i in enumerate(members) for j in members[n + 1:])
+    for i, j in sorted(candidates):
+        if _find(parent, i) == _find(parent, j):
+            continue
+        if articles[i].url == articles[j].url or similarity(sketches[i], sketches[j]) >= threshold:
+            parent[_find(parent, j)] = _find(parent, i)
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(articles)):
+        groups.setdefault(_find(parent, i), []).append(i)
+    return sorted(groups.values(), key=lambda group: group[0])
+
+
+def dedupe(articles: List["Article"], threshold: float = DEDUP_THRESHOLD) -> Tuple[List["Article"], DedupReport]:
+    """One article per story: the fullest copy, in the place of the best-ranked one."""
+    kept = [
+        articles[max(group, key=lambda i: len(articles[i].body))]
+        for group in clusters(articles, threshold)
+    ]
+    report = DedupReport(
+        articles=len(articles),
+        kept=len(kept),
+        tokens_before=sum(estimate_tokens(a.format()) for a in articles),
+        tokens_after=sum(estimate_tokens(a.format()) for a in kept),
+    )
+    return kept, report
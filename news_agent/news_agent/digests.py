@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .search import format_articles, normalize_topic
+
+# Topics kept summarized in the background, comma-separated.
+NEWS_WATCHLIST = [t.strip() for t in os.getenv("NEWS_WATCHLIST", "").split(",") if t.strip()]
+# Seconds between refreshes of each watched topic.
+DIGEST_REFRESH_SECONDS = float(os.getenv("DIGEST_REFRESH_SECONDS", "900"))
+# Older digests are not served; the request runs the pipeline instead.
+DIGEST_MAX_AGE = float(os.getenv("DIGEST_MAX_AGE", "1800"))
+# Where digests are kept between restarts.
+DATA_DIR = Path(os.getenv("NEWS_DATA_DIR", "news_data"))
+# Seconds before a failed refresh is retried.
+RETRY_SECONDS = 60
+# Article URLs remembered per topic, to tell new articles from seen ones.
+MAX_SEEN = 500
+# Ages of served digests kept for the staleness figures.
+AGE_SAMPLES = 1000
+
+
+@dataclass
+class Digest:
+    topic: str
+    summary: str
+    seen: List[str] = field(default_factory=list)
+    # When the summary last changed, and when the news was last checked.
+    updated_at: float = 0.0
+    checked_at: float = 0.0
+
+
+@dataclass
+class DigestStats:
+    requests: int = 0
+    hits: int = 0
+    # Watched topics whose digest was missing or too old to serve.
+    stale: int = 0
+    refreshes: int = 0
+    failures: int = 0
+    last_error: str = ""
+    new_articles: int = 0
+    seen_articles: int = 0
+    model_calls: int = 0
+    ages: List[float] = field(default_factory=list)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.requests if self.requests else 0.0
+
+    def record_age(self, age: float):
+        self.ages.append(age)
+        del self.ages[:-AGE_SAMPLES]
+
+    def describe(self) -> str:
+        ages = sorted(self.ages) or [0.0]
+        return (
+            f"{self.hits}/{self.requests} requests served from digests ({self.hit_rate:.0%}), "
+            f"{self.stale} stale; served age p50 {ages[len(ages) // 2]:.0f} s, max {ages[-1]:.0f} s; "
+            f"{self.refreshes} refreshes summarized {self.new_articles} new articles "
+            f"and skipped {self.seen_articles} seen ones in {self.model_calls} model calls"
+        )
+
+
+class Digests:
+    """Summaries of watched topics, kept fresh in the background.
+
+    `run` refreshes each topic every `refresh_seconds`. A refresh searches
+    as usual, but only articles it has not seen before are summarized,
+    merged into the existing summary by the summary agent; when nothing is
+    new, no model is called at all. With NEWS_PIPELINE=agent there are no
+    articles to compare, so every refresh summarizes from scratch. A
+    digest's age counts from the last check that could compare articles.
+    `lookup` hands requests the digest while it is at most `max_age`
+    seconds old. Everything runs on the event loop, so no locking is
+    needed.
+    """
+
+    def __init__(self, pipeline, topics: List[str] = NEWS_WATCHLIST,
+                 data_dir: Path = DATA_DIR, refresh_seconds: float = DIGEST_REFRESH_SECONDS,
+                 max_age: float = DIGEST_MAX_AGE, clock: Callable[[], float] = time.time):
+        self.pipeline = pipeline
+        self.topics = {normalize_topic(t): t for t in topics}
+        self.path = Path(data_dir) / "digests.json"
+        self.refresh_seconds = refresh_seconds
+        self.max_age = max_age
+        self.clock = clock
+        self.stats = DigestStats()
+        self._digests: Dict[str, Digest] = self._load()
+
+    def _load(self) -> Dict[str, Digest]:
+        try:
+            return {key: Digest(**d) for key, d in json.loads(self.path.read_text()).items()}
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def _write(self, data: str):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(data)
+        os.replace(tmp, self.path)
+
+    def age(self, topic: str) -> Optional[float]:
+        """Seconds since the topic's digest was last known current, None if never."""
+        digest = self._digests.get(normalize_topic(topic))
+        return None if digest is None else self.clock() - digest.checked_at
+
+    def lookup(self, topic: str) -> Optional[Digest]:
+        """The watched topic's digest if it is fresh enough to serve."""
+        key = normalize_topic(topic)
+        self.stats.requests += 1
+        if key not in self.topics:
+            return None
+        age = self.age(key)
+        if age is None or age > self.max_age:
+            self.stats.stale += 1
+            return None
+        self.stats.hits += 1
+        self.stats.record_age(age)
+        return self._digests[key]
+
+    async def refresh(self, topic: str) -> Optional[Digest]:
+        key = normalize_topic(topic)
+        runner_key = f"digest:{key}"
+        search = await self.pipeline.search(topic, key=runner_key)
+        digest = self._digests.get(key)
+        if not search.articles:
+            if self.pipeline.mode != "agent":
+                # Nothing was found to compare, so the digest is left to age.
+                return digest
+            # The search agent answers in prose rather than articles, so
+            # there is nothing to diff: summarize everything again.
+            now = self.clock()
+            result = await self.pipeline.summarize(search, key=runner_key)
+            self.stats.refreshes += 1
+            self.stats.model_calls += result.calls
+            digest = Digest(topic, result.summary, updated_at=now, checked_at=now)
+            return await self._store(key, digest)
+        seen = set(digest.seen) if digest else set()
+        new = [a for a in search.articles if a.url not in seen]
+        self.stats.refreshes += 1
+        self.stats.new_articles += len(new)
+        self.stats.seen_articles += len(search.articles) - len(new)
+        now = self.clock()
+        if digest is None or (new and not digest.summary):
+            result = await self.pipeline.summarize(search, key=runner_key)
+            digest = Digest(topic, result.summary, digest.seen if digest else [], updated_at=now)
+            self.stats.model_calls += result.calls
+        elif new:
+            update = replace(search, articles=new, raw_news=format_articles(new, topic))
+            result = await self.pipeline.summarize(update, key=runner_key, previous=digest.summary)
+            digest = replace(digest, summary=result.summary, updated_at=now)
+            self.stats.model_calls += result.calls
+        digest.seen = (digest.seen + [a.url for a in new])[-MAX_SEEN:]
+        digest.checked_at = now
+        return await self._store(key, digest)
+
+    async def _store(self, key: str, digest: Digest) -> Digest:
+        self._digests[key] = digest
+        data = json.dumps({key: asdict(d) for key, d in self._digests.items()})
+        await asyncio.to_thread(self._write, data)
+        return digest
+
+    async def run(self):
+        """Refresh watched topics as they come due, until cancelled."""
+        now = self.clock()
+        due = {}
+        for key in self.topics:
+            age = self.age(key)
+            due[key] = now if age is None else now + self.refresh_seconds - age
+        while True:
+            for key, topic in self.topics.items():
+                if due[key] > self.clock():
+                    continue
+                try:
+                    await self.refresh(topic)
+                    due[key] = self.clock() + self.refresh_seconds
+                except Exception as e:
+                    self.stats.failures += 1
+                    self.stats.last_error = f"{topic}: {e}"
+                    due[key] = self.clock() + min(self.refresh_seconds, RETRY_SECONDS)
+            await asyncio.sleep(max(min(due.values(), default=self.clock() + 60) - self.clock(), 1.0))
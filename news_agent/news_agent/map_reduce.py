@@ -0,0 +1,87 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List
+
+# Tokens of news one model call may be given. Ollama's default context is
+# 2048 tokens, and the summary agent's instructions and answer need the rest.
+SUMMARY_CONTEXT_TOKENS = int(os.getenv("SUMMARY_CONTEXT_TOKENS", "1024"))
+# Model calls one request may run at once while summarizing.
+MAP_CONCURRENCY = int(os.getenv("MAP_CONCURRENCY", "4"))
+
+SEPARATOR = "\n\n"
+
+# call(text, final): a digest of `text`, or the final summary when `final`.
+Summarize = Callable[[str, bool], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """About four characters per token for English text."""
+    return len(text) // 4 + 1
+
+
+def _truncate(text: str, budget: int) -> str:
+    if estimate_tokens(text) <= budget:
+        return text
+    return text[:max(budget - 1, 1) * 4].rsplit(" ", 1)[0] + " …"
+
+
+def pack(texts: List[str], budget: int) -> List[List[str]]:
+    """Group consecutive texts so each group fits `budget` tokens.
+
+    Always makes fewer groups than texts, so repeated packing converges.
+    When no two texts fit together, they are cut to half the budget and
+    paired, so no group ever exceeds it.
+    """
+    groups: List[List[str]] = []
+    # Characters of the group as it will be sent, separators included,
+    # counted the way estimate_tokens counts them.
+    size = 0
+    for text in texts:
+        joined = size + len(SEPARATOR) + len(text)
+        if groups and joined // 4 + 1 <= budget:
+            groups[-1].append(text)
+            size = joined
+        else:
+            groups.append([text])
+            size = len(text)
+    if len(groups) == len(texts) > 1:
+        # Nothing fits together; pair texts up rather than loop forever.
+        texts = [_truncate(text, max(budget // 2, 1)) for text in texts]
+        groups = [texts[i:i + 2] for i in range(0, len(texts), 2)]
+    return groups
+
+
+@dataclass
+class MapReduceStats:
+    calls: int = 0
+    # Levels of digests before the final summary; 0 when one call did it all.
+    depth: int = 0
+    tokens: int = 0
+
+
+async def map_reduce(texts: List[str], call: Summarize, budget: int = SUMMARY_CONTEXT_TOKENS,
+                     concurrency: int = MAP_CONCURRENCY) -> "tuple[str, MapReduceStats]":
+    """Summarize `texts`, however many, without exceeding `budget` per call.
+
+    When everything fits, this is a single final call. Otherwise texts are
+    packed into groups that fit, each group is digested in parallel, and
+    the digests are packed and digested again until they fit one call.
+    Wall time grows with the number of levels, not the number of texts.
+    """
+    stats = MapReduceStats(tokens=sum(estimate_tokens(t) for t in texts))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def digest(group: List[str]) -> str:
+        async with semaphore:
+            stats.calls += 1
+            return await call(SEPARATOR.join(group), False)
+
+    level = [_truncate(text, budget) for text in texts]
+    while True:
+        groups = pack(level, budget)
+        if len(groups) <= 1:
+            stats.calls += 1
+            return await call(SEPARATOR.join(level), True), stats
+        level = [_truncate(d, budget) for d in await asyncio.gather(*(digest(g) for g in groups))]
+        stats.depth += 1
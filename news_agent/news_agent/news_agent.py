@@ -1,11 +1,14 @@
 import reflex as rx
-from duckduckgo_search import DDGS
 from swarm import Swarm, Agent
-from datetime import datetime
 from dotenv import load_dotenv
 import os
 import asyncio
 
+from .agent_runner import AgentCancelled, AgentRunner
+from .digests import Digests
+from .pipeline import NewsPipeline
+from .search import fetch_latest_news
+
 # Load environment variables
 load_dotenv()
 
@@ -13,23 +16,8 @@ load_dotenv()
 
 MODEL = "llama3.2"
 client = Swarm()
-
-def fetch_latest_news(topic):
-    """Retrieve the latest news articles related to a given topic using DuckDuckGo."""
-
-    query = f"{topic} news {datetime.now().strftime('%Y-%m')}"
-    
-    with DDGS() as search_engine:
-        articles = search_engine.text(query, max_results=3)
-        
-        if articles:
-            formatted_results = "\n\n".join(
-                f"Title: {article['title']}\nURL: {article['href']}\nSummary: {article['body']}" 
-                for article in articles
-            )
-            return formatted_results
-        
-        return f"No news articles found on the topic: {topic}."
+# Swarm calls block; they run on worker threads, never on the event loop.
+runner = AgentRunner(client)
 
 # Create specialized agents
 search_agent = Agent(
@@ -74,6 +62,19 @@ summary_agent = Agent(
     model=MODEL
 )
 
+digest_agent = Agent(
+    name="News Digester",
+    instructions="""
+    You condense news material into a short factual digest for a later synthesis step.
+    Keep every key event, player, figure, date and source URL. Drop repetition, opinion and filler.
+    Reply with the digest only, in at most 150 words.
+    """,
+    model=MODEL
+)
+
+pipeline = NewsPipeline(runner, search_agent, summary_agent, digest_agent)
+# Watched topics are summarized ahead of time and served from their digest.
+digests = Digests(pipeline)
 
 
 class State(rx.State):
@@ -83,6 +84,7 @@ class State(rx.State):
     final_summary: str = ""
     is_loading: bool = False
     error_message: str = ""
+    timing: str = ""
 
     @rx.event(background=True)
     async def process_news(self):
@@ -90,31 +92,55 @@ class State(rx.State):
         # Reset previous state
         async with self:
 
+            digest = digests.lookup(self.topic)
+            if digest is not None:
+                self.error_message = ""
+                self.raw_news = ""
+                self.final_summary = digest.summary
+                self.timing = (
+                    f"From the watch-list digest, checked "
+                    f"{digests.age(self.topic) / 60:.0f} min ago"
+                )
+                return
+
             self.is_loading = True
             self.error_message = ""
             self.raw_news = ""
             self.final_summary = ""
+            self.timing = ""
             
             yield
             await asyncio.sleep(1)
 
+            topic = self.topic
+            session = self._session()
+
         try:
-            # Search news using search agent
-            search_response = client.run(
-                agent=search_agent,
-                messages=[{"role": "user", "content": f"Find recent news about {self.topic}"}]
-            )
+            # Requests for the same topic share one search and summary
+            async with pipeline.subscribe(topic, key=session) as news:
+                search = await news.search()
+                async with self:
+                    self.raw_news = search.raw_news
+
+                # Synthesize and Generate summary using summary agent
+                result = await news.result()
+
             async with self:
-                self.raw_news = search_response.messages[-1]["content"]
-            
-            # Synthesize and Generate summary using summary agent
-            summary_response = client.run(
-                agent=summary_agent,
-                messages=[{"role": "user", "content": f"Synthesize these news articles and summarize the synthesis:\n{self.raw_news}"}]
-            )
+                self.final_summary = result.summary
+                self.timing = (
+                    f"Searched in {search.seconds:.1f} s"
+                    f"{' (cached)' if search.cached else ''}, "
+                    f"summarized in {result.summary_seconds:.1f} s"
+                    f"{f' with {result.calls} model calls' if result.calls > 1 else ''}"
+                    f"{f'; {search.dedup.describe()}' if search.dedup.dropped else ''}"
+                    f"{'; shared with other requests for this topic' if news.shared else ''}"
+                )
+                self.is_loading = False
+
+        except AgentCancelled as e:
 
             async with self:
-                self.final_summary = summary_response.messages[-1]["content"]
+                self.error_message = str(e) or "Stopped."
                 self.is_loading = False
 
         except Exception as e:
@@ -123,6 +149,14 @@ class State(rx.State):
                 self.error_message = f"An error occurred: {str(e)}"
                 self.is_loading = False
 
+    def stop_processing(self):
+        """Stop waiting for this session's news; unshared runs are cancelled."""
+        pipeline.cancel(self._session())
+
+    def _session(self) -> str:
+        """Token identifying this browser session to the pipeline."""
+        return self.router.session.client_token
+
     def update_topic(self, topic: str):
         """Update the search topic"""
         self.topic = topic
@@ -145,6 +179,19 @@ def news_page() -> rx.Component:
                 loading=State.is_loading,
                 width="fit-content",
             ),
+            rx.cond(
+                State.is_loading,
+                rx.button(
+                    "Stop",
+                    on_click=State.stop_processing,
+                    variant="outline",
+                    width="fit-content",
+                ),
+            ),
+            rx.cond(
+                State.error_message != "",
+                rx.text(State.error_message, color="red"),
+            ),
             display="flex",
             flex_direction="column",
             gap="1rem",
@@ -156,6 +203,7 @@ def news_page() -> rx.Component:
             rx.vstack(
                 rx.heading("📝 News Summary", size="4"),
                 rx.markdown(State.final_summary),
+                rx.text(State.timing, size="1", color="gray"),
                 rx.button("Copy the Summary", on_click=[rx.set_clipboard(State.final_summary), rx.toast.info("Summary copied")]),
                 spacing="4",
                 width="100%"
@@ -174,4 +222,5 @@ app = rx.App(
         accent_color="blue"
     )
 )
-app.add_page(news_page, route="/")
\ No newline at end of file
+app.add_page(news_page, route="/")
+app.register_lifespan_task(digests.run)
\ No newline at end of file
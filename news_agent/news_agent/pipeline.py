@@ -0,0 +1,296 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from .agent_runner import AgentCancelled
+from .dedup import DedupReport, dedupe
+from .map_reduce import MAP_CONCURRENCY, SUMMARY_CONTEXT_TOKENS, estimate_tokens, map_reduce
+from .search import Article, NewsCache, format_articles, news_cache, topic_key
+
+# "direct" fetches the news itself; "agent" lets the search agent call the tool.
+NEWS_PIPELINE = os.getenv("NEWS_PIPELINE", "direct")
+# Articles fetched per topic in direct mode; more than fit one call are map-reduced.
+NEWS_ARTICLES = int(os.getenv("NEWS_ARTICLES", "3"))
+# Seconds a finished summary is handed to later requests for the same topic.
+NEWS_RESULT_TTL = float(os.getenv("NEWS_RESULT_TTL", "60"))
+NEWS_RESULT_CACHE_SIZE = int(os.getenv("NEWS_RESULT_CACHE_SIZE", "128"))
+
+
+@dataclass
+class SearchResult:
+    raw_news: str
+    articles: List[Article]
+    cached: bool
+    seconds: float
+    dedup: DedupReport = field(default_factory=DedupReport)
+
+
+@dataclass
+class NewsResult:
+    search: SearchResult
+    summary: str
+    summary_seconds: float
+    # Model calls the summary took, and levels of digests before the last one.
+    calls: int = 1
+    depth: int = 0
+
+
+@dataclass
+class CoalescingStats:
+    requests: int = 0
+    flights: int = 0
+    joined: int = 0
+    cached: int = 0
+    completed: int = 0
+    model_turns: int = 0
+
+    @property
+    def dedup_ratio(self) -> float:
+        return self.requests / self.flights if self.flights else 0.0
+
+    @property
+    def model_turns_saved(self) -> int:
+        if not self.completed:
+            return 0
+        return round((self.joined + self.cached) * self.model_turns / self.completed)
+
+    def describe(self) -> str:
+        return (
+            f"{self.requests} requests, {self.flights} pipelines run "
+            f"({self.joined} joined one in flight, {self.cached} from cache); "
+            f"dedup {self.dedup_ratio:.1f}x, {self.model_turns_saved} model turns saved"
+        )
+
+
+class _Flight:
+    """One running pipeline, and the requests waiting on it."""
+
+    def __init__(self, key: Tuple[str, str]):
+        loop = asyncio.get_running_loop()
+        self.key = key
+        self.runner_key = f"news:{key[0]}:{key[1]}"
+        self.search: asyncio.Future = loop.create_future()
+        self.result: asyncio.Future = loop.create_future()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        for future in (self.search, self.result):
+            # Everyone may have left before a failure lands; don't log it.
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def fail(self, error: BaseException):
+        for future in (self.search, self.result):
+            if not future.done():
+                future.set_exception(error)
+
+
+class Subscription:
+    """A request's view of the pipeline run for its topic.
+
+    Use as `async with pipeline.subscribe(topic, key) as news:` and await
+    `news.search()`, then `news.result()`. Leaving the block, or
+    `pipeline.cancel(key)`, drops this request; the run itself is only
+    stopped once no request is waiting on it.
+    """
+
+    def __init__(self, pipeline: "NewsPipeline", flight: _Flight, key: Optional[str], shared: bool):
+        self.pipeline = pipeline
+        self.flight = flight
+        self.key = key
+        # Joined a run started by another request, or got a cached result.
+        self.shared = shared
+        self._cancel = asyncio.Event()
+        self._closed = False
+
+    async def _wait(self, future: asyncio.Future):
+        if not future.done():
+            stop = asyncio.ensure_future(self._cancel.wait())
+            try:
+                await asyncio.wait({future, stop}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                stop.cancel()
+            if not future.done():
+                raise AgentCancelled("Stopped.")
+        return future.result()
+
+    async def search(self) -> SearchResult:
+        return await self._wait(self.flight.search)
+
+    async def result(self) -> NewsResult:
+        return await self._wait(self.flight.result)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.pipeline._leave(self)
+
+    async def __aenter__(self) -> "Subscription":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class NewsPipeline:
+    """Search for news on a topic, then have the summary agent synthesize it.
+
+    The search agent only ever calls `fetch_latest_news` with the topic it
+    was given, so in "direct" mode the pipeline calls the search itself and
+    skips that agent's model turns: one model call per request instead of
+    three. Results come from a TTL cache shared by both modes.
+
+    Articles are summarized with `map_reduce`: in one call when they fit
+    SUMMARY_CONTEXT_TOKENS, otherwise digested by `digest_agent` in
+    parallel groups first, so NEWS_ARTICLES can go well beyond three.
+
+    Requests for the same normalized topic share one run: a request made
+    while a run is in flight waits for it, and one made shortly after gets
+    its result from a cache kept for NEWS_RESULT_TTL seconds.
+    """
+
+    def __init__(self, runner, search_agent, summary_agent, digest_agent=None,
+                 cache: NewsCache = news_cache, mode: str = NEWS_PIPELINE,
+                 result_ttl: float = NEWS_RESULT_TTL, articles: int = NEWS_ARTICLES,
+                 budget: int = SUMMARY_CONTEXT_TOKENS, concurrency: int = MAP_CONCURRENCY):
+        if mode not in ("direct", "agent"):
+            raise ValueError(f"Unknown NEWS_PIPELINE mode: {mode!r}")
+        self.runner = runner
+        self.search_agent = search_agent
+        self.summary_agent = summary_agent
+        self.digest_agent = digest_agent or summary_agent
+        self.cache = cache
+        self.mode = mode
+        self.result_ttl = result_ttl
+        self.articles = articles
+        self.budget = budget
+        self.concurrency = concurrency
+        self.stats = CoalescingStats()
+        self._flights: Dict[Tuple[str, str], _Flight] = {}
+        self._results: "OrderedDict[Tuple[str, str], Tuple[float, NewsResult]]" = OrderedDict()
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+
+    async def search(self, topic: str, key: Optional[str] = None) -> SearchResult:
+        start = time.perf_counter()
+        if self.mode == "agent":
+            response = await self.runner.run(
+                self.search_agent,
+                [{"role": "user", "content": f"Find recent news about {topic}"}],
+                key=key,
+            )
+            raw_news = response.messages[-1]["content"]
+            return SearchResult(raw_news, [], False, time.perf_counter() - start)
+        articles, cached = await asyncio.to_thread(self.cache.lookup, topic, self.articles)
+        # Syndicated copies of one wire story would be summarized once per copy.
+        articles, dedup = dedupe(articles)
+        return SearchResult(
+            format_articles(articles, topic), articles, cached, time.perf_counter() - start, dedup
+        )
+
+    async def summarize(self, search: SearchResult, key: Optional[str] = None,
+                        previous: Optional[str] = None) -> NewsResult:
+        """Summarize the search's articles, or merge them into `previous`."""
+        async def call(text: str, final: bool) -> str:
+            if final and previous:
+                agent = self.summary_agent
+                prompt = (
+                    "Update this news synthesis with the new articles below. Keep what still "
+                    "holds, add the new developments and drop what they supersede.\n\n"
+                    f"Current synthesis:\n{previous}\n\nNew articles:\n{text}"
+                )
+            elif final:
+                agent = self.summary_agent
+                prompt = f"Synthesize these news articles and summarize the synthesis:\n{text}"
+            else:
+                agent = self.digest_agent
+                prompt = f"Condense this news material into a short factual digest:\n{text}"
+            response = await self.runner.run(agent, [{"role": "user", "content": prompt}], key=key)
+            return response.messages[-1]["content"]
+
+        start = time.perf_counter()
+        texts = [article.format() for article in search.articles] or [search.raw_news]
+        budget = self.budget
+        if previous:
+            # The current synthesis shares the final call's budget.
+            budget = max(budget - estimate_tokens(previous), budget // 4)
+        summary, stats = await map_reduce(texts, call, budget, self.concurrency)
+        return NewsResult(search, summary, time.perf_counter() - start, stats.calls, stats.depth)
+
+    def _cached_result(self, key: Tuple[str, str]) -> Optional[NewsResult]:
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= self.result_ttl:
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return entry[1]
+
+    def subscribe(self, topic: str, key: Optional[str] = None) -> Subscription:
+        """Start, join or reuse the run for `topic`; `key` identifies the caller."""
+        self.stats.requests += 1
+        flight_key = topic_key(topic)
+        cached = self._cached_result(flight_key)
+        if cached is not None:
+            self.stats.cached += 1
+            flight = _Flight(flight_key)
+            flight.search.set_result(cached.search)
+            flight.result.set_result(cached)
+            shared = True
+        elif flight_key in self._flights:
+            self.stats.joined += 1
+            flight = self._flights[flight_key]
+            shared = True
+        else:
+            self.stats.flights += 1
+            flight = self._flights[flight_key] = _Flight(flight_key)
+            flight.task = asyncio.ensure_future(self._fly(flight, topic))
+            shared = False
+        flight.subscribers += 1
+        subscription = Subscription(self, flight, key, shared)
+        if key is not None:
+            self._subscriptions.setdefault(key, set()).add(subscription)
+        return subscription
+
+    async def _fly(self, flight: _Flight, topic: str):
+        try:
+            search = await self.search(topic, key=flight.runner_key)
+            flight.search.set_result(search)
+            result = await self.summarize(search, key=flight.runner_key)
+            self.stats.completed += 1
+            self.stats.model_turns += result.calls + (2 if self.mode == "agent" else 0)
+            self._results[flight.key] = (time.monotonic(), result)
+            self._results.move_to_end(flight.key)
+            while len(self._results) > NEWS_RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+            flight.result.set_result(result)
+        except asyncio.CancelledError:
+            flight.fail(AgentCancelled("Stopped."))
+        except Exception as e:
+            flight.fail(e)
+        finally:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def _leave(self, subscription: Subscription):
+        flight = subscription.flight
+        flight.subscribers -= 1
+        if subscription.key is not None:
+            subscriptions = self._subscriptions.get(subscription.key, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.key, None)
+        if flight.subscribers == 0 and flight.task is not None and not flight.task.done():
+            # Later requests start afresh rather than join a run being stopped.
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            flight.task.cancel()
+
+    def cancel(self, key: str):
+        """Stop waiting on behalf of `key`; runs nobody else waits on stop too."""
+        for subscription in list(self._subscriptions.get(key, ())):
+            subscription.cancel()
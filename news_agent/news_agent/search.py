@@ -0,0 +1,98 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from .dedup import dedupe
+
+# How long search results are reused for the same topic.
+NEWS_CACHE_TTL = float(os.getenv("NEWS_CACHE_TTL", "600"))
+NEWS_CACHE_SIZE = int(os.getenv("NEWS_CACHE_SIZE", "256"))
+MAX_RESULTS = 3
+
+
+@dataclass(frozen=True)
+class Article:
+    title: str
+    url: str
+    body: str
+
+    def format(self) -> str:
+        return f"Title: {self.title}\nURL: {self.url}\nSummary: {self.body}"
+
+
+def normalize_topic(topic: str) -> str:
+    """Case, spacing and punctuation don't change what a search finds."""
+    return " ".join(re.sub(r"[^\w\s]+", " ", topic.lower()).split())
+
+
+def _month() -> str:
+    return datetime.now().strftime("%Y-%m")
+
+
+def topic_key(topic: str) -> Tuple[str, str]:
+    """Requests with the same key search for, and get, the same news."""
+    return normalize_topic(topic), _month()
+
+
+def ddgs_search(topic: str, max_results: int) -> List[Article]:
+    """Search DuckDuckGo for this month's news on `topic`."""
+    from duckduckgo_search import DDGS
+
+    query = f"{topic} news {_month()}"
+    with DDGS() as search_engine:
+        results = search_engine.text(query, max_results=max_results) or []
+    return [Article(r["title"], r["href"], r["body"]) for r in results]
+
+
+class NewsCache:
+    """Search results per (normalized topic, month, result count), for `ttl` seconds."""
+
+    def __init__(self, search: Callable[[str, int], List[Article]] = ddgs_search,
+                 ttl: float = NEWS_CACHE_TTL, max_size: int = NEWS_CACHE_SIZE):
+        self.search = search
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str, int], Tuple[float, List[Article]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, topic: str, max_results: int = MAX_RESULTS) -> Tuple[List[Article], bool]:
+        """Articles on `topic`, and whether they came from the cache."""
+        key = (*topic_key(topic), max_results)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], True
+            self.misses += 1
+        articles = self.search(topic, max_results)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), articles)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return articles, False
+
+    def get(self, topic: str, max_results: int = MAX_RESULTS) -> List[Article]:
+        return self.lookup(topic, max_results)[0]
+
+
+news_cache = NewsCache()
+
+
+def format_articles(articles: List[Article], topic: Optional[str] = None) -> str:
+    if not articles:
+        return f"No news articles found on the topic: {topic}."
+    return "\n\n".join(article.format() for article in articles)
+
+
+def fetch_latest_news(topic):
+    """Retrieve the latest news articles related to a given topic using DuckDuckGo."""
+    return format_articles(dedupe(news_cache.get(topic))[0], topic)